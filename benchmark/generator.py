@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'input_schema.json')
+
+FIRST_ORDER_ID = 10001
+FIRST_DEPOT_ID = 30001
+FIRST_PICKUP_POINT_ID = 40001
+FIRST_DROPOFF_POINT_ID = 60001
+MAX_COURIERS = 10000
+MAX_ORDERS = 20000
+MAX_DEPOTS = 10000
+LAST_MINUTE = 1439
+
+# named sizes used by the benchmark, the last one is at the schema limits
+SIZES = {
+    'tiny': dict(num_couriers=5, num_orders=50, num_depots=2, city_size=100),
+    'small': dict(num_couriers=30, num_orders=600, num_depots=4, city_size=200),
+    'medium': dict(num_couriers=300, num_orders=7000, num_depots=12, city_size=400),
+    'large': dict(num_couriers=2000, num_orders=20000, num_depots=50, city_size=800),
+    'max': dict(num_couriers=MAX_COURIERS, num_orders=MAX_ORDERS, num_depots=100, city_size=1000),
+}
+
+
+def generate_instance(num_couriers, num_orders, num_depots=0, city_size=400, num_clusters=8, clustered_share=0.7,
+                      cluster_spread=0.05, pickup_window=240, dropoff_window=180, seed=0):
+    """
+    Random input in the format of example/input_schema.json.
+
+    A clustered_share of all points (couriers, depots and both ends of orders) is drawn around num_clusters
+    centres with a standard deviation of cluster_spread * city_size, the rest is uniform over the city.
+    pickup_window and dropoff_window are the longest time windows in minutes: windows are drawn between
+    20% and 100% of them, so smaller values give tighter instances.
+    """
+    if not 0 < num_couriers <= MAX_COURIERS or not 0 <= num_orders <= MAX_ORDERS or not 0 <= num_depots <= MAX_DEPOTS:
+        raise ValueError('Instance size is out of the schema limits')
+
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(0, city_size, size=(max(num_clusters, 1), 2))
+
+    def locations(count):
+        points = rng.uniform(0, city_size, size=(count, 2))
+        clustered = rng.random(count) < (clustered_share if num_clusters else 0)
+        cluster = rng.integers(0, len(centres), size=count)
+        points[clustered] = rng.normal(centres[cluster[clustered]], cluster_spread * city_size)
+        return np.clip(np.rint(points), 0, city_size).astype(np.int64)
+
+    courier_locations = locations(num_couriers)
+    depot_locations = locations(num_depots)
+    pickups = locations(num_orders)
+    dropoffs = locations(num_orders)
+    trip = 10 + np.abs(pickups - dropoffs).sum(axis=1)
+
+    pickup_from = rng.integers(360, 1081, size=num_orders)
+    pickup_to = np.minimum(pickup_from + np.rint(rng.uniform(0.2, 1.0, num_orders) * pickup_window), LAST_MINUTE)
+    # the dropoff window opens around the time a courier that picked up at pickup_from arrives
+    dropoff_from = np.minimum(pickup_from + np.rint(trip * rng.uniform(0.8, 1.5, num_orders)), LAST_MINUTE)
+    dropoff_to = np.minimum(dropoff_from + np.rint(rng.uniform(0.2, 1.0, num_orders) * dropoff_window), LAST_MINUTE)
+    payment = np.rint(trip * rng.uniform(2, 4, num_orders))
+
+    return {
+        'couriers': [{'courier_id': idx + 1, 'location_x': int(x), 'location_y': int(y)}
+                     for idx, (x, y) in enumerate(courier_locations.tolist())],
+        'depots': [{'point_id': FIRST_DEPOT_ID + idx, 'location_x': int(x), 'location_y': int(y)}
+                   for idx, (x, y) in enumerate(depot_locations.tolist())],
+        'orders': [{
+            'order_id': FIRST_ORDER_ID + idx,
+            'pickup_point_id': FIRST_PICKUP_POINT_ID + idx,
+            'pickup_location_x': int(pickups[idx, 0]),
+            'pickup_location_y': int(pickups[idx, 1]),
+            'pickup_from': int(pickup_from[idx]),
+            'pickup_to': int(pickup_to[idx]),
+            'dropoff_point_id': FIRST_DROPOFF_POINT_ID + idx,
+            'dropoff_location_x': int(dropoffs[idx, 0]),
+            'dropoff_location_y': int(dropoffs[idx, 1]),
+            'dropoff_from': int(dropoff_from[idx]),
+            'dropoff_to': int(dropoff_to[idx]),
+            'payment': int(payment[idx]),
+        } for idx in range(num_orders)],
+    }
+
+
+def validate_instance(instance, schema_path=SCHEMA_PATH):
+    """Checks required keys, integer types and bounds of example/input_schema.json, raises ValueError."""
+    with open(schema_path) as f:
+        schema = json.load(f)
+    _validate(instance, schema, 'input')
+
+
+def _validate(value, schema, path):
+    kind = schema.get('type')
+    if kind == 'object':
+        if not isinstance(value, dict):
+            raise ValueError('{} is not an object'.format(path))
+        for key in schema.get('required', []):
+            if key not in value:
+                raise ValueError('{} misses {}'.format(path, key))
+        for key, item_schema in schema.get('properties', {}).items():
+            if key in value:
+                _validate(value[key], item_schema, '{}.{}'.format(path, key))
+    elif kind == 'array':
+        if not isinstance(value, list):
+            raise ValueError('{} is not an array'.format(path))
+        for idx, item in enumerate(value):
+            _validate(item, schema.get('items', {}), '{}[{}]'.format(path, idx))
+    elif kind == 'integer':
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError('{} is not an integer'.format(path))
+        if value < schema.get('minimum', value) or value > schema.get('maximum', value):
+            raise ValueError('{} = {} is out of bounds'.format(path, value))
+
+
+def write_instance(path, **params):
+    instance = generate_instance(**params)
+    validate_instance(instance)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as outfile:
+        json.dump(instance, outfile)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a random input file')
+    parser.add_argument('output')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--clusters', type=int, default=8)
+    parser.add_argument('--clustered-share', type=float, default=0.7)
+    parser.add_argument('--pickup-window', type=int, default=240)
+    parser.add_argument('--dropoff-window', type=int, default=180)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_instance(args.output, num_clusters=args.clusters, clustered_share=args.clustered_share,
+                   pickup_window=args.pickup_window, dropoff_window=args.dropoff_window, seed=args.seed,
+                   **SIZES[args.size])
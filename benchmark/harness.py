@@ -0,0 +1,179 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmark.generator import SIZES, write_instance
+from solutions import core
+from solutions.bounds import gap, instance_bound
+from solutions.instrumentation import Instrumentation
+from solutions.preprocessing import reduce_instance
+from src.check import check_fast
+
+# benchmark names of solvers run with options -> (name in solutions.core.SOLVERS, options)
+VARIANTS = {
+    'GreedyByUserBundling': ('GreedyByUser', {'bundling': True}),
+}
+SOLVERS = tuple(core.SOLVERS) + tuple(VARIANTS)
+RESULT_FIELDS = ('instance', 'solver', 'status', 'seconds', 'peak_memory_mb', 'profit', 'completed', 'unassigned',
+                 'bound', 'gap')
+
+
+def make_solver(name, data_path, instrumentation=None):
+    solver, options = VARIANTS.get(name, (name, {}))
+    return core.solver_class(solver)(data_path, instrumentation=instrumentation, **options)
+
+
+def _peak_rss():
+    """
+    Largest resident set of this process in bytes. ru_maxrss survives exec, so a spawned process would report
+    the peak of the benchmark that forked it; VmHWM belongs to the new address space.
+    """
+    with contextlib.suppress(OSError):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    # kilobytes on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _run_solver(name, data_path, plan_path, connection, report_prefix=None, reduce=False):
+    """
+    Child process: builds and runs the solver, the plan goes to plan_path. Peak memory is the largest resident
+    set of the process (interpreter and imports included), so the timed run is not slowed down by tracing
+    allocations and C-level buffers count as much as Python objects. With report_prefix
+    the solver is instrumented and profiled, <report_prefix>.json gets the report and .pstats the profile.
+    With reduce the solver runs on the instance reduced by solutions.preprocessing, reducing is timed too.
+    """
+    try:
+        instrumentation = Instrumentation() if report_prefix else None
+        profiling = instrumentation.profile(report_prefix + '.pstats') if report_prefix else contextlib.nullcontext()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), profiling:
+            if reduce:
+                reduction = reduce_instance(data_path)
+                reduced_path = os.path.join(os.path.dirname(plan_path), 'reduced.json')
+                reduction.write(reduced_path)
+                plan = reduction.restore(make_solver(name, reduced_path, instrumentation).solve())
+            else:
+                plan = make_solver(name, data_path, instrumentation).solve()
+        seconds = time.perf_counter() - started
+        if instrumentation is not None:
+            instrumentation.write_report(report_prefix + '.json')
+        peak = _peak_rss()
+
+        with open(plan_path, 'w') as outfile:
+            json.dump(plan, outfile)
+        connection.send(('ok', seconds, peak))
+    except Exception as e:
+        connection.send(('error: {}'.format(e), None, None))
+
+
+def benchmark_solver(name, data_path, time_limit=None, report_dir=None, reduce=False, bound=None):
+    """
+    Runs one solver on one instance in a separate process and validates the plan with the checker.
+    Wall time covers loading and solving. The process is spawned rather than forked, so the peak memory of
+    every solver starts from the same fresh interpreter and not from whatever the benchmark holds.
+    With report_dir the run is instrumented and profiled into <instance>.<solver>.json / .pstats there, which
+    slows it down. With reduce the solver starts from the reduced instance (see _run_solver). With the upper
+    bound of the profit on the instance (solutions.bounds), the row gets it and the gap of the plan to it.
+    """
+    row = dict.fromkeys(RESULT_FIELDS)
+    row.update(instance=os.path.basename(data_path), solver=name)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        plan_path = os.path.join(tmp_dir, 'plan.json')
+        context = multiprocessing.get_context('spawn')
+        receiver, sender = context.Pipe(duplex=False)
+        report_prefix = None
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+            report_prefix = os.path.join(report_dir, '{}.{}'.format(os.path.basename(data_path), name))
+        process = context.Process(target=_run_solver, args=(name, data_path, plan_path, sender, report_prefix,
+                                                            reduce))
+        process.start()
+        if not receiver.poll(time_limit):
+            process.terminate()
+            process.join()
+            row['status'] = 'timeout'
+            return row
+        status, seconds, peak = receiver.recv()
+        process.join()
+
+        row['status'] = status
+        if status != 'ok':
+            return row
+        row['seconds'] = round(seconds, 3)
+        row['peak_memory_mb'] = round(peak / 2 ** 20, 1)
+        try:
+            summary = check_fast(data_path, plan_path)
+        except Exception as e:
+            row['status'] = 'invalid: {}'.format(e)
+            return row
+    row.update(profit=summary['profit'], completed=summary['completed'], unassigned=summary['unassigned'])
+    if bound is not None:
+        row.update(bound=bound, gap=round(gap(summary['profit'], bound), 4))
+    return row
+
+
+def run_benchmark(instance_paths, solvers=SOLVERS, time_limit=None, report_dir=None, reduce=False):
+    rows = []
+    for path in instance_paths:
+        bound = instance_bound(path).bound
+        rows.extend(benchmark_solver(name, path, time_limit, report_dir, reduce, bound) for name in solvers)
+    return rows
+
+
+def format_table(rows):
+    cells = [[str(x) for x in RESULT_FIELDS]] + [['' if row[x] is None else str(row[x]) for x in RESULT_FIELDS]
+                                                 for row in rows]
+    widths = [max(len(line[idx]) for line in cells) for idx in range(len(RESULT_FIELDS))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(line, widths)) for line in cells)
+
+
+def write_results(rows, path):
+    with open(path, 'w', newline='') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the solvers on generated instances')
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['tiny', 'small'])
+    parser.add_argument('--solvers', nargs='+', choices=SOLVERS, default=list(SOLVERS))
+    parser.add_argument('--instances', nargs='*', default=[], help='extra input files to benchmark')
+    parser.add_argument('--instances-dir', default='benchmark/instances')
+    parser.add_argument('--clusters', type=int, default=8)
+    parser.add_argument('--pickup-window', type=int, default=240)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--time-limit', type=float, default=600, help='seconds per solver run')
+    parser.add_argument('--output', default='benchmark/results.csv')
+    parser.add_argument('--report-dir', help='instrument and profile every run, JSON reports and pstats go here')
+    parser.add_argument('--reduce', action='store_true',
+                        help='run the solvers on the instances reduced by solutions.preprocessing')
+    args = parser.parse_args()
+
+    paths = []
+    for size in args.sizes:
+        path = os.path.join(args.instances_dir, '{}_c{}_w{}_s{}.json'.format(size, args.clusters, args.pickup_window,
+                                                                           args.seed))
+        if not os.path.exists(path):
+            write_instance(path, num_clusters=args.clusters, pickup_window=args.pickup_window, seed=args.seed,
+                           **SIZES[size])
+        paths.append(path)
+
+    if args.reduce:
+        for path in paths + args.instances:
+            print('{}:\n{}'.format(os.path.basename(path), reduce_instance(path).format_report()))
+    results = run_benchmark(paths + args.instances, args.solvers, args.time_limit, args.report_dir, args.reduce)
+    write_results(results, args.output)
+    print(format_table(results))
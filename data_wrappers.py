@@ -1,6 +1,20 @@
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
 INITIAL_TIME_CONSTANT = 360
 
+# bump when the layout of the cached arrays changes
+INSTANCE_CACHE_VERSION = 1
+
+Instance = namedtuple('Instance', ['couriers', 'depots', 'orders'])
+
+
 class Courier:
+    __slots__ = ('id', 'location_x', 'location_y', '_current_time')
+
     def __init__(self, data):
         self.id = data['courier_id']
         self.location_x = data['location_x']
@@ -19,6 +33,10 @@ class Courier:
 
 
 class Order:
+    __slots__ = ('order_id', 'pickup_point_id', 'pickup_location_x', 'pickup_location_y', 'pickup_from',
+                 'pickup_to', 'dropoff_point_id', 'dropoff_location_x', 'dropoff_location_y', 'dropoff_from',
+                 'dropoff_to', 'payment')
+
     def __init__(self, data):
         self.order_id = data['order_id']
         self.pickup_point_id = data['pickup_point_id']
@@ -31,4 +49,175 @@ class Order:
         self.dropoff_location_y = data['dropoff_location_y']
         self.dropoff_from = data['dropoff_from']
         self.dropoff_to = data['dropoff_to']
-        self.payment = data['payment']
\ No newline at end of file
+        self.payment = data['payment']
+
+
+class OrderTable:
+    """Orders stored column-wise in NumPy arrays, row order follows the input order list."""
+
+    # (column, Order attribute) pairs, every column is an int64 array with a row per order
+    FIELDS = (
+        ('order_ids', 'order_id'),
+        ('pickup_point_ids', 'pickup_point_id'),
+        ('pickup_x', 'pickup_location_x'),
+        ('pickup_y', 'pickup_location_y'),
+        ('pickup_from', 'pickup_from'),
+        ('pickup_to', 'pickup_to'),
+        ('dropoff_point_ids', 'dropoff_point_id'),
+        ('dropoff_x', 'dropoff_location_x'),
+        ('dropoff_y', 'dropoff_location_y'),
+        ('dropoff_from', 'dropoff_from'),
+        ('dropoff_to', 'dropoff_to'),
+        ('payment', 'payment'),
+    )
+    COLUMNS = tuple(column for column, _ in FIELDS)
+
+    def __init__(self, orders):
+        orders = list(orders)
+        self._set_columns({column: np.array([getattr(o, field) for o in orders], dtype=np.int64)
+                           for column, field in self.FIELDS})
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Table over already built column arrays (e.g. views of shared memory), the arrays are not copied."""
+        table = cls.__new__(cls)
+        table._set_columns(columns)
+        return table
+
+    def columns(self):
+        return {column: getattr(self, column) for column in self.COLUMNS}
+
+    def to_orders(self):
+        """Order objects for every row, in row order."""
+        fields = [field for _, field in self.FIELDS]
+        matrix = np.stack([getattr(self, column) for column in self.COLUMNS]) if len(self) else np.empty((0, 0))
+        return [Order(dict(zip(fields, values))) for values in matrix.T.tolist()]
+
+    def _set_columns(self, columns):
+        for column in self.COLUMNS:
+            setattr(self, column, columns[column])
+
+        # travel time from pickup to dropoff of the same order, it never changes
+        self.trip = 10 + np.abs(self.pickup_x - self.dropoff_x) + np.abs(self.pickup_y - self.dropoff_y)
+
+        self.alive = np.ones(len(self.order_ids), dtype=bool)
+        self._rows = None
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    def row_of(self, order_id):
+        if self._rows is None:
+            self._rows = {order_id: idx for idx, order_id in enumerate(self.order_ids.tolist())}
+        return self._rows[order_id]
+
+    def remove(self, order_id):
+        self.alive[self.row_of(order_id)] = False
+
+    def revenues(self, x, y, current_time, rows=slice(None), strict_dropoff=False):
+        """
+        Revenue of a courier standing at (x, y) at current_time from completing each order,
+        -inf for infeasible or already removed orders. If rows is given, only those rows are scored.
+        strict_dropoff reproduces GreedyByUser, where arriving exactly at dropoff_to is a miss.
+        """
+        dropoff_at = self.dropoff_times(x, y, current_time, rows, strict_dropoff)
+        revenue = (self.payment[rows] - 2 * (dropoff_at - current_time)).astype(np.float64)
+        revenue[dropoff_at < 0] = -np.inf
+        revenue[~self.alive[rows]] = -np.inf
+        return revenue
+
+    def revenues_block(self, xs, ys, current_times, rows=slice(None), strict_dropoff=False):
+        """Same as revenues, but for a block of couriers at once: result is couriers x orders (or x rows)."""
+        xs = np.asarray(xs, dtype=np.int64)[:, None]
+        ys = np.asarray(ys, dtype=np.int64)[:, None]
+        current_times = np.asarray(current_times, dtype=np.int64)[:, None]
+        dropoff_at = self.dropoff_times(xs, ys, current_times, rows, strict_dropoff)
+        revenue = (self.payment[rows][None, :] - 2 * (dropoff_at - current_times)).astype(np.float64)
+        revenue[dropoff_at < 0] = -np.inf
+        revenue[:, ~self.alive[rows]] = -np.inf
+        return revenue
+
+    def dropoff_times(self, x, y, current_time, rows=slice(None), strict_dropoff=False):
+        """Time when each order is dropped off if the courier takes it right now, -1 where infeasible."""
+        pickup_to = self.pickup_to[rows]
+        dropoff_to = self.dropoff_to[rows]
+
+        picks_up_at = current_time + 10 + np.abs(x - self.pickup_x[rows]) + np.abs(y - self.pickup_y[rows])
+        feasible = picks_up_at <= pickup_to
+        picks_up_at = np.maximum(picks_up_at, self.pickup_from[rows])
+
+        drops_off_at = picks_up_at + self.trip[rows]
+        if strict_dropoff:
+            feasible &= drops_off_at < dropoff_to
+        else:
+            feasible &= drops_off_at <= dropoff_to
+        drops_off_at = np.maximum(drops_off_at, self.dropoff_from[rows])
+        return np.where(feasible, drops_off_at, -1)
+
+
+def new_couriers(courier_columns):
+    """Fresh Courier objects at their start locations from the (courier_id, x, y) rows of an Instance."""
+    return [Courier({'courier_id': courier_id, 'location_x': x, 'location_y': y})
+            for courier_id, x, y in courier_columns.tolist()]
+
+
+def load_instance(data_path, use_cache=True):
+    """
+    Couriers, depots and orders of an input file, couriers and depots as (id, x, y) int arrays.
+
+    The parsed arrays are saved as .npy files into <data_path>.cache/ and memory-mapped on later loads
+    for as long as the size and mtime of the input file match the ones recorded in the cache.
+    """
+    cache_dir = data_path + '.cache'
+    stat = os.stat(data_path)
+    source = {'version': INSTANCE_CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    if use_cache:
+        try:
+            with open(os.path.join(cache_dir, 'source.json')) as f:
+                cached_source = json.load(f)
+        except (OSError, ValueError):
+            cached_source = None
+        if cached_source == source:
+            return _load_cached_instance(cache_dir)
+
+    with open(data_path) as f:
+        data = json.loads(f.read())
+
+    couriers = np.array([[x['courier_id'], x['location_x'], x['location_y']] for x in data['couriers']],
+                        dtype=np.int64).reshape(-1, 3)
+    depots = np.array([[x['point_id'], x['location_x'], x['location_y']] for x in data['depots']],
+                      dtype=np.int64).reshape(-1, 3)
+    orders = np.array([[x[field] for _, field in OrderTable.FIELDS] for x in data['orders']],
+                      dtype=np.int64).reshape(-1, len(OrderTable.FIELDS)).T
+    instance = Instance(couriers, depots, OrderTable.from_columns(dict(zip(OrderTable.COLUMNS, orders))))
+
+    if use_cache:
+        try:
+            _save_instance_cache(cache_dir, instance, source)
+        except OSError:
+            # read-only location, the instance is just parsed again next time
+            pass
+    return instance
+
+
+def _save_instance_cache(cache_dir, instance, source):
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(os.path.join(cache_dir, 'source.json')):
+        os.remove(os.path.join(cache_dir, 'source.json'))
+    np.save(os.path.join(cache_dir, 'couriers.npy'), instance.couriers)
+    np.save(os.path.join(cache_dir, 'depots.npy'), instance.depots)
+    np.save(os.path.join(cache_dir, 'orders.npy'),
+            np.stack([getattr(instance.orders, column) for column in OrderTable.COLUMNS]))
+    # written last, so a cache interrupted halfway is never picked up
+    with open(os.path.join(cache_dir, 'source.json'), 'w') as f:
+        json.dump(source, f)
+
+
+def _load_cached_instance(cache_dir):
+    # plain ndarray views of the mappings: slicing a np.memmap wraps every result in a new memmap object,
+    # which dominates the small lookups of the solvers
+    couriers = np.asarray(np.load(os.path.join(cache_dir, 'couriers.npy'), mmap_mode='r'))
+    depots = np.asarray(np.load(os.path.join(cache_dir, 'depots.npy'), mmap_mode='r'))
+    orders = np.asarray(np.load(os.path.join(cache_dir, 'orders.npy'), mmap_mode='r'))
+    return Instance(couriers, depots, OrderTable.from_columns(dict(zip(OrderTable.COLUMNS, orders))))
@@ -0,0 +1,3 @@
+from solutions.core import main
+
+main()
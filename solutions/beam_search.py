@@ -0,0 +1,173 @@
+import json
+import random
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from data_wrappers import load_instance, new_couriers
+from solutions import core
+from solutions.instrumentation import (CANDIDATES_PRUNED, DISABLED, EMIT, LOAD, ORDERS_ASSIGNED,
+                                       REVENUE_EVALUATIONS, SCORE, SELECT)
+from solutions.spatial_index import PickupGrid
+
+# immutable courier state: where the courier stands and when it is free there
+CourierState = namedtuple('CourierState', ['x', 'y', 'time'])
+# feasible orders from a state, best revenue first; rows may be taken later, lookups skip dead rows
+Successors = namedtuple('Successors', ['rows', 'revenues', 'dropoff_times'])
+
+
+class BeamSearchGreedy:
+    """
+    Courier by courier greedy with a lookahead of depth orders.
+
+    From the current state of a courier a beam of the beam_width most profitable partial routes is grown
+    depth orders deep, every route is extended by the beam_width best orders of its last state. The first
+    order of the most profitable partial route is taken and the search is repeated from its dropoff.
+    Successor lists are memoized per state: a state after an order is its dropoff point and arrival time,
+    so routes sharing a prefix, and the next step of the same courier, reuse them. One step costs
+    O(beam_width * depth) successor lookups plus a grid query for every state seen for the first time.
+    """
+
+    def __init__(self, data_path, depth=3, beam_width=4, instrumentation=None):
+        self._stats = instrumentation or DISABLED
+        with self._stats.phase(LOAD):
+            instance = load_instance(data_path)
+
+            self._couriers = new_couriers(instance.couriers)
+            random.shuffle(self._couriers)
+
+            self._orders_table = instance.orders
+            self._pickup_index = PickupGrid(self._orders_table)
+        self._depth = depth
+        self._beam_width = beam_width
+        self._successors = {}
+        # time spent in successor lookups of the current courier, summed only when instrumented
+        self._score_seconds = 0
+        self.total_revenue = 0
+
+    def solve(self):
+        answer = []
+        stats = self._stats
+        for idx, courier in enumerate(self._couriers):
+            sampled = stats.sampled()
+            started = time.perf_counter() if sampled else 0
+            orders = self._find_courier_path(courier)
+            if sampled:
+                stats.observe('courier', time.perf_counter() - started)
+            answer.extend(orders)
+            stats.progress('courier', couriers_done=idx + 1, couriers=len(self._couriers), events=len(answer))
+        stats.progress('solved', force=True, orders_completed=len(answer) // 2)
+        return answer
+
+    def _find_courier_path(self, courier):
+        table = self._orders_table
+        # states of one courier are never reached by another one, the memo only lives for a courier
+        self._successors = {}
+        state = CourierState(courier.location_x, courier.location_y, courier.get_current_time())
+        enabled = self._stats.enabled
+        step_seconds = emit_seconds = 0
+        answer = []
+
+        while True:
+            if enabled:
+                started = time.perf_counter()
+            step = self._best_first_step(state)
+            if enabled:
+                step_seconds += time.perf_counter() - started
+            if step is None:
+                break
+            row, revenue, state = step
+
+            order_id = int(table.order_ids[row])
+            table.remove(order_id)
+            self._pickup_index.remove(order_id)
+            self.total_revenue += revenue
+
+            if enabled:
+                emitted = time.perf_counter()
+            answer.extend(core.order_events(courier.id, order_id, int(table.pickup_point_ids[row]),
+                                            int(table.dropoff_point_ids[row])))
+            if enabled:
+                emit_seconds += time.perf_counter() - emitted
+
+        courier.update_current_pos(state.x, state.y)
+        courier.update_current_time(state.time)
+        if enabled:
+            stats = self._stats
+            # successor lookups are scoring, the rest of the beam search is selecting
+            stats.add_time(SELECT, step_seconds - self._score_seconds)
+            stats.add_time(SCORE, self._score_seconds)
+            stats.add_time(EMIT, emit_seconds)
+            stats.count(ORDERS_ASSIGNED, len(answer) // 2)
+            self._score_seconds = 0
+        return answer
+
+    def _best_first_step(self, state):
+        """(row, revenue, next state) of the first order of the best partial route, None if no route pays off."""
+        # beam entries are (route revenue, state, rows of the route, (row, revenue, state) of its first order)
+        beam = [(0, state, (), None)]
+        best_revenue, best_step = 0, None
+
+        for _ in range(self._depth):
+            extended = []
+            for route_revenue, route_state, route, first_step in beam:
+                for row, revenue, next_state in self._next_orders(route_state, route):
+                    step = first_step or (row, revenue, next_state)
+                    extended.append((route_revenue + revenue, next_state, route + (row,), step))
+            if not extended:
+                break
+
+            extended.sort(key=lambda entry: -entry[0])
+            beam = extended[:self._beam_width]
+            if beam[0][0] > best_revenue:
+                best_revenue, best_step = beam[0][0], beam[0][3]
+
+        return best_step
+
+    def _next_orders(self, state, route):
+        """The beam_width most profitable orders from state that are still free and not on the route yet."""
+        successors = self._successors.get(state)
+        if successors is None:
+            successors = self._successors[state] = self._find_successors(state)
+
+        alive = self._orders_table.alive
+        table = self._orders_table
+        found = []
+        for row, revenue, dropoff_time in zip(*successors):
+            if not alive[row] or row in route:
+                continue
+            found.append((row, revenue, CourierState(int(table.dropoff_x[row]), int(table.dropoff_y[row]),
+                                                     dropoff_time)))
+            if len(found) == self._beam_width:
+                break
+        return found
+
+    def _find_successors(self, state):
+        enabled = self._stats.enabled
+        if enabled:
+            started = time.perf_counter()
+        table = self._orders_table
+        rows = self._pickup_index.query(state.x, state.y, state.time)
+        dropoff_times = table.dropoff_times(state.x, state.y, state.time, rows=rows)
+        feasible = dropoff_times >= 0
+        if enabled:
+            self._stats.count(REVENUE_EVALUATIONS, len(rows))
+            self._stats.count(CANDIDATES_PRUNED, len(rows) - int(np.count_nonzero(feasible)))
+        rows, dropoff_times = rows[feasible], dropoff_times[feasible]
+        revenues = table.payment[rows] - 2 * (dropoff_times - state.time)
+
+        best_first = (-revenues).argsort(kind='stable')
+        successors = Successors(rows[best_first].tolist(), revenues[best_first].tolist(),
+                                dropoff_times[best_first].tolist())
+        if enabled:
+            self._score_seconds += time.perf_counter() - started
+        return successors
+
+
+if __name__ == '__main__':
+    solver = BeamSearchGreedy('../example/contest_input.json')
+    plan = solver.solve()
+    print('Num total orders completed {}'.format(len(plan) // 2))
+    with open('../example/contest_output_beam_search.json', 'w') as outfile:
+        json.dump(plan, outfile)
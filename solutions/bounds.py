@@ -0,0 +1,130 @@
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, load_instance
+
+ProfitBound = namedtuple('ProfitBound', ['bound', 'order_bound', 'capacity_bound', 'orders'])
+
+# no stop is visited after this, depots close then and order windows end before it
+_DAY_END = 1439
+_UNREACHABLE = 1 << 40
+
+
+def _visit_windows(table, courier_columns):
+    """
+    Earliest and latest possible visit times of the pickup and dropoff points of every order. A courier is
+    nowhere before 370 plus the distance from the nearest start point, and visits never happen after the later
+    end of a window: the checker lets early couriers wait for the window to open and never calls them late.
+    """
+    nearest = np.full(len(table), _UNREACHABLE, dtype=np.int64)
+    # couriers a block at a time to bound the couriers x orders matrix
+    for begin in range(0, len(courier_columns), 256):
+        block = courier_columns[begin:begin + 256]
+        nearest = np.minimum(nearest, (np.abs(block[:, 1, None] - table.pickup_x) +
+                                       np.abs(block[:, 2, None] - table.pickup_y)).min(axis=0, initial=_UNREACHABLE))
+    pickup_earliest = np.maximum(INITIAL_TIME_CONSTANT + 10 + nearest, table.pickup_from)
+    dropoff_earliest = np.maximum(pickup_earliest + table.trip, table.dropoff_from)
+    return (pickup_earliest, np.maximum(table.pickup_from, table.pickup_to), dropoff_earliest,
+            np.maximum(table.dropoff_from, table.dropoff_to))
+
+
+def stop_costs(table, courier_columns, depot_columns=None, radius=60):
+    """
+    Lower bounds on the minutes between the visit of every stop (the pickup points of all orders, then their
+    dropoff points) and the visit before it on the same route, whatever that visit is: a courier start, a stop
+    or a depot. From a visit q to a stop s they take at least the travel time and at least the wait from the
+    latest visit of q to the opening of the window of s, and q must be early enough to get to s in time.
+
+    Only the visits within radius along x are looked at, any other one takes more than 10 + radius minutes
+    to travel from, so 11 + radius bounds them all.
+    """
+    pickup_earliest, pickup_latest, dropoff_earliest, dropoff_latest = _visit_windows(table, courier_columns)
+    depot_columns = np.empty((0, 3), dtype=np.int64) if depot_columns is None else np.asarray(depot_columns)
+    num_stops = 2 * len(table)
+
+    stop_x = np.concatenate([table.pickup_x, table.dropoff_x])
+    stop_y = np.concatenate([table.pickup_y, table.dropoff_y])
+    stop_opens = np.concatenate([table.pickup_from, table.dropoff_from])
+    stop_latest = np.concatenate([pickup_latest, dropoff_latest])
+    # visits before a stop: the stops, the courier starts at the start of the day and the depots
+    x = np.concatenate([stop_x, courier_columns[:, 1], depot_columns[:, 1]])
+    y = np.concatenate([stop_y, courier_columns[:, 2], depot_columns[:, 2]])
+    earliest = np.concatenate([pickup_earliest, dropoff_earliest, np.full(len(courier_columns), INITIAL_TIME_CONSTANT),
+                               np.zeros(len(depot_columns), dtype=np.int64)])
+    latest = np.concatenate([stop_latest, np.full(len(courier_columns), INITIAL_TIME_CONSTANT),
+                             np.full(len(depot_columns), _DAY_END)])
+
+    by_x = np.argsort(x, kind='stable')
+    sorted_x = x[by_x]
+    costs = np.full(num_stops, _UNREACHABLE, dtype=np.int64)
+    stops = np.argsort(stop_x, kind='stable')
+    # stops a block at a time, sorted by x so that a block only looks at a narrow band of visits
+    for begin in range(0, num_stops, 256):
+        block = stops[begin:begin + 256]
+        lo, hi = np.searchsorted(sorted_x, [stop_x[block[0]] - radius, stop_x[block[-1]] + radius + 1])
+        before = by_x[lo:hi]
+        travel = 10 + np.abs(stop_x[block, None] - x[before]) + np.abs(stop_y[block, None] - y[before])
+        cost = np.maximum(travel, stop_opens[block, None] - latest[before])
+        cost[(earliest[before] + travel > stop_latest[block, None]) | (block[:, None] == before)] = _UNREACHABLE
+        costs[block] = np.minimum(cost.min(axis=1, initial=_UNREACHABLE), 11 + radius)
+    return costs
+
+
+def profit_upper_bound(table, courier_columns, depot_columns=None, radius=60):
+    """
+    ProfitBound of an instance: no plan has a larger profit than bound.
+
+    A route takes at least the sum of the stop_costs of its stops, and the wage covers all of it. So an order
+    adds at most its payment minus the wage of the stop_costs of its pickup and dropoff (more stops, as with
+    depot relays, only cost more), and order_bound sums that over the orders where it is positive. Every
+    courier works until at most the end of the last window, so together the orders fit into couriers times
+    that many minutes; capacity_bound is the LP relaxation of choosing orders by value under that budget,
+    a fractional knapsack. bound is the smaller one, orders the number of orders that could add anything.
+
+    On dense instances the bound is loose. A stop costs little more than the 10 minutes of a visit when other
+    stops are near it. Couriers can carry several orders at once, so the drive of an order from its pickup
+    to its dropoff point cannot be charged to it. The stop costs of all orders then fit into the couriers'
+    time easily, capacity_bound equals order_bound, and good plans stay far short of the bound (about 0.78
+    of it on the contest input). Per-courier horizons do not help: every courier reaches some order whose
+    window closes near the end of the day.
+    """
+    courier_columns = np.asarray(courier_columns)
+    pickup_earliest, pickup_latest, dropoff_earliest, dropoff_latest = _visit_windows(table, courier_columns)
+    # orders nobody gets to in time add nothing
+    alive = np.flatnonzero(table.alive & (pickup_earliest <= pickup_latest) & (dropoff_earliest <= dropoff_latest))
+    costs = stop_costs(table, courier_columns, depot_columns, radius)
+    order_costs = (costs[:len(table)] + costs[len(table):])[alive]
+    values = table.payment[alive] - 2 * order_costs
+    positive = values > 0
+    values, order_costs = values[positive], order_costs[positive]
+    order_bound = int(values.sum())
+
+    horizon = int(dropoff_latest[alive].max(initial=INITIAL_TIME_CONSTANT)) - INITIAL_TIME_CONSTANT
+    capacity = len(courier_columns) * max(horizon, 0)
+    by_ratio = np.argsort(-values / np.maximum(order_costs, 1), kind='stable')
+    used = np.cumsum(order_costs[by_ratio])
+    fits = int(np.searchsorted(used, capacity, side='right'))
+    capacity_bound = int(values[by_ratio[:fits]].sum())
+    if fits < len(by_ratio):
+        spare = capacity - (int(used[fits - 1]) if fits else 0)
+        capacity_bound += int(np.ceil(values[by_ratio[fits]] * spare / order_costs[by_ratio[fits]]))
+    return ProfitBound(min(order_bound, capacity_bound), order_bound, capacity_bound, int(np.count_nonzero(positive)))
+
+
+def instance_bound(data_path, radius=60):
+    instance = load_instance(data_path)
+    return profit_upper_bound(instance.orders, instance.couriers, instance.depots, radius)
+
+
+def gap(profit, bound):
+    """Share of the upper bound the profit falls short of, 0 once it is reached."""
+    if bound <= 0:
+        return 0.0
+    return max(bound - profit, 0) / bound
+
+
+if __name__ == '__main__':
+    result = instance_bound('../example/contest_input.json')
+    print(json.dumps(result._asdict()))
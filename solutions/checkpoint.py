@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+# bump when the record layout changes, logs of another version are started over
+CHECKPOINT_VERSION = 1
+
+
+class CheckpointLog:
+    """
+    Append-only JSON lines log of a round based solver run, one file per run instead of a dump per round.
+
+    The first line identifies the input file (path, size and mtime) and the solver settings. Every completed
+    round appends a line with its new events and the (courier_id, x, y, time) state of the couriers it moved,
+    a finished run appends a 'done' line. Lines are flushed as they are written and fsynced at most every
+    fsync_interval seconds and on close, so a killed run loses the rounds since the last fsync at worst;
+    load drops a torn last line.
+    """
+
+    def __init__(self, path, data_path, settings, fsync_interval=5.0):
+        stat = os.stat(data_path)
+        self._header = {'type': 'header', 'version': CHECKPOINT_VERSION, 'input': os.path.abspath(data_path),
+                        'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'settings': settings}
+        self._path = path
+        self._fsync_interval = fsync_interval
+        self._file = None
+        self._synced_at = time.perf_counter()
+        self.finished = False
+
+    def load(self):
+        """
+        Round records of a previous run with the same input and settings, oldest first, and opens the log for
+        appending after them. Any other log at the path is started over.
+        """
+        records, complete_size = [], 0
+        try:
+            with open(self._path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+                    complete_size += len(line)
+        except FileNotFoundError:
+            pass
+
+        if records and records[0] == self._header:
+            self._file = open(self._path, 'r+b')
+            self._file.truncate(complete_size)
+            self._file.seek(complete_size)
+            self.finished = any(record['type'] == 'done' for record in records)
+            return [record for record in records if record['type'] == 'round']
+
+        self._file = open(self._path, 'wb')
+        self._write(self._header)
+        self._sync()
+        return []
+
+    def append(self, events, couriers):
+        """Logs a completed round: its events and the (courier_id, x, y, time) of the couriers it moved."""
+        self._write({'type': 'round', 'events': events, 'couriers': [list(state) for state in couriers]})
+        if time.perf_counter() - self._synced_at >= self._fsync_interval:
+            self._sync()
+
+    def finish(self):
+        self._write({'type': 'done'})
+        self.finished = True
+        self._sync()
+
+    def close(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+        self._file.flush()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._synced_at = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,297 @@
+import argparse
+import contextlib
+import glob
+import importlib
+import inspect
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, Courier, Order, OrderTable, load_instance
+
+# solver name -> (module, class), every class takes the path of an input file and has solve()
+SOLVERS = {
+    'OneStepGreedy': ('solutions.simple_greedy', 'OneStepGreedy'),
+    'GreedyByUser': ('solutions.greedy_by_user', 'GreedyByUser'),
+    'GreedyByUserAtN': ('solutions.greedy_by_user_at_n', 'GreedyByUserAtN'),
+    'HungarianSearch': ('solutions.hungarian_search', 'HungarianSearch'),
+    'BeamSearchGreedy': ('solutions.beam_search', 'BeamSearchGreedy'),
+    'MinCostFlowSearch': ('solutions.flow_search', 'MinCostFlowSearch'),
+    'LocalSearch': ('solutions.local_search', 'LocalSearch'),
+    'DepotRelay': ('solutions.depot_relay', 'DepotRelay'),
+}
+
+InstanceResult = namedtuple('InstanceResult', ['instance', 'solver', 'status', 'profit', 'completed',
+                                               'load_seconds', 'solve_seconds', 'check_seconds'])
+
+# A run of consecutive orders is summed up as (earliest, duration, latest, start_x, start_y, end_x, end_y):
+# a courier that reaches (start_x, start_y) at time t <= latest completes the run at (end_x, end_y) at
+# max(t, earliest) + duration. Waiting for a window to open is folded into earliest, so two runs are joined
+# in constant time, see join_runs.
+EMPTY_RUN = ()
+
+
+def solver_class(name):
+    if name not in SOLVERS:
+        raise ValueError('Unknown solver: {}'.format(name))
+    module, cls = SOLVERS[name]
+    return getattr(importlib.import_module(module), cls)
+
+
+def time_when_picks_up(courier: Courier, order: Order):
+    """
+    Time the courier picks the order up going there right away, None if it is too late for it or the courier
+    has no time (GreedyByUserAtN simulates transitions from steps that failed).
+    """
+    if courier.get_current_time() is None or courier.get_current_time() > order.pickup_to:
+        return None
+    arrives_to_point_at = courier.get_current_time() + 10 + abs(courier.location_x - order.pickup_location_x) + abs(
+        courier.location_y - order.pickup_location_y)
+    if arrives_to_point_at > order.pickup_to:
+        return None
+    return max(arrives_to_point_at, order.pickup_from)
+
+
+def time_when_dropoffs_of(courier_actual_time: int, order: Order, strict_dropoff=False):
+    """
+    Time the order picked up at courier_actual_time is dropped off, None if it is late or there is no pickup
+    time. strict_dropoff reproduces GreedyByUser, where arriving exactly at dropoff_to is a miss.
+    """
+    if courier_actual_time is None or courier_actual_time > order.dropoff_to:
+        return None
+
+    arrives_to_point_at = courier_actual_time + 10 + abs(order.pickup_location_x - order.dropoff_location_x) + abs(
+        order.pickup_location_y - order.dropoff_location_y)
+
+    if arrives_to_point_at > order.dropoff_to or (strict_dropoff and arrives_to_point_at == order.dropoff_to):
+        return None
+    return max(arrives_to_point_at, order.dropoff_from)
+
+
+def revenue_from_completing_order(courier: Courier, order: Order, strict_dropoff=False):
+    """Payment of the order minus the wage of the time the courier takes it in, -inf if it can not."""
+    initial_time = courier.get_current_time()
+    arrives_to_pick_up_point = time_when_picks_up(courier, order)
+
+    if not arrives_to_pick_up_point:
+        return float('-inf')
+
+    arrives_to_dropoff_point = time_when_dropoffs_of(arrives_to_pick_up_point, order, strict_dropoff)
+    if not arrives_to_dropoff_point:
+        return float('-inf')
+
+    return order.payment - 2 * (arrives_to_dropoff_point - initial_time)
+
+
+def join_runs(first, second):
+    """Run of first followed by second, None if it is infeasible (or first is None)."""
+    if first is None:
+        return None
+    if second is EMPTY_RUN:
+        return first
+    if first is EMPTY_RUN:
+        return second
+    earliest, duration, latest, start_x, start_y, end_x, end_y = first
+    next_earliest, next_duration, next_latest, next_x, next_y, last_x, last_y = second
+    travel = duration + 10 + abs(end_x - next_x) + abs(end_y - next_y)
+    # the earliest possible arrival at the second run has to be within its latest start
+    if earliest + travel > next_latest:
+        return None
+    return (max(earliest, next_earliest - travel), travel + next_duration, min(latest, next_latest - travel),
+            start_x, start_y, last_x, last_y)
+
+
+def order_runs(table: OrderTable):
+    """Run of every single order from its pickup point to its dropoff point, None for impossible orders."""
+    feasible = table.pickup_from + table.trip <= table.dropoff_to
+    earliest = np.maximum(table.pickup_from, table.dropoff_from - table.trip)
+    latest = np.minimum(table.pickup_to, table.dropoff_to - table.trip)
+    columns = zip(feasible.tolist(), earliest.tolist(), table.trip.tolist(), latest.tolist(), table.pickup_x.tolist(),
+                  table.pickup_y.tolist(), table.dropoff_x.tolist(), table.dropoff_y.tolist())
+    return [run[1:] if run[0] else None for run in columns]
+
+
+def run_profit(run, paid):
+    """Profit of a whole route, run starts at the courier: payments minus the wage until the route ends."""
+    return paid - 2 * (run[0] + run[1] - INITIAL_TIME_CONSTANT)
+
+
+def plain_rows(table: OrderTable, runs, events):
+    """
+    Rows of the orders if events (of one courier) are pickup / dropoff pairs of one order at its own points,
+    else None: routes with depot visits or several orders on board are not runs of single orders.
+    """
+    rows = []
+    for pickup, dropoff in zip(events[::2], events[1::2]):
+        try:
+            row = table.row_of(pickup['order_id'])
+        except KeyError:
+            return None
+        if (pickup['action'] != 'pickup' or dropoff['action'] != 'dropoff' or
+                dropoff['order_id'] != pickup['order_id'] or
+                pickup['point_id'] != table.pickup_point_ids[row] or
+                dropoff['point_id'] != table.dropoff_point_ids[row] or runs[row] is None):
+            return None
+        rows.append(row)
+    if len(events) % 2 or len(set(rows)) != len(rows):
+        return None
+    return rows
+
+
+def write_instance(path, table: OrderTable, rows, courier_columns, depot_columns):
+    """Writes the orders of rows with the couriers and depots as an input file."""
+    orders = np.stack([getattr(table, column)[rows] for column in OrderTable.COLUMNS], axis=1).tolist()
+    instance = {
+        'couriers': [{'courier_id': courier_id, 'location_x': x, 'location_y': y}
+                     for courier_id, x, y in np.asarray(courier_columns).tolist()],
+        'depots': [{'point_id': point_id, 'location_x': x, 'location_y': y}
+                   for point_id, x, y in np.asarray(depot_columns).tolist()],
+        'orders': [{field: value for (_, field), value in zip(OrderTable.FIELDS, order)} for order in orders],
+    }
+    with open(path, 'w') as outfile:
+        json.dump(instance, outfile)
+
+
+def event(courier_id, action, order_id, point_id):
+    return {
+        'courier_id': courier_id,
+        'action': action,
+        'order_id': order_id,
+        'point_id': point_id
+    }
+
+
+def order_events(courier_id, order_id, pickup_point_id, dropoff_point_id):
+    """Pickup and dropoff events of a courier taking the order straight from its pickup to its dropoff point."""
+    return [event(courier_id, 'pickup', order_id, pickup_point_id),
+            event(courier_id, 'dropoff', order_id, dropoff_point_id)]
+
+
+def _run_solver(cls, data_path, options, seed, cache_dir=None, reduce=False):
+    """
+    Plan of the solver class on the input file, through a ResultCache in cache_dir if it is given. With reduce
+    the solver runs on the instance reduced by solutions.preprocessing and the plan is given the ids of the
+    input; the cache then keys it by the reduced instance.
+    """
+    from solutions.preprocessing import reduce_instance
+    from solutions.result_cache import ResultCache, cached_solve
+    if reduce:
+        reduction = reduce_instance(data_path)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reduced.json')
+            reduction.write(path)
+            return reduction.restore(_run_solver(cls, path, options, seed, cache_dir))
+    if cache_dir is None:
+        return cls(data_path, **options).solve()
+    return cached_solve(data_path, cls, options, ResultCache(cache_dir), salt={'seed': seed}).plan
+
+
+def solve_instance(data_path, solver='GreedyByUser', time_limit=None, seed=0, output_dir=None, cache_dir=None,
+                   reduce=False):
+    """
+    InstanceResult of the solver on one input file, the plan checked with check_plan (and written to
+    <output_dir>/<input name>.<solver>.json). time_limit and seed go to solvers that take them; the ones
+    that draw from the random module instead (GreedyByUser shuffles the couriers) get it seeded with seed, so
+    an instance is solved the same way whichever worker gets it and whatever it solved before.
+    With cache_dir, plans are taken from and stored in a ResultCache there. With reduce, the solver runs on
+    the instance reduced by solutions.preprocessing, the plan is checked against the input.
+    Files that are not input files (plans, schemas) get the status 'skipped'.
+    """
+    from src.check import check_plan
+    name = os.path.basename(data_path)
+    started = time.perf_counter()
+    try:
+        load_instance(data_path)
+    except (KeyError, TypeError, AttributeError, IndexError, ValueError):
+        return InstanceResult(name, solver, 'skipped', None, None, None, None, None)
+    loaded = time.perf_counter()
+
+    try:
+        cls = solver_class(solver)
+        parameters = inspect.signature(cls).parameters
+        options = {}
+        if time_limit is not None and 'time_limit' in parameters:
+            options['time_limit'] = time_limit
+        if 'seed' in parameters:
+            options['seed'] = seed
+        random.seed(seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan = _run_solver(cls, data_path, options, seed, cache_dir, reduce)
+        solved = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = check_plan(data_path, plan)
+        checked = time.perf_counter()
+    except Exception as e:
+        return InstanceResult(name, solver, 'error: {}'.format(e), None, None, round(loaded - started, 3), None,
+                              None)
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, '{}.{}.json'.format(os.path.splitext(name)[0], solver)), 'w') as outfile:
+            json.dump(plan, outfile)
+    return InstanceResult(name, solver, 'ok', summary['profit'], summary['completed'], round(loaded - started, 3),
+                          round(solved - loaded, 3), round(checked - solved, 3))
+
+
+def input_paths(patterns):
+    """Input files of directories (their .json files), glob patterns and paths, sorted and without repeats."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, '*.json'))))
+        else:
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return list(dict.fromkeys(paths))
+
+
+def solve_instances(paths, solver='GreedyByUser', jobs=None, time_limit=None, seed=0, output_dir=None,
+                    cache_dir=None, reduce=False):
+    """
+    InstanceResults of solve_instance over paths, in their order. The instances go to a pool of jobs worker
+    processes (one per core by default) that import the solvers once and are reused across instances;
+    with one job they are solved in this process.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, max(len(paths), 1))
+    arguments = [(path, solver, time_limit, seed, output_dir, cache_dir, reduce) for path in paths]
+    if jobs <= 1:
+        return [solve_instance(*args) for args in arguments]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=solver_class, initargs=(solver,)) as pool:
+        return list(pool.map(solve_instance, *zip(*arguments)))
+
+
+def format_results(results):
+    cells = [list(InstanceResult._fields)] + [['' if value is None else str(value) for value in result]
+                                              for result in results]
+    widths = [max(len(line[idx]) for line in cells) for idx in range(len(InstanceResult._fields))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m solutions',
+                                     description='Solve input files with one of the solvers and check the plans')
+    parser.add_argument('inputs', nargs='+', help='input files, directories of them or glob patterns')
+    parser.add_argument('--solver', choices=sorted(SOLVERS), default='GreedyByUser')
+    parser.add_argument('--jobs', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--time-limit', type=float, help='seconds per instance, for the solvers that take it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', help='write the plans here as <input name>.<solver>.json')
+    parser.add_argument('--cache-dir', help='reuse the plans of earlier runs stored here, see ResultCache')
+    parser.add_argument('--reduce', action='store_true',
+                        help='run the solver on the instances reduced by solutions.preprocessing')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = solve_instances(input_paths(args.inputs), args.solver, args.jobs, args.time_limit, args.seed,
+                              args.output_dir, args.cache_dir, args.reduce)
+    solved = [result for result in results if result.status != 'skipped']
+    print(format_results(solved))
+    print('{} instances ({} other files skipped), total profit {}, {:.2f}s'.format(
+        len(solved), len(results) - len(solved), sum(result.profit or 0 for result in solved),
+        time.perf_counter() - started))
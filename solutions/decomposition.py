@@ -0,0 +1,175 @@
+import json
+import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, OrderTable, load_instance, new_couriers
+from solutions.core import order_runs, plain_rows, write_instance
+from solutions.dispatcher import EventDispatcher
+from solutions.greedy_by_user import GreedyByUser
+
+# bounds are inclusive lower and exclusive upper coordinates of the pickup points in the region
+Region = namedtuple('Region', ['lo_x', 'hi_x', 'lo_y', 'hi_y', 'rows', 'couriers'])
+RegionStats = namedtuple('RegionStats', ['region', 'couriers', 'orders', 'profit', 'seconds'])
+DecompositionResult = namedtuple('DecompositionResult', ['plan', 'profit', 'merge_profit', 'regions'])
+
+
+def partition_regions(table: OrderTable, courier_columns, num_regions):
+    """
+    Splits the city into num_regions rectangles with about as many pickup points each: the larger side of a
+    rectangle is cut at the quantile of its pickup points that matches the number of regions on each side.
+    Orders go to the region of their pickup point and couriers to the region they start in.
+    """
+    infinity = np.iinfo(np.int64).max
+    regions = []
+
+    def split(lo_x, hi_x, lo_y, hi_y, rows, count):
+        if count == 1 or len(rows) < 2:
+            regions.append((lo_x, hi_x, lo_y, hi_y, rows))
+            # the regions that were not made get empty rectangles
+            regions.extend((lo_x, lo_x, lo_y, lo_y, rows[:0]) for _ in range(count - 1))
+            return
+        xs, ys = table.pickup_x[rows], table.pickup_y[rows]
+        by_x = xs.max() - xs.min() >= ys.max() - ys.min()
+        coordinates = xs if by_x else ys
+        left_count = count // 2
+        cut = int(np.sort(coordinates)[len(rows) * left_count // count])
+        left = coordinates < cut
+        if by_x:
+            split(lo_x, cut, lo_y, hi_y, rows[left], left_count)
+            split(cut, hi_x, lo_y, hi_y, rows[~left], count - left_count)
+        else:
+            split(lo_x, hi_x, lo_y, cut, rows[left], left_count)
+            split(lo_x, hi_x, cut, hi_y, rows[~left], count - left_count)
+
+    split(-infinity, infinity, -infinity, infinity, np.flatnonzero(table.alive), num_regions)
+
+    courier_x, courier_y = courier_columns[:, 1], courier_columns[:, 2]
+    result = []
+    for lo_x, hi_x, lo_y, hi_y, rows in regions:
+        inside = (courier_x >= lo_x) & (courier_x < hi_x) & (courier_y >= lo_y) & (courier_y < hi_y)
+        result.append(Region(lo_x, hi_x, lo_y, hi_y, rows, courier_columns[inside]))
+    return result
+
+
+def _solve_region(solver, path):
+    started = time.perf_counter()
+    plan = solver(path).solve()
+    return plan, time.perf_counter() - started
+
+
+def _replay(table, runs, couriers, depot_columns, plan):
+    """
+    Moves the couriers to the end of their routes in the plan, removes the orders they touch from table and
+    returns the profit of the plan. Couriers whose routes are not plain pickup-dropoff pairs (depot relays,
+    several orders on board) are replayed as the checker does and dropped from couriers, the merge step only
+    appends whole orders to plain routes.
+    """
+    by_id = {courier.id: courier for courier in couriers}
+    routes = {}
+    for event in plan:
+        routes.setdefault(event['courier_id'], []).append(event)
+
+    profit = 0
+    fixed = set()
+    for courier_id, events in routes.items():
+        courier = by_id[courier_id]
+        rows = plain_rows(table, runs, events)
+        if rows is None:
+            fixed.add(courier_id)
+            continue
+        x, y, now = courier.location_x, courier.location_y, courier.get_current_time()
+        for row in rows:
+            now = int(table.dropoff_times(x, y, now, rows=[row])[0])
+            x, y = int(table.dropoff_x[row]), int(table.dropoff_y[row])
+            profit += int(table.payment[row])
+            table.alive[row] = False
+        courier.update_current_pos(x, y)
+        courier.update_current_time(now)
+        profit -= 2 * (now - INITIAL_TIME_CONSTANT)
+
+    # in plan order, an order is dropped off at a depot before it is picked up there
+    depots = {point_id: (x, y) for point_id, x, y in np.asarray(depot_columns).tolist()}
+    at_depot = {}
+    for event in plan:
+        if event['courier_id'] not in fixed:
+            continue
+        courier = by_id[event['courier_id']]
+        row = table.row_of(event['order_id'])
+        pickup = event['action'] == 'pickup'
+        if event['point_id'] in depots:
+            (x, y), opens = depots[event['point_id']], 0
+        elif pickup:
+            x, y, opens = int(table.pickup_x[row]), int(table.pickup_y[row]), int(table.pickup_from[row])
+        else:
+            x, y, opens = int(table.dropoff_x[row]), int(table.dropoff_y[row]), int(table.dropoff_from[row])
+        now = max(courier.get_current_time() + 10 + abs(courier.location_x - x) + abs(courier.location_y - y), opens)
+        if pickup and event['point_id'] in depots:
+            now = max(now, at_depot[event['order_id']])
+        elif not pickup and event['point_id'] in depots:
+            at_depot[event['order_id']] = now
+        elif not pickup:
+            profit += int(table.payment[row])
+        table.alive[row] = False
+        courier.update_current_pos(x, y)
+        courier.update_current_time(now)
+    for courier_id in fixed:
+        profit -= 2 * (by_id[courier_id].get_current_time() - INITIAL_TIME_CONSTANT)
+        couriers.remove(by_id[courier_id])
+    return profit
+
+
+def decomposed_solve(data_path, solver=GreedyByUser, num_regions=4, jobs=None):
+    """
+    Solves the regions of partition_regions separately, each in its own process, with solver (any solver
+    class taking the path of an input file), then repairs the seams between them.
+
+    A region is written out as an input file of its own couriers and orders, so runtime follows the largest
+    region rather than the city. Regions know nothing of each other, so orders a region could not serve
+    well, mostly ones near its boundary, are left over while couriers next door may be idle. The merge
+    step offers the left over orders to all couriers from where their region routes end, in the order they
+    become free (EventDispatcher), so idle couriers of neighbouring regions take them first.
+    """
+    instance = load_instance(data_path)
+    table = instance.orders
+    regions = partition_regions(table, np.array(instance.couriers), num_regions)
+    tasks = [idx for idx, region in enumerate(regions) if len(region.rows) and len(region.couriers)]
+    jobs = min(jobs or os.cpu_count() or 1, max(len(tasks), 1))
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {}
+        for idx in tasks:
+            paths[idx] = os.path.join(directory, 'region_{}.json'.format(idx))
+            write_instance(paths[idx], table, regions[idx].rows, regions[idx].couriers, instance.depots)
+        if jobs <= 1:
+            results = [_solve_region(solver, paths[idx]) for idx in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(_solve_region, [solver] * len(tasks), [paths[idx] for idx in tasks]))
+
+    table = OrderTable.from_columns(table.columns())
+    runs = order_runs(table)
+    couriers = new_couriers(instance.couriers)
+    plan, stats = [], []
+    for idx, (region_plan, seconds) in zip(tasks, results):
+        profit = _replay(table, runs, couriers, instance.depots, region_plan)
+        plan.extend(region_plan)
+        stats.append(RegionStats(idx, len(regions[idx].couriers), len(regions[idx].rows), profit, seconds))
+
+    merge = EventDispatcher.from_table(table, couriers)
+    plan.extend(merge.solve())
+    profit = sum(region.profit for region in stats) + merge.total_revenue
+    return DecompositionResult(plan, profit, merge.total_revenue, stats)
+
+
+if __name__ == '__main__':
+    result = decomposed_solve('../example/contest_input.json')
+    for region in result.regions:
+        print('region {} with {} couriers and {} orders: profit {} in {:.2f}s'.format(*region))
+    print('merge profit {}, total profit {}'.format(result.merge_profit, result.profit))
+    with open('../example/contest_output_decomposition.json', 'w') as outfile:
+        json.dump(result.plan, outfile)
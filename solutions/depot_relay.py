@@ -0,0 +1,360 @@
+import json
+from collections import defaultdict
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, OrderTable, load_instance, new_couriers
+from solutions import core
+from solutions.core import EMPTY_RUN, join_runs, order_runs, plain_rows
+from solutions.greedy_by_user import GreedyByUser
+from solutions.instrumentation import DISABLED, EMIT, LOAD, ORDERS_ASSIGNED, SELECT
+
+# depots are open all day, orders can be left at them until then
+_DEPOT_CLOSES = 1439
+
+# completion time of the cells of the stop arrays that are no insertion point
+_NEVER = 1 << 40
+
+# legs of a route item: a whole order, from its pickup point to a depot, from a depot to its dropoff point
+_WHOLE, _TO_DEPOT, _FROM_DEPOT = 0, 1, 2
+
+
+class NearestDepots:
+    """
+    The k nearest depots (by manhattan distance) of the pickup and the dropoff point of every order of an
+    OrderTable, as (orders x k) arrays of depot indices and distances, nearest first.
+
+    relay_depots are the 2k candidate depots of every order for a relay, the pickup side first, with a mask of
+    the ones both legs fit through: a courier at the pickup point at pickup_from reaches the depot before it
+    closes and a courier waiting at the depot gets the order to the dropoff point by dropoff_to.
+    """
+
+    def __init__(self, table: OrderTable, depot_columns, k=3):
+        self.depot_ids = depot_columns[:, 0]
+        self.x = depot_columns[:, 1]
+        self.y = depot_columns[:, 2]
+        k = min(k, len(depot_columns))
+        self.pickup, self.pickup_distance = self._nearest(table.pickup_x, table.pickup_y, k)
+        self.dropoff, self.dropoff_distance = self._nearest(table.dropoff_x, table.dropoff_y, k)
+
+        self.relay_depots = np.concatenate([self.pickup, self.dropoff], axis=1)
+        to_depot = 10 + (np.abs(table.pickup_x[:, None] - self.x[self.relay_depots]) +
+                         np.abs(table.pickup_y[:, None] - self.y[self.relay_depots]))
+        from_depot = 10 + (np.abs(table.dropoff_x[:, None] - self.x[self.relay_depots]) +
+                           np.abs(table.dropoff_y[:, None] - self.y[self.relay_depots]))
+        at_depot = table.pickup_from[:, None] + to_depot
+        self.relay_feasible = (at_depot <= _DEPOT_CLOSES) & (at_depot + from_depot <= table.dropoff_to[:, None])
+
+    def _nearest(self, xs, ys, k):
+        indices = np.empty((len(xs), k), dtype=np.int64)
+        distances = np.empty((len(xs), k), dtype=np.int64)
+        if not k:
+            return indices, distances
+        # points a block at a time, the points x depots matrix stays small
+        for begin in range(0, len(xs), 4096):
+            block = np.abs(xs[begin:begin + 4096, None] - self.x) + np.abs(ys[begin:begin + 4096, None] - self.y)
+            nearest = np.argpartition(block, k - 1, axis=1)[:, :k] if k < len(self.x) else \
+                np.broadcast_to(np.arange(k), block.shape).copy()
+            nearest_distances = np.take_along_axis(block, nearest, axis=1)
+            by_distance = np.argsort(nearest_distances, axis=1, kind='stable')
+            indices[begin:begin + len(block)] = np.take_along_axis(nearest, by_distance, axis=1)
+            distances[begin:begin + len(block)] = np.take_along_axis(nearest_distances, by_distance, axis=1)
+        return indices, distances
+
+
+class _RelayRoute:
+    """
+    Route of a courier as items (row, leg, depot) with their runs (see core.join_runs) and payments; the
+    second leg of a relay pays the order. Insertions go to positions from locked on, the ones before the relay
+    legs of the route would move the times the orders are left at and taken from depots.
+    """
+
+    __slots__ = ('courier_id', 'start', 'items', 'runs', 'payments', 'prefix', 'suffix', 'paid', 'profit',
+                 'locked')
+
+    def __init__(self, courier_id, x, y):
+        self.courier_id = courier_id
+        self.start = (INITIAL_TIME_CONSTANT, 0, INITIAL_TIME_CONSTANT, x, y, x, y)
+        self.items = []
+        self.runs = []
+        self.payments = []
+        self.locked = 0
+
+    def update(self):
+        runs = self.runs
+        self.prefix = prefix = [self.start]
+        self.paid = paid = [0]
+        for run, payment in zip(runs, self.payments):
+            prefix.append(join_runs(prefix[-1], run))
+            paid.append(paid[-1] + payment)
+        self.suffix = suffix = [EMPTY_RUN] * (len(runs) + 1)
+        for position in range(len(runs) - 1, -1, -1):
+            suffix[position] = join_runs(runs[position], suffix[position + 1])
+        if prefix[-1] is None:
+            raise ValueError('Route of courier {} is late'.format(self.courier_id))
+        self.profit = self.profit_with(prefix[-1], paid[-1])
+
+    @staticmethod
+    def profit_with(run, paid):
+        if run[0] == INITIAL_TIME_CONSTANT and run[1] == 0:
+            # nothing to do, the courier never starts working
+            return paid
+        return paid - 2 * (run[0] + run[1] - INITIAL_TIME_CONSTANT)
+
+
+class DepotRelay:
+    """
+    Extension of a plan (by default the one of GreedyByUser) with orders relayed through depots.
+
+    An order no courier can take profitably as a whole, most often one whose dropoff window opens hours after
+    its pickup window, can be split into two legs: one courier takes it from the pickup point to a depot and
+    leaves it there, another one takes it from the depot to the dropoff point later on. Both couriers go on
+    with other orders in between instead of carrying the order around.
+
+    Left over orders are tried best paying first, each as a whole and as a relay through the candidate depots
+    of NearestDepots (the nearest depots_per_point of its pickup and of its dropoff point, whose fast test
+    passes), and the more profitable of the two is inserted. Legs are runs as in LocalSearch, the second one
+    can start no earlier than the first one reaches the depot, so an insertion is checked in constant time;
+    the completion times and end points of all route prefixes sit in (courier x position) arrays and a
+    vectorized reachability test picks the insertion points worth checking. Once a route has a relay leg,
+    nothing goes in before it any more, so the times orders spend at depots stay as planned.
+
+    A depot holds one order at a time in the checker, so the stays of orders at a depot never overlap, and the
+    events are emitted in time order. Couriers whose events are not plain pickup / dropoff pairs are kept as
+    they are and their events come first.
+    """
+
+    def __init__(self, data_path, plan=None, depots_per_point=3, instrumentation=None):
+        stats = instrumentation or DISABLED
+        with stats.phase(LOAD):
+            instance = load_instance(data_path)
+            self._setup(instance.orders, np.array(instance.couriers), np.array(instance.depots), plan,
+                        depots_per_point, stats)
+
+    @classmethod
+    def from_table(cls, orders_table: OrderTable, courier_columns, depot_columns, plan=None, depots_per_point=3,
+                   instrumentation=None):
+        solver = cls.__new__(cls)
+        solver._setup(orders_table, courier_columns, depot_columns, plan, depots_per_point,
+                      instrumentation or DISABLED)
+        return solver
+
+    def _setup(self, orders_table, courier_columns, depot_columns, plan, depots_per_point, stats):
+        self._stats = stats
+        self._orders_table = orders_table
+        if plan is None:
+            plan = GreedyByUser.from_table(OrderTable.from_columns(orders_table.columns()),
+                                           new_couriers(courier_columns)).solve()
+        self._runs = order_runs(orders_table)
+        self._payment = orders_table.payment.tolist()
+        self._depots = NearestDepots(orders_table, depot_columns, depots_per_point)
+        # row -> time the order reaches its depot, depot -> (from, to) stays of orders
+        self._at_depot = {}
+        self._depot_stays = defaultdict(list)
+        self.num_relayed = 0
+
+        self._routes = []
+        self._fixed_events = []
+        self._assigned = np.zeros(len(orders_table), dtype=bool)
+        width = 8
+        self._stop_time = np.full((len(courier_columns), width), _NEVER, dtype=np.int64)
+        self._stop_x = np.zeros((len(courier_columns), width), dtype=np.int64)
+        self._stop_y = np.zeros((len(courier_columns), width), dtype=np.int64)
+
+        events_of = defaultdict(list)
+        for event in plan:
+            events_of[event['courier_id']].append(event)
+        for courier_id, x, y in courier_columns.tolist():
+            route = _RelayRoute(courier_id, x, y)
+            self._routes.append(route)
+            events = events_of.get(courier_id, [])
+            rows = plain_rows(orders_table, self._runs, events)
+            if rows is None:
+                self._fixed_events.extend(events)
+                for event in events:
+                    self._assigned[orders_table.row_of(event['order_id'])] = True
+                route.locked = _NEVER
+                rows = []
+            route.items = [(row, _WHOLE, -1) for row in rows]
+            route.runs = [self._runs[row] for row in rows]
+            route.payments = [self._payment[row] for row in rows]
+            self._assigned[rows] = True
+            self._update(len(self._routes) - 1)
+        self.total_revenue = sum(route.profit for route in self._routes)
+
+    def _update(self, idx):
+        route = self._routes[idx]
+        route.update()
+        if len(route.items) + 1 > self._stop_time.shape[1]:
+            extra = self._stop_time.shape[1]
+            self._stop_time = np.pad(self._stop_time, ((0, 0), (0, extra)), constant_values=_NEVER)
+            self._stop_x = np.pad(self._stop_x, ((0, 0), (0, extra)))
+            self._stop_y = np.pad(self._stop_y, ((0, 0), (0, extra)))
+        self._stop_time[idx] = _NEVER
+        prefix = route.prefix[route.locked:]
+        if prefix:
+            self._stop_time[idx, route.locked:len(route.prefix)] = [run[0] + run[1] for run in prefix]
+            self._stop_x[idx, route.locked:len(route.prefix)] = [run[5] for run in prefix]
+            self._stop_y[idx, route.locked:len(route.prefix)] = [run[6] for run in prefix]
+
+    def _insertions(self, run, payment, exclude=-1, limit=32):
+        """
+        (gain, route index, cut, run of the route up to the inserted run) of insertions, best first. Only the
+        limit insertion points the run takes the least time after (travel and waiting included) are checked.
+        """
+        arrival = self._stop_time + 10 + np.abs(self._stop_x - run[3]) + np.abs(self._stop_y - run[4])
+        idxs, cuts = np.nonzero(arrival <= run[2])
+        if len(idxs) > limit:
+            spent = np.maximum(arrival[idxs, cuts], run[0]) - self._stop_time[idxs, cuts]
+            closest = np.argpartition(spent, limit - 1)[:limit]
+            idxs, cuts = idxs[closest], cuts[closest]
+        moves = []
+        for idx, cut in zip(idxs.tolist(), cuts.tolist()):
+            if idx == exclude:
+                continue
+            route = self._routes[idx]
+            head = join_runs(route.prefix[cut], run)
+            joined = join_runs(head, route.suffix[cut])
+            if joined is not None:
+                gain = route.profit_with(joined, route.paid[-1] + payment) - route.profit
+                moves.append((gain, idx, cut, head))
+        moves.sort(key=lambda move: -move[0])
+        return moves
+
+    def _insert(self, idx, cut, item, run, payment, lock):
+        route = self._routes[idx]
+        route.items.insert(cut, item)
+        route.runs.insert(cut, run)
+        route.payments.insert(cut, payment)
+        if lock:
+            route.locked = cut + 1
+        self.total_revenue -= route.profit
+        self._update(idx)
+        self.total_revenue += route.profit
+
+    def _depot_free(self, depot, begin, end):
+        return all(end < other_begin or begin > other_end for other_begin, other_end in self._depot_stays[depot])
+
+    def _best_relay(self, row, candidates=3):
+        """(gain, move) of the best relay of the order through one of its depots, move is None if none pays."""
+        table = self._orders_table
+        depots = self._depots
+        best_gain, best_move = 0, None
+        for depot in set(depots.relay_depots[row][depots.relay_feasible[row]].tolist()):
+            depot_x, depot_y = int(depots.x[depot]), int(depots.y[depot])
+            to_depot = 10 + abs(int(table.pickup_x[row]) - depot_x) + abs(int(table.pickup_y[row]) - depot_y)
+            from_depot = 10 + abs(int(table.dropoff_x[row]) - depot_x) + abs(int(table.dropoff_y[row]) - depot_y)
+            first_leg = (int(table.pickup_from[row]), to_depot, min(int(table.pickup_to[row]),
+                                                                    _DEPOT_CLOSES - to_depot),
+                         int(table.pickup_x[row]), int(table.pickup_y[row]), depot_x, depot_y)
+            for first_gain, first_idx, first_cut, head in self._insertions(first_leg, 0)[:candidates]:
+                if first_gain + self._payment[row] <= best_gain:
+                    break
+                at_depot = head[0] + head[1]
+                if at_depot + from_depot > table.dropoff_to[row]:
+                    continue
+                second_leg = (max(at_depot, int(table.dropoff_from[row]) - from_depot), from_depot,
+                              min(_DEPOT_CLOSES, int(table.dropoff_to[row]) - from_depot), depot_x, depot_y,
+                              int(table.dropoff_x[row]), int(table.dropoff_y[row]))
+                for second_gain, second_idx, second_cut, _ in self._insertions(second_leg, self._payment[row],
+                                                                              exclude=first_idx):
+                    if first_gain + second_gain <= best_gain:
+                        break
+                    before = self._routes[second_idx].prefix[second_cut]
+                    taken_at = max(at_depot, before[0] + before[1] + 10 + abs(before[5] - depot_x) +
+                                   abs(before[6] - depot_y))
+                    if self._depot_free(depot, at_depot, taken_at):
+                        best_gain = first_gain + second_gain
+                        best_move = (depot, at_depot, taken_at, first_idx, first_cut, first_leg, second_idx,
+                                     second_cut, second_leg)
+                        break
+        return best_gain, best_move
+
+    def solve(self):
+        table = self._orders_table
+        stats = self._stats
+        started_with, utilization = self.total_revenue, self.utilization()
+        with stats.phase(SELECT):
+            left_over = np.flatnonzero(table.alive & ~self._assigned)
+            for row in left_over[np.argsort(-table.payment[left_over], kind='stable')].tolist():
+                whole_gain, whole_move = 0, None
+                if self._runs[row] is not None:
+                    moves = self._insertions(self._runs[row], self._payment[row])
+                    if moves and moves[0][0] > 0:
+                        whole_gain, whole_move = moves[0][0], moves[0][1:3]
+                relay_gain, relay_move = self._best_relay(row)
+
+                if relay_move is not None and relay_gain > whole_gain:
+                    depot, at_depot, taken_at, first_idx, first_cut, first_leg, second_idx, second_cut, \
+                        second_leg = relay_move
+                    self._insert(first_idx, first_cut, (row, _TO_DEPOT, depot), first_leg, 0, lock=True)
+                    self._insert(second_idx, second_cut, (row, _FROM_DEPOT, depot), second_leg, self._payment[row],
+                                 lock=True)
+                    self._at_depot[row] = at_depot
+                    self._depot_stays[depot].append((at_depot, taken_at))
+                    self.num_relayed += 1
+                elif whole_move is not None:
+                    idx, cut = whole_move
+                    self._insert(idx, cut, (row, _WHOLE, -1), self._runs[row], self._payment[row], lock=False)
+                else:
+                    continue
+                self._assigned[row] = True
+        stats.progress('solved', force=True, improvement=self.total_revenue - started_with, relayed=self.num_relayed,
+                       utilization_before=utilization, utilization=self.utilization())
+
+        with stats.phase(EMIT):
+            plan = self._plan()
+        stats.count(ORDERS_ASSIGNED, len(plan) // 2)
+        return plan
+
+    def utilization(self):
+        """Orders delivered per hour couriers work (from the start of the day to their last event)."""
+        delivered, minutes = 0, 0
+        for route in self._routes:
+            if route.items:
+                delivered += sum(leg != _TO_DEPOT for _, leg, _ in route.items)
+                minutes += route.prefix[-1][0] + route.prefix[-1][1] - INITIAL_TIME_CONSTANT
+        return 60 * delivered / minutes if minutes else 0.0
+
+    def _plan(self):
+        """Events of all routes in the order of their times, depot dropoffs before pickups at the same time."""
+        table = self._orders_table
+        depot_ids = self._depots.depot_ids
+        timed = []
+        for route in self._routes:
+            now, x, y = INITIAL_TIME_CONSTANT, route.start[3], route.start[4]
+            for row, leg, depot in route.items:
+                if leg == _FROM_DEPOT:
+                    point = (int(depot_ids[depot]), int(self._depots.x[depot]), int(self._depots.y[depot]),
+                             self._at_depot[row])
+                else:
+                    point = (int(table.pickup_point_ids[row]), int(table.pickup_x[row]), int(table.pickup_y[row]),
+                             int(table.pickup_from[row]))
+                now = max(now + 10 + abs(x - point[1]) + abs(y - point[2]), point[3])
+                x, y = point[1], point[2]
+                timed.append((now, 1, len(timed), route.courier_id, 'pickup', row, point[0]))
+
+                if leg == _TO_DEPOT:
+                    point = (int(depot_ids[depot]), int(self._depots.x[depot]), int(self._depots.y[depot]), 0)
+                else:
+                    point = (int(table.dropoff_point_ids[row]), int(table.dropoff_x[row]),
+                             int(table.dropoff_y[row]), int(table.dropoff_from[row]))
+                now = max(now + 10 + abs(x - point[1]) + abs(y - point[2]), point[3])
+                x, y = point[1], point[2]
+                timed.append((now, 0, len(timed), route.courier_id, 'dropoff', row, point[0]))
+
+        timed.sort()
+        answer = list(self._fixed_events)
+        for _, _, _, courier_id, action, row, point_id in timed:
+            answer.append(core.event(courier_id, action, int(table.order_ids[row]), point_id))
+        return answer
+
+
+if __name__ == '__main__':
+    solver = DepotRelay('../example/contest_input.json')
+    started_with, utilization = solver.total_revenue, solver.utilization()
+    plan = solver.solve()
+    print('Depot relays improved the profit by {}, {} orders relayed, {:.3f} -> {:.3f} orders per courier '
+          'hour'.format(solver.total_revenue - started_with, solver.num_relayed, utilization, solver.utilization()))
+    with open('../example/contest_output_depot_relay.json', 'w') as outfile:
+        json.dump(plan, outfile)
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, load_instance
+from solutions.core import SOLVERS, solver_class
+
+# longest time_limit a /plan request can ask for, in seconds
+_MAX_TIME_LIMIT = 60.0
+
+# options a /plan request can set, solver -> option -> (type, lowest, highest). Paths (checkpoint_path) and
+# starting plans are never accepted, and the ranges bound the time a request can hold a worker for.
+_SOLVER_OPTIONS = {
+    'GreedyByUser': {'bundling': (bool, None, None)},
+    'HungarianSearch': {'top_k': (int, 1, 200), 'time_limit': (float, 0, _MAX_TIME_LIMIT)},
+    'BeamSearchGreedy': {'depth': (int, 1, 6), 'beam_width': (int, 1, 32)},
+    'MinCostFlowSearch': {'top_k': (int, 1, 50), 'courier_top_k': (int, 1, 200), 'candidate_top_k': (int, 1, 500),
+                          'rounds': (int, 1, 10)},
+    'LocalSearch': {'time_limit': (float, 0, _MAX_TIME_LIMIT), 'neighbours': (int, 1, 100), 'seed': (int, None, None),
+                    'target_gap': (float, 0, 1)},
+    'DepotRelay': {'depots_per_point': (int, 1, 10)},
+}
+
+_STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+# set in every worker process by _init_worker
+_worker_state = {}
+
+
+class RequestError(Exception):
+    """Bad request, answered with status 400 and the message."""
+
+
+def _init_worker(data_path):
+    _worker_state['data_path'] = data_path
+    # parses the input (or maps its cache) once per worker instead of once per request
+    load_instance(data_path)
+
+
+def _validate(plan):
+    from src.check import check_plan
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return {'valid': True, **check_plan(_worker_state['data_path'], plan)}
+    except Exception as e:
+        return {'valid': False, 'error': str(e)}
+
+
+def _solve(solver, options):
+    cls = solver_class(solver)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = cls(_worker_state['data_path'], **options).solve()
+    seconds = time.perf_counter() - started
+    return {'plan': plan, 'seconds': round(seconds, 3), 'check': _validate(plan)}
+
+
+def _checked_options(solver, options):
+    """options of a /plan request, RequestError unless every one is allowed for the solver and within bounds."""
+    allowed = _SOLVER_OPTIONS.get(solver, {})
+    for name, value in options.items():
+        if name not in allowed:
+            raise RequestError('Unknown option of {}: {}'.format(solver, name))
+        kind, lowest, highest = allowed[name]
+        if kind is bool:
+            valid = isinstance(value, bool)
+        else:
+            valid = isinstance(value, (int, float) if kind is float else int) and not isinstance(value, bool)
+            valid = valid and (lowest is None or value >= lowest) and (highest is None or value <= highest)
+        if not valid:
+            raise RequestError('Option {} of {} must be {} in [{}, {}]'.format(name, solver, kind.__name__, lowest,
+                                                                              highest))
+    return options
+
+
+class DispatchService:
+    """
+    Long-running local service over one input file, answering JSON requests over HTTP:
+
+    - POST /next_order {"courier_id", "time", optional "x", "y", "exclude"}: the most profitable order for the
+      courier standing at (x, y) (its start point by default) at time, leaving out the order ids of exclude;
+    - POST /plan {"solver", optional "options"}: plan of one of the SOLVERS and its check_plan result;
+    - POST /validate {"plan"}: check_plan result of the plan;
+    - GET /health.
+
+    The instance is loaded once. next_order requests that arrive within batch_window seconds of each other
+    are scored together, in one OrderTable.revenues_block pass over all orders. Solves and validations run
+    in a pool of jobs processes that load the instance once each, so the event loop stays responsive.
+    """
+
+    def __init__(self, data_path, jobs=None, batch_window=0.002):
+        self._data_path = data_path
+        instance = load_instance(data_path)
+        self._orders_table = instance.orders
+        self._couriers = {courier_id: (x, y) for courier_id, x, y in instance.couriers.tolist()}
+        self._jobs = jobs or os.cpu_count() or 1
+        self._batch_window = batch_window
+        self._batch = []
+        self._pool = None
+        self.batches = 0
+
+    async def start(self, host='127.0.0.1', port=8080, unix_path=None):
+        """Starts the pool and listens on host:port, or on the unix socket unix_path, returns the server."""
+        # forked workers would inherit the sockets of the connections open at the time and keep them open
+        self._pool = ProcessPoolExecutor(max_workers=self._jobs, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_init_worker, initargs=(self._data_path,))
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self._handle, path=unix_path)
+        return await asyncio.start_server(self._handle, host, port)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def next_order(self, courier_id, at, x=None, y=None, exclude=()):
+        if not isinstance(courier_id, int) or isinstance(courier_id, bool) or courier_id not in self._couriers:
+            raise RequestError('Unknown courier {}'.format(courier_id))
+        if x is None or y is None:
+            x, y = self._couriers[courier_id]
+        if not isinstance(exclude, (list, tuple)):
+            raise RequestError('exclude must be a list of order ids')
+        try:
+            x, y, at = int(x), int(y), int(at)
+            exclude = [int(order_id) for order_id in exclude]
+        except (TypeError, ValueError):
+            raise RequestError('x, y, time and the order ids of exclude must be integers')
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((x, y, at, exclude, future))
+        if len(self._batch) == 1:
+            asyncio.get_running_loop().call_later(self._batch_window, self._score_batch)
+        return await future
+
+    def _score_batch(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        self.batches += 1
+        table = self._orders_table
+        xs, ys, times = (list(column) for column in zip(*(request[:3] for request in batch)))
+        try:
+            revenues = table.revenues_block(xs, ys, times)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # a request that fails fails alone, the others of the batch are still answered
+        for line, (x, y, at, exclude, future) in zip(revenues, batch):
+            if future.done():
+                continue
+            try:
+                answer = self._best_order(line, x, y, at, exclude)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            future.set_result(answer)
+
+    def _best_order(self, line, x, y, at, exclude):
+        table = self._orders_table
+        if exclude:
+            line[np.isin(table.order_ids, exclude)] = -np.inf
+        best = int(np.argmax(line))
+        if line[best] <= 0:
+            return {'order_id': None}
+        return {'order_id': int(table.order_ids[best]), 'revenue': int(line[best]),
+                'dropoff_time': int(table.dropoff_times(x, y, at, rows=[best])[0])}
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, function, *args)
+
+    async def dispatch(self, method, path, body):
+        """JSON answer to a request, raises RequestError for bad ones and LookupError for unknown paths."""
+        if path == '/health':
+            return {'status': 'ok', 'orders': len(self._orders_table), 'couriers': len(self._couriers)}
+        if method != 'POST':
+            raise LookupError(path)
+        if path == '/next_order':
+            if 'courier_id' not in body:
+                raise RequestError('Missing field courier_id')
+            return await self.next_order(body['courier_id'], body.get('time', INITIAL_TIME_CONSTANT), body.get('x'),
+                                         body.get('y'), body.get('exclude', ()))
+        if path == '/plan':
+            solver = body.get('solver', 'GreedyByUser')
+            if solver not in SOLVERS:
+                raise RequestError('Unknown solver: {}'.format(solver))
+            options = body.get('options', {})
+            if not isinstance(options, dict):
+                raise RequestError('options must be an object')
+            return await self._run(_solve, solver, _checked_options(solver, options))
+        if path == '/validate':
+            if 'plan' not in body:
+                raise RequestError('Missing field plan')
+            return await self._run(_validate, body['plan'])
+        raise LookupError(path)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            raw = await reader.readexactly(int(headers.get('content-length', 0)))
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                raise RequestError('Body is not JSON')
+            if not isinstance(body, dict):
+                raise RequestError('Body is not a JSON object')
+            status, answer = 200, await self.dispatch(method, path.split('?', 1)[0], body)
+        except RequestError as e:
+            status, answer = 400, {'error': str(e)}
+        except LookupError as e:
+            status, answer = 404, {'error': 'Unknown path {}'.format(e)}
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, answer = 400, {'error': 'Malformed request: {}'.format(e)}
+        except Exception as e:
+            status, answer = 500, {'error': '{}: {}'.format(type(e).__name__, e)}
+
+        payload = json.dumps(answer).encode()
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'.format(status, _STATUS_TEXT[status], len(payload)).encode() + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(data_path, host='127.0.0.1', port=8080, unix_path=None, jobs=None):
+    service = DispatchService(data_path, jobs)
+    server = await service.start(host, port, unix_path)
+    print('Serving {} on {}'.format(data_path, unix_path or '{}:{}'.format(host, port)))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve plans and next orders for one input file')
+    parser.add_argument('input')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', help='listen on this unix socket instead of host:port')
+    parser.add_argument('--jobs', type=int, help='solver processes, one per core by default')
+    args = parser.parse_args()
+    asyncio.run(serve(args.input, args.host, args.port, args.unix, args.jobs))
@@ -0,0 +1,167 @@
+import heapq
+import json
+import time
+
+import numpy as np
+
+from data_wrappers import OrderTable, load_instance, new_couriers
+from solutions import core
+from solutions.instrumentation import (CANDIDATES_PRUNED, DISABLED, EMIT, LOAD, ORDERS_ASSIGNED,
+                                       REVENUE_EVALUATIONS, SCORE, SELECT)
+from solutions.spatial_index import PickupGrid
+
+
+class ExpiryCalendar:
+    """
+    Calendar queue of the alive orders of an OrderTable by the last time a courier can set off to pick them up,
+    pickup_to - 10, in buckets of bucket_width minutes.
+
+    The clock only moves forward, so expire(now) walks the buckets that ended before now once: every order
+    is looked at a single time over a whole run. Orders of the current bucket are left to the readers, which
+    check pickup_to anyway.
+    """
+
+    def __init__(self, table: OrderTable, bucket_width=30):
+        rows = np.flatnonzero(table.alive)
+        deadlines = table.pickup_to[rows] - 10
+        permutation = np.argsort(deadlines, kind='stable')
+        self._rows = rows[permutation]
+        self._bucket_width = bucket_width
+        if len(rows):
+            self._first_bucket = int(deadlines.min()) // bucket_width
+            buckets = deadlines[permutation] // bucket_width - self._first_bucket
+            # rows of bucket b are _rows[_bucket_starts[b]:_bucket_starts[b + 1]]
+            self._bucket_starts = np.searchsorted(buckets, np.arange(int(buckets[-1]) + 2))
+        else:
+            self._first_bucket = 0
+            self._bucket_starts = np.zeros(1, dtype=np.int64)
+        self._next_bucket = 0
+
+    def expire(self, now):
+        """Rows of the orders that no courier free at now or later can pick up, each returned once."""
+        last_bucket = min(now // self._bucket_width - self._first_bucket, len(self._bucket_starts) - 1)
+        if last_bucket <= self._next_bucket:
+            return self._rows[:0]
+        expired = self._rows[self._bucket_starts[self._next_bucket]:self._bucket_starts[last_bucket]]
+        self._next_bucket = last_bucket
+        return expired
+
+
+class EventDispatcher:
+    """
+    Routes all couriers at once, in the order they become free.
+
+    Couriers sit in a heap by the time they finish their last order. The earliest free one takes one of its
+    profitable reachable orders (revenue as in GreedyByUser, the pickup grid finds the candidates) and goes
+    back into the heap at the dropoff time of that order; a courier with no profitable order left is done for
+    the day, as waiting only makes its options worse. Minutes a courier is busy are worth what the fleet has
+    earned per busy minute so far, so it takes the order with the best revenue minus that price of the time it
+    takes, rather than the best revenue, which would keep it on long orders the rest of the fleet could use.
+    The clock of the fleet never goes back, so orders whose pickup window closed before it are taken off the
+    table and the grid through an ExpiryCalendar.
+
+    It is not one of core.SOLVERS: on a whole city it earns less than GreedyByUser (220812 against 264824 on
+    contest_input.json). Couriers taking turns keep breaking up each other's chains, and no selection rule
+    tried so far (lookahead, regret against other couriers, waiting caps, a fixed price of time) made up for
+    that. It is meant for couriers whose routes end at different times, as in the merge step of
+    decomposed_solve.
+    """
+
+    def __init__(self, data_path, bucket_width=30, instrumentation=None):
+        stats = instrumentation or DISABLED
+        with stats.phase(LOAD):
+            instance = load_instance(data_path)
+            self._setup(instance.orders, new_couriers(instance.couriers), bucket_width, stats)
+
+    @classmethod
+    def from_table(cls, orders_table: OrderTable, couriers, bucket_width=30, instrumentation=None):
+        """Dispatcher over an already loaded order table, expired orders are removed from it as well."""
+        solver = cls.__new__(cls)
+        solver._setup(orders_table, couriers, bucket_width, instrumentation or DISABLED)
+        return solver
+
+    def _setup(self, orders_table, couriers, bucket_width, stats):
+        self._couriers = couriers
+        self._orders_table = orders_table
+        self._pickup_index = PickupGrid(orders_table)
+        self._calendar = ExpiryCalendar(orders_table, bucket_width)
+        self._stats = stats
+        self.total_revenue = 0
+        self.num_expired = 0
+
+    def solve(self):
+        table = self._orders_table
+        stats = self._stats
+        enabled = stats.enabled
+        evaluations = pruned = score_seconds = select_seconds = 0
+        free_at = [(courier.get_current_time(), idx) for idx, courier in enumerate(self._couriers)]
+        heapq.heapify(free_at)
+        routes = []
+        busy_minutes = 0
+
+        while free_at:
+            now, idx = heapq.heappop(free_at)
+            courier = self._couriers[idx]
+            sampled = stats.sampled()
+            if enabled:
+                started = time.perf_counter()
+
+            for row in self._calendar.expire(now).tolist():
+                if table.alive[row]:
+                    table.alive[row] = False
+                    self._pickup_index.remove(int(table.order_ids[row]))
+                    self.num_expired += 1
+
+            rows = self._pickup_index.query(courier.location_x, courier.location_y, now)
+            if not len(rows):
+                continue
+            drops_off_at = table.dropoff_times(courier.location_x, courier.location_y, now, rows=rows)
+            revenues = np.where(drops_off_at >= 0, table.payment[rows] - 2 * (drops_off_at - now), 0)
+            busy_cost = self.total_revenue / max(busy_minutes, 1)
+            best = int(np.argmax(np.where(revenues > 0, revenues - busy_cost * (drops_off_at - now), -np.inf)))
+            if enabled:
+                scored = time.perf_counter()
+                score_seconds += scored - started
+                evaluations += len(rows)
+                pruned += int(np.count_nonzero(drops_off_at < 0))
+            if revenues[best] <= 0:
+                continue
+
+            row = int(rows[best])
+            table.remove(int(table.order_ids[row]))
+            self._pickup_index.remove(int(table.order_ids[row]))
+            self.total_revenue += int(revenues[best])
+            courier.update_current_time(int(drops_off_at[best]))
+            courier.update_current_pos(int(table.dropoff_x[row]), int(table.dropoff_y[row]))
+            busy_minutes += int(drops_off_at[best]) - now
+            heapq.heappush(free_at, (courier.get_current_time(), idx))
+            routes.append((courier.id, row))
+            if enabled:
+                finished = time.perf_counter()
+                select_seconds += finished - scored
+                if sampled:
+                    stats.observe('dispatch', finished - started)
+                stats.progress('dispatch', clock=now, orders_assigned=len(routes), couriers_busy=len(free_at))
+
+        with stats.phase(EMIT):
+            answer = []
+            for courier_id, row in routes:
+                answer.extend(core.order_events(courier_id, int(table.order_ids[row]), int(table.pickup_point_ids[row]),
+                                                int(table.dropoff_point_ids[row])))
+
+        if enabled:
+            stats.add_time(SCORE, score_seconds)
+            stats.add_time(SELECT, select_seconds)
+            stats.count(REVENUE_EVALUATIONS, evaluations)
+            stats.count(CANDIDATES_PRUNED, pruned)
+            stats.count(ORDERS_ASSIGNED, len(routes))
+        stats.progress('solved', force=True, orders_completed=len(routes), orders_expired=self.num_expired)
+        return answer
+
+
+if __name__ == '__main__':
+    solver = EventDispatcher('../example/contest_input.json')
+    plan = solver.solve()
+    print('Num total orders completed {}, expired {}'.format(len(plan) // 2, solver.num_expired))
+    with open('../example/contest_output_dispatcher.json', 'w') as outfile:
+        json.dump(plan, outfile)
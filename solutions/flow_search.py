@@ -0,0 +1,214 @@
+import json
+from collections import defaultdict
+
+import numpy as np
+
+from data_wrappers import OrderTable, load_instance, new_couriers
+from solutions import core
+from solutions.greedy_by_user import GreedyByUser
+from solutions.instrumentation import DISABLED, LOAD, ORDERS_ASSIGNED, SCORE, SELECT
+from solutions.min_cost_flow import min_cost_flow
+from solutions.order_graph import build_order_graph, earliest_dropoff_times, load_order_graph, plan_order_graph
+from solutions.spatial_index import PickupGrid
+
+
+class MinCostFlowSearch:
+    """
+    Routes of all couriers at once as a min cost flow over the order graph.
+
+    Every courier is a unit of flow from the source that ends in the sink (the end of the day), either directly
+    or through a chain of orders. An order is a pair of nodes joined by a unit capacity arc, so at most one
+    courier serves it; the arcs between orders are the edges of the order graph and the arcs from couriers
+    go to their most profitable first orders. Arc costs are minus the revenues, so the flow maximizes the
+    profit of the day.
+
+    Orders need a dropoff time to be chained in a DAG. They are planned at the times a GreedyByUser run drops
+    them off (orders it skips at their earliest time) and the order graph of the instance, with candidate_top_k
+    edges per order, is cut down to that plan. So the greedy routes are one of the flows and every flow is a valid
+    set of routes. With rounds > 1 the orders are planned again along the flow routes and the flow is solved
+    once more. The routes are then replayed at the times couriers really get there, which is never later
+    than planned, and the orders left over are offered to the couriers GreedyByUser-style from where their
+    routes end.
+
+    It pays off with many couriers: HungarianSearch rescores couriers against orders every round, while the
+    flow is solved once. With 2000 couriers and 20000 orders (the benchmark's large size) it earns more in
+    less time. With a few hundred couriers it is about twice as slow, as most of the time goes to the
+    GreedyByUser run it plans along and to one shortest path search per courier.
+    """
+
+    def __init__(self, data_path, top_k=5, courier_top_k=20, candidate_top_k=50, rounds=1, instrumentation=None):
+        stats = instrumentation or DISABLED
+        with stats.phase(LOAD):
+            instance = load_instance(data_path)
+
+            self._couriers = new_couriers(instance.couriers)
+            self._setup(instance.orders, load_order_graph(data_path, candidate_top_k), top_k, courier_top_k, rounds,
+                        stats)
+
+    @classmethod
+    def from_table(cls, orders_table: OrderTable, couriers, top_k=5, courier_top_k=20, candidate_top_k=50,
+                   rounds=1, instrumentation=None):
+        """Solver over an already loaded order table, its order graph is built without the cache."""
+        solver = cls.__new__(cls)
+        solver._couriers = couriers
+        solver._setup(orders_table, build_order_graph(orders_table, candidate_top_k), top_k, courier_top_k, rounds,
+                      instrumentation or DISABLED)
+        return solver
+
+    def _setup(self, orders_table, order_graph, top_k, courier_top_k, rounds, stats):
+        self._stats = stats
+        self._orders_table = orders_table
+        self._order_graph = order_graph
+        self._top_k = top_k
+        self._courier_top_k = courier_top_k
+        self._rounds = rounds
+        self.total_revenue = 0
+
+    def solve(self):
+        stats = self._stats
+        with stats.phase(SCORE):
+            routes = self._greedy_routes()
+            for _ in range(self._rounds):
+                routes = self._find_routes(routes)
+        stats.progress('routes', force=True, couriers_routed=sum(1 for route in routes if route))
+
+        with stats.phase(SELECT):
+            table = self._orders_table
+            answer = []
+            for courier, route in zip(self._couriers, routes):
+                for row in self._replay_route(courier, route):
+                    table.remove(int(table.order_ids[row]))
+                    answer.extend(core.order_events(courier.id, int(table.order_ids[row]),
+                                                    int(table.pickup_point_ids[row]),
+                                                    int(table.dropoff_point_ids[row])))
+
+            # couriers are at the end of their routes, leftover orders go to whoever can still take them
+            greedy = GreedyByUser.from_table(table, self._couriers)
+            answer.extend(greedy.solve())
+            self.total_revenue += greedy.total_revenue
+        stats.count(ORDERS_ASSIGNED, len(answer) // 2)
+        stats.progress('solved', force=True, orders_completed=len(answer) // 2)
+        return answer
+
+    def _greedy_routes(self):
+        """Rows of the routes GreedyByUser gives every courier, run on copies of the table and the couriers."""
+        table = self._orders_table
+        couriers = new_couriers(np.array([[c.id, c.location_x, c.location_y] for c in self._couriers],
+                                         dtype=np.int64).reshape(-1, 3))
+        for copy, courier in zip(couriers, self._couriers):
+            copy.update_current_time(courier.get_current_time())
+
+        greedy_table = OrderTable.from_columns(table.columns())
+        greedy_table.alive[:] = table.alive
+        events = GreedyByUser.from_table(greedy_table, couriers).solve()
+
+        routes = defaultdict(list)
+        for event in events:
+            if event['action'] == 'dropoff':
+                routes[event['courier_id']].append(table.row_of(event['order_id']))
+        return [routes[courier.id] for courier in self._couriers]
+
+    def _planned_dropoff(self, routes):
+        """Dropoff times of the orders on the routes, earliest dropoff times of the other alive orders."""
+        table = self._orders_table
+        planned = np.where(table.alive, earliest_dropoff_times(table), -1)
+        for courier, route in zip(self._couriers, routes):
+            x, y, now = courier.location_x, courier.location_y, courier.get_current_time()
+            for row in route:
+                now = int(table.dropoff_times(x, y, now, rows=[row])[0])
+                x, y = int(table.dropoff_x[row]), int(table.dropoff_y[row])
+                planned[row] = now
+        return planned
+
+    def _find_routes(self, planned_routes):
+        """Rows of the orders on the flow route of every courier in visiting order, planned along planned_routes."""
+        table = self._orders_table
+        planned = self._planned_dropoff(planned_routes)
+        graph = plan_order_graph(self._order_graph, table, planned, self._top_k)
+
+        num_couriers, num_orders = len(self._couriers), len(table)
+        # node layout: source, couriers, order entries, order exits, sink
+        source, sink = 0, 1 + num_couriers + 2 * num_orders
+        entry, exit_ = 1 + num_couriers, 1 + num_couriers + num_orders
+        tails, heads, costs = [], [], []
+
+        def add_edges(edge_tails, edge_heads, edge_costs):
+            tails.extend(edge_tails)
+            heads.extend(edge_heads)
+            costs.extend(edge_costs)
+
+        courier_nodes = list(range(1, 1 + num_couriers))
+        add_edges([source] * num_couriers, courier_nodes, [0] * num_couriers)
+        add_edges(courier_nodes, [sink] * num_couriers, [0] * num_couriers)
+
+        pickup_index = PickupGrid(table)
+        for node, courier, route in zip(courier_nodes, self._couriers, planned_routes):
+            x, y, now = courier.location_x, courier.location_y, courier.get_current_time()
+            rows = pickup_index.query(x, y, now)
+            drops_off_at = table.dropoff_times(x, y, now, rows=rows)
+            rows = rows[(drops_off_at >= 0) & (drops_off_at <= planned[rows])]
+            revenues = table.payment[rows] - 2 * (planned[rows] - now)
+            rows, revenues = rows[revenues > 0], revenues[revenues > 0]
+            if len(rows) > self._courier_top_k:
+                best = np.argpartition(-revenues, self._courier_top_k - 1)[:self._courier_top_k]
+                rows, revenues = rows[best], revenues[best]
+            if route and route[0] not in set(rows.tolist()):
+                rows = np.append(rows, route[0])
+                revenues = np.append(revenues, table.payment[route[0]] - 2 * (planned[route[0]] - now))
+            add_edges([node] * len(rows), (entry + rows).tolist(), (-revenues).tolist())
+
+        servable = np.flatnonzero(planned >= 0)
+        add_edges((entry + servable).tolist(), (exit_ + servable).tolist(), [0] * len(servable))
+        add_edges((exit_ + servable).tolist(), [sink] * len(servable), [0] * len(servable))
+
+        add_edges((exit_ + np.repeat(np.arange(num_orders), np.diff(graph.indptr))).tolist(),
+                  (entry + graph.indices).tolist(), (-graph.weights).tolist())
+        # the planned routes stay feasible flows even where the order graph cut their edges off at top_k
+        for route in planned_routes:
+            for first, second in zip(route, route[1:]):
+                add_edges([exit_ + first], [entry + second],
+                          [-int(table.payment[second] - 2 * (planned[second] - planned[first]))])
+
+        topological_order = ([source] + courier_nodes +
+                             [node for row in graph.topological_order().tolist() for node in (entry + row, exit_ + row)]
+                             + [sink])
+        flows = min_cost_flow(sink + 1, tails, heads, [1] * len(tails), costs, source, sink, topological_order)
+
+        next_node = {tail: head for tail, head, flow in zip(tails, heads, flows) if flow and tail != source}
+        routes = []
+        for node in courier_nodes:
+            route = []
+            node = next_node.get(node, sink)
+            while node != sink:
+                route.append(node - entry)
+                node = next_node.get(exit_ + route[-1], sink)
+            routes.append(route)
+        return routes
+
+    def _replay_route(self, courier, route):
+        """Rows of the route the courier completes at the real times, the courier is moved to its end."""
+        table = self._orders_table
+        x, y, now = courier.location_x, courier.location_y, courier.get_current_time()
+        completed, revenue = [], 0
+        for row in route:
+            dropoff_at = int(table.dropoff_times(x, y, now, rows=[row])[0])
+            if dropoff_at < 0 or not table.alive[row]:
+                continue
+            revenue += int(table.payment[row]) - 2 * (dropoff_at - now)
+            completed.append(row)
+            x, y, now = int(table.dropoff_x[row]), int(table.dropoff_y[row]), dropoff_at
+
+        if revenue <= 0:
+            return []
+        courier.update_current_pos(x, y)
+        courier.update_current_time(now)
+        self.total_revenue += revenue
+        return completed
+
+
+if __name__ == '__main__':
+    solver = MinCostFlowSearch('../example/contest_input.json')
+    plan = solver.solve()
+    print('Num total orders completed {}'.format(len(plan) // 2))
+    with open('../example/contest_output_min_cost_flow.json', 'w') as outfile:
+        json.dump(plan, outfile)
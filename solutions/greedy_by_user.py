@@ -1,130 +1,207 @@
 import json
 import random
+import time
 random.seed(1000)
 
-from data_wrappers import Courier, Order
+import numpy as np
+
+from data_wrappers import Courier, Order, OrderTable, load_instance, new_couriers
+from solutions import core
+from solutions.insertion import StopRoute
+from solutions.instrumentation import (CANDIDATES_PRUNED, DISABLED, EMIT, LOAD, ORDERS_ASSIGNED,
+                                       REVENUE_EVALUATIONS, SCORE, SELECT)
+from solutions.spatial_index import PickupGrid
 from collections import namedtuple
 
 CompletedOrderInfo = namedtuple('OrderInfo', ['courier_id', 'order_id', 'revenue'])
 
+# with bundling, new orders are looked for around the last _BUNDLE_STOPS stops of a route, the
+# _BUNDLE_CANDIDATES best ones around every stop (by revenue as the next order from there) are tried everywhere
+_BUNDLE_STOPS = 3
+_BUNDLE_CANDIDATES = 8
+
 
 def calculate_manhattan_dist(order: Order):
     return abs(order.pickup_location_x - order.dropoff_location_x) + abs(order.pickup_location_y - order.dropoff_location_y)
 
 class GreedyByUser:
-    def __init__(self, data_path):
-        with open(data_path) as f:
-            data = json.loads(f.read())
+    """
+    Routes couriers one after another, each taking the most profitable next order until none pays.
 
-        self._orders_map = {order.order_id: order for order in [Order(x) for x in data['orders']]}
+    With bundling, a courier can carry several orders at once: an order's pickup and dropoff may go anywhere
+    among the last stops of the route (StopRoute.best_insertion), not only after its end.
+    """
 
-        self._couriers = [Courier(x) for x in data['couriers']]
-        random.shuffle(self._couriers)
+    def __init__(self, data_path, instrumentation=None, bundling=False):
+        stats = instrumentation or DISABLED
+        with stats.phase(LOAD):
+            instance = load_instance(data_path)
 
-        self._orders_immutable_map = {order.order_id: order for order in [Order(x) for x in data['orders']]}
+            couriers = new_couriers(instance.couriers)
+            random.shuffle(couriers)
 
-    @staticmethod
-    def time_when_picks_up(courier: Courier, order: Order):
-        if courier.get_current_time() > order.pickup_to:
-            return None
-        arrives_to_point_at = courier.get_current_time() + 10 + abs(courier.location_x - order.pickup_location_x) + abs(
-            courier.location_y - order.pickup_location_y)
-        if arrives_to_point_at > order.pickup_to:
-            return None
-        if arrives_to_point_at < order.pickup_from:
-            arrives_to_point_at += order.pickup_from - arrives_to_point_at
-        return arrives_to_point_at
+            self._setup(instance.orders, couriers, stats, bundling)
 
-    @staticmethod
-    def time_when_dropoffs_of(courier_actual_time: int, order: Order):
-        if courier_actual_time > order.dropoff_to:
-            return None
+    @classmethod
+    def from_table(cls, orders_table: OrderTable, couriers, instrumentation=None, bundling=False):
+        """Solver over an already loaded order table, couriers are routed in the given order."""
+        solver = cls.__new__(cls)
+        solver._setup(orders_table, couriers, instrumentation or DISABLED, bundling)
+        return solver
 
-        arrives_to_point_at = courier_actual_time + 10 + abs(order.pickup_location_x - order.dropoff_location_x) + abs(
-            order.pickup_location_y - order.dropoff_location_y)
+    def _setup(self, orders_table, couriers, stats, bundling=False):
+        self._couriers = couriers
+        self._bundling = bundling
+        self._orders_table = orders_table
+        self._pickup_index = PickupGrid(orders_table)
+        self._stats = stats
+        # sum of revenue_from_completing_order over every taken order, equals the profit of the plan
+        self.total_revenue = 0
 
-        if arrives_to_point_at >= order.dropoff_to:
-            return None
+    time_when_picks_up = staticmethod(core.time_when_picks_up)
 
-        if arrives_to_point_at <= order.dropoff_from:
-            arrives_to_point_at += order.dropoff_from - arrives_to_point_at
-        return arrives_to_point_at
+    @staticmethod
+    def time_when_dropoffs_of(courier_actual_time: int, order: Order):
+        return core.time_when_dropoffs_of(courier_actual_time, order, strict_dropoff=True)
 
     def revenue_from_completing_order(self, courier: Courier, order: Order):
-        initial_time = courier.get_current_time()
-        arrives_to_pick_up_point = self.time_when_picks_up(courier, order)
-
-        if not arrives_to_pick_up_point:
-            return float('-inf')
-
-        arrives_to_dropoff_point = self.time_when_dropoffs_of(arrives_to_pick_up_point, order)
-        if not arrives_to_dropoff_point:
-            return float('-inf')
-
-        return order.payment - 2 * (arrives_to_dropoff_point - initial_time)
+        return core.revenue_from_completing_order(courier, order, strict_dropoff=True)
 
     def solve(self):
         answer = []
         num_orders_total = 0
+        stats = self._stats
         for idx, courier in enumerate(self._couriers):
-            orders = self._find_courier_path(courier)
+            sampled = stats.sampled()
+            started = time.perf_counter() if sampled else 0
+            orders = self._find_bundled_path(courier) if self._bundling else self._find_courier_path(courier)
+            if sampled:
+                stats.observe('courier', time.perf_counter() - started)
             answer.extend(orders)
             num_orders_total += len(orders)
-            print('Processed courier, {}, num_orders: {}'.format(idx, len(orders)))
-        print('Num total orders completed {}'.format(len(answer)))
+            stats.progress('courier', couriers_done=idx + 1, couriers=len(self._couriers), events=len(answer))
+        stats.progress('solved', force=True, orders_completed=len(answer) // 2)
         return answer
 
     def _find_courier_path(self, courier: Courier):
+        table = self._orders_table
+        enabled = self._stats.enabled
+        evaluations = pruned = score_seconds = select_seconds = 0
         paths = []
         answer = []
-        was_negative = False
         while True:
-            possible_revenues = {key: self.revenue_from_completing_order(courier, self._orders_map[key]) for key in
-                                 self._orders_map}
-            max_revenue_id = None
-            max_revenue_value = float('-inf')
-
-            for key in possible_revenues:
-                if possible_revenues[key] > max_revenue_value:
-                    max_revenue_id = key
-                    max_revenue_value = possible_revenues[key]
-
-            if max_revenue_value <= 0:
-                break
-            #
-            if max_revenue_value <= 0 and max_revenue_value == float('-inf') :
+            if enabled:
+                started = time.perf_counter()
+            current_time = courier.get_current_time()
+            candidate_rows = self._pickup_index.query(courier.location_x, courier.location_y, current_time)
+            if not len(candidate_rows):
                 break
 
-            if max_revenue_value <= 0 and not was_negative:
-                was_negative = True
-
-            new_order = self._orders_map.pop(max_revenue_id)
-            arrives_to_dropoff_point = self.time_when_dropoffs_of(self.time_when_picks_up(courier, new_order),
-                                                                  new_order)
-            courier.update_current_time(arrives_to_dropoff_point)
-            courier.update_current_pos(new_order.dropoff_location_x, new_order.dropoff_location_y)
-
-            paths.append(new_order)
+            possible_revenues = table.revenues(courier.location_x, courier.location_y, current_time,
+                                               rows=candidate_rows, strict_dropoff=True)
+            if enabled:
+                scored = time.perf_counter()
+                score_seconds += scored - started
+                evaluations += len(candidate_rows)
+                pruned += int(np.count_nonzero(possible_revenues == -np.inf))
+            max_revenue_idx = int(np.argmax(possible_revenues))
+            if possible_revenues[max_revenue_idx] <= 0:
+                break
 
-        for order in paths:
-            answer.append({
-                'courier_id': courier.id,
-                'action': 'pickup',
-                'order_id': order.order_id,
-                'point_id': order.pickup_point_id
-            })
+            row = int(candidate_rows[max_revenue_idx])
+            order_id = int(table.order_ids[row])
+            table.remove(order_id)
+            self._pickup_index.remove(order_id)
+            self.total_revenue += int(possible_revenues[max_revenue_idx])
+
+            arrives_to_dropoff_point = table.dropoff_times(courier.location_x, courier.location_y, current_time,
+                                                           rows=[row], strict_dropoff=True)[0]
+            courier.update_current_time(int(arrives_to_dropoff_point))
+            courier.update_current_pos(int(table.dropoff_x[row]), int(table.dropoff_y[row]))
+
+            paths.append(row)
+            if enabled:
+                select_seconds += time.perf_counter() - scored
+
+        if enabled:
+            emitted = time.perf_counter()
+        for row in paths:
+            answer.extend(core.order_events(courier.id, int(table.order_ids[row]), int(table.pickup_point_ids[row]),
+                                            int(table.dropoff_point_ids[row])))
+
+        if enabled:
+            stats = self._stats
+            stats.add_time(SCORE, score_seconds)
+            stats.add_time(SELECT, select_seconds)
+            stats.add_time(EMIT, time.perf_counter() - emitted)
+            stats.count(REVENUE_EVALUATIONS, evaluations)
+            stats.count(CANDIDATES_PRUNED, pruned)
+            stats.count(ORDERS_ASSIGNED, len(paths))
+        return answer
 
-            answer.append({
-                'courier_id': courier.id,
-                'action': 'dropoff',
-                'order_id': order.order_id,
-                'point_id': order.dropoff_point_id
-            })
+    def _find_bundled_path(self, courier: Courier):
+        table = self._orders_table
+        enabled = self._stats.enabled
+        evaluations = pruned = score_seconds = select_seconds = 0
+        route = StopRoute(table, courier.location_x, courier.location_y, courier.get_current_time())
+        while True:
+            if enabled:
+                started = time.perf_counter()
+            first = max(len(route) + 1 - _BUNDLE_STOPS, 0)
+            candidates = set()
+            for stop in range(first, len(route) + 1):
+                x, y, at = route.x[stop], route.y[stop], route.times[stop]
+                candidate_rows = self._pickup_index.query(x, y, at)
+                if not len(candidate_rows):
+                    continue
+                possible_revenues = table.revenues(x, y, at, rows=candidate_rows, strict_dropoff=True)
+                feasible = possible_revenues > -np.inf
+                if enabled:
+                    evaluations += len(candidate_rows)
+                    pruned += len(candidate_rows) - int(np.count_nonzero(feasible))
+                best = np.argsort(-possible_revenues, kind='stable')[:_BUNDLE_CANDIDATES]
+                candidates.update(candidate_rows[best[feasible[best]]].tolist())
+            if enabled:
+                scored = time.perf_counter()
+                score_seconds += scored - started
+
+            best_move = None
+            for row in sorted(candidates):
+                move = route.best_insertion(row, first + 1)
+                if move is not None and (best_move is None or move[0] > best_move[0]):
+                    best_move = move + (row,)
+            if best_move is None or best_move[0] <= 0:
+                break
 
+            gain, i, j, row = best_move
+            route.insert(row, i, j)
+            table.remove(int(table.order_ids[row]))
+            self._pickup_index.remove(int(table.order_ids[row]))
+            self.total_revenue += gain
+            if enabled:
+                select_seconds += time.perf_counter() - scored
+
+        if enabled:
+            emitted = time.perf_counter()
+        courier.update_current_time(route.end_time)
+        courier.update_current_pos(route.x[-1], route.y[-1])
+        answer = [core.event(courier.id, 'pickup' if pickup else 'dropoff', int(table.order_ids[row]),
+                             int(table.pickup_point_ids[row] if pickup else table.dropoff_point_ids[row]))
+                  for row, pickup in zip(route.rows[1:], route.is_pickup[1:])]
+
+        if enabled:
+            stats = self._stats
+            stats.add_time(SCORE, score_seconds)
+            stats.add_time(SELECT, select_seconds)
+            stats.add_time(EMIT, time.perf_counter() - emitted)
+            stats.count(REVENUE_EVALUATIONS, evaluations)
+            stats.count(CANDIDATES_PRUNED, pruned)
+            stats.count(ORDERS_ASSIGNED, len(answer) // 2)
         return answer
 
-
 if __name__ == '__main__':
     solver = GreedyByUser('../example/contest_input.json')
+    plan = solver.solve()
+    print('Num total orders completed {}'.format(len(plan) // 2))
     with open('../example/contest_output_greedy_by_user_2.json', 'w') as outfile:
-        json.dump(solver.solve(), outfile)
\ No newline at end of file
+        json.dump(plan, outfile)
\ No newline at end of file
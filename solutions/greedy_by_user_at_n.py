@@ -1,7 +1,12 @@
 import json
 import random
+import time
 
-from data_wrappers import Courier, Order
+from data_wrappers import Courier, Order, load_instance, new_couriers
+from solutions import core
+from solutions.instrumentation import (CANDIDATES_PRUNED, DISABLED, EMIT, LOAD, ORDERS_ASSIGNED,
+                                       REVENUE_EVALUATIONS, SCORE, SELECT)
+from solutions.spatial_index import PickupGrid
 from collections import namedtuple
 
 CompletedOrderInfo = namedtuple('OrderInfo', ['courier_id', 'order_id', 'revenue'])
@@ -13,88 +18,66 @@ def calculate_manhattan_dist(order: Order):
 
 
 class GreedyByUserAtN:
-    def __init__(self, data_path):
-        with open(data_path) as f:
-            data = json.loads(f.read())
+    def __init__(self, data_path, instrumentation=None):
+        self._stats = instrumentation or DISABLED
+        with self._stats.phase(LOAD):
+            instance = load_instance(data_path)
 
-        self._orders_map = {order.order_id: order for order in [Order(x) for x in data['orders']]}
-        print(len(self._orders_map))
+            # orders are never mutated, both maps share the same objects
+            self._orders_immutable_map = {order.order_id: order for order in instance.orders.to_orders()}
+            self._orders_map = dict(self._orders_immutable_map)
 
-        self._couriers = [Courier(x) for x in data['couriers']]
-        random.shuffle(self._couriers)
+            self._couriers = new_couriers(instance.couriers)
+            random.shuffle(self._couriers)
 
-        self._orders_immutable_map = {order.order_id: order for order in [Order(x) for x in data['orders']]}
+            self._orders_table = instance.orders
+            self._pickup_index = PickupGrid(self._orders_table)
+        # revenue evaluations and infeasible candidates of the lookahead, summed only when instrumented
+        self._lookahead_evaluations = self._lookahead_pruned = 0
 
-    @staticmethod
-    def time_when_picks_up(courier: Courier, order: Order):
-        if not courier.get_current_time():
-            return None
-
-        if courier.get_current_time() > order.pickup_to:
-            return None
-
-        arrives_to_point_at = courier.get_current_time() + 10 + abs(courier.location_x - order.pickup_location_x) + abs(
-            courier.location_y - order.pickup_location_y)
-
-        if arrives_to_point_at > order.pickup_to:
-            return None
-        if arrives_to_point_at < order.pickup_from:
-            arrives_to_point_at += order.pickup_from - arrives_to_point_at
-        return arrives_to_point_at
-
-    @staticmethod
-    def time_when_dropoffs_of(courier_actual_time: int, order: Order):
-        if not courier_actual_time:
-            return None
-        if courier_actual_time > order.dropoff_to:
-            return None
-
-        arrives_to_point_at = courier_actual_time + 10 + abs(order.pickup_location_x - order.dropoff_location_x) + abs(
-            order.pickup_location_y - order.dropoff_location_y)
-
-        if arrives_to_point_at > order.dropoff_to:
-            return None
+    time_when_picks_up = staticmethod(core.time_when_picks_up)
 
-        if arrives_to_point_at < order.dropoff_from:
-            arrives_to_point_at += order.dropoff_from - arrives_to_point_at
-        return arrives_to_point_at
+    time_when_dropoffs_of = staticmethod(core.time_when_dropoffs_of)
 
     def revenue_from_completing_order(self, courier: Courier, order: Order):
-        initial_time = courier.get_current_time()
-        arrives_to_pick_up_point = self.time_when_picks_up(courier, order)
-
-        if not arrives_to_pick_up_point:
-            return float('-inf')
-
-        arrives_to_dropoff_point = self.time_when_dropoffs_of(arrives_to_pick_up_point, order)
-        if not arrives_to_dropoff_point:
-            return float('-inf')
-
-        return order.payment - 2 * (arrives_to_dropoff_point - initial_time)
+        return core.revenue_from_completing_order(courier, order)
 
     def solve(self):
         answer = []
         num_orders_total = 0
+        stats = self._stats
         for idx, courier in enumerate(self._couriers):
+            sampled = stats.sampled()
+            started = time.perf_counter() if sampled else 0
             orders = self._find_courier_path(courier)
+            if sampled:
+                stats.observe('courier', time.perf_counter() - started)
             answer.extend(orders)
             num_orders_total += len(orders)
-            print('Processed courier, {}, num_orders: {}'.format(idx, len(orders)))
-        print('Num total orders completed {}'.format(len(answer)))
+            stats.progress('courier', couriers_done=idx + 1, couriers=len(self._couriers), events=len(answer))
+        stats.progress('solved', force=True, orders_completed=len(answer) // 2)
         return answer
 
     def _find_courier_path(self, courier: Courier):
+        enabled = self._stats.enabled
+        evaluations = pruned = score_seconds = select_seconds = 0
         paths = []
         answer = []
 
         while True:
+            if enabled:
+                started = time.perf_counter()
             possible_revenues = {key: self.revenue_from_completing_order(courier, self._orders_map[key]) for key in
-                                 self._orders_map}
+                                 self._candidate_keys(courier)}
+            if enabled:
+                scored = time.perf_counter()
+                score_seconds += scored - started
+                evaluations += len(possible_revenues)
+                pruned += sum(1 for revenue in possible_revenues.values() if revenue == float('-inf'))
             constructed_path = []
             max_revenue_value = float('-inf')
 
             for key in possible_revenues:
-                print(key)
                 order = self._orders_map[key]
                 revenue_from_point = possible_revenues[key]
                 second_point_id, second_point_revenue = self._simulate_2nd_transition(courier, order)
@@ -111,14 +94,16 @@ class GreedyByUserAtN:
 
                     max_revenue_value = found_revenue
 
+            if enabled:
+                select_seconds += time.perf_counter() - scored
             if max_revenue_value < 0:
                 break
 
             if constructed_path:
-                first_order = self._orders_map.pop(constructed_path[0])
+                first_order = self._take_order(constructed_path[0])
                 second_order = None
                 if len(constructed_path) > 1:
-                    second_order = self._orders_map.pop(constructed_path[1])
+                    second_order = self._take_order(constructed_path[1])
 
                 self._make_courier_transition(courier, first_order)
                 paths.append(first_order)
@@ -127,23 +112,35 @@ class GreedyByUserAtN:
                     self._make_courier_transition(courier, second_order)
                     paths.append(second_order)
 
+        if enabled:
+            emitted = time.perf_counter()
         for order in paths:
-            answer.append({
-                'courier_id': courier.id,
-                'action': 'pickup',
-                'order_id': order.order_id,
-                'point_id': order.pickup_point_id
-            })
-
-            answer.append({
-                'courier_id': courier.id,
-                'action': 'dropoff',
-                'order_id': order.order_id,
-                'point_id': order.dropoff_point_id
-            })
-
+            answer.extend(core.order_events(courier.id, order.order_id, order.pickup_point_id, order.dropoff_point_id))
+
+        if enabled:
+            stats = self._stats
+            stats.add_time(SCORE, score_seconds)
+            # the lookahead scores second orders while selecting the first one
+            stats.add_time(SELECT, select_seconds)
+            stats.add_time(EMIT, time.perf_counter() - emitted)
+            stats.count(REVENUE_EVALUATIONS, evaluations + self._lookahead_evaluations)
+            stats.count(CANDIDATES_PRUNED, pruned + self._lookahead_pruned)
+            stats.count(ORDERS_ASSIGNED, len(paths))
+            self._lookahead_evaluations = self._lookahead_pruned = 0
         return answer
 
+    def _candidate_keys(self, courier):
+        # only orders whose pickup the courier can still reach in time, in the same order as in _orders_map
+        if not courier.get_current_time():
+            return []
+        rows = self._pickup_index.query(courier.location_x, courier.location_y, courier.get_current_time())
+        return self._orders_table.order_ids[rows].tolist()
+
+    def _take_order(self, order_id):
+        self._orders_table.remove(order_id)
+        self._pickup_index.remove(order_id)
+        return self._orders_map.pop(order_id)
+
     def _make_courier_transition(self, courier, order):
         arrives_to_dropoff_point = self.time_when_dropoffs_of(self.time_when_picks_up(courier, order),
                                                               order)
@@ -161,7 +158,10 @@ class GreedyByUserAtN:
         self._make_courier_transition(courier, found_order)
 
         new_possible_revenues = {key: self.revenue_from_completing_order(courier, self._orders_map[key]) for key in
-                                 self._orders_map if key != found_order.order_id}
+                                 self._candidate_keys(courier) if key != found_order.order_id}
+        if self._stats.enabled:
+            self._lookahead_evaluations += len(new_possible_revenues)
+            self._lookahead_pruned += sum(1 for revenue in new_possible_revenues.values() if revenue == float('-inf'))
 
         max_revenue_id = None
         max_revenue_value = float('-inf')
@@ -182,5 +182,7 @@ class GreedyByUserAtN:
 
 if __name__ == '__main__':
     solver = GreedyByUserAtN('../example/input.json')
+    plan = solver.solve()
+    print('Num total orders completed {}'.format(len(plan) // 2))
     with open('../example/output.json', 'w') as outfile:
-        json.dump(solver.solve(), outfile)
+        json.dump(plan, outfile)
@@ -1,138 +1,187 @@
 import json
+import time
+
 import numpy as np
-import sys
-from munkres import Munkres, make_cost_matrix, DISALLOWED
 
-from data_wrappers import Courier, Order
+from data_wrappers import Courier, Order, load_instance, new_couriers
+from solutions import core
+from solutions.checkpoint import CheckpointLog
+from solutions.instrumentation import (CANDIDATES_PRUNED, DISABLED, EMIT, LOAD, ORDERS_ASSIGNED,
+                                       REVENUE_EVALUATIONS, SCORE, SELECT)
+from solutions.sparse_assignment import max_revenue_assignment, top_k_profitable
 from collections import namedtuple
 
 CompletedOrderInfo = namedtuple('OrderInfo', ['courier_id', 'order_id', 'revenue'])
 
+# couriers scored against all orders at once, bounds the dense revenue block kept in memory
+COURIERS_PER_BLOCK = 128
 
-class HungarianSearch:
-    def __init__(self, data_path):
-        with open(data_path) as f:
-            data = json.loads(f.read())
 
-        self._couriers = [Courier(x) for x in data['couriers']]
-        self._orders = [Order(x) for x in data['orders']]
+class HungarianSearch:
+    """
+    Rounds of maximum revenue assignments of one order to every courier.
 
-        self._orders_immutable_map = {order.order_id: order for order in self._orders}
+    solve is anytime: with time_limit it returns the plan of the rounds completed within that many seconds.
+    With checkpoint_path every round is appended to a CheckpointLog there, and a run over the same input and
+    top_k continues from the last round logged, couriers and remaining orders restored from the log.
+    """
 
-        self.m = Munkres()
+    def __init__(self, data_path, top_k=20, time_limit=None, checkpoint_path=None, fsync_interval=5.0,
+                 instrumentation=None):
+        self._stats = instrumentation or DISABLED
+        with self._stats.phase(LOAD):
+            instance = load_instance(data_path)
+            self._data_path = data_path
 
-    @staticmethod
-    def time_when_picks_up(courier: Courier, order: Order):
-        if courier.get_current_time() > order.pickup_to:
-            return None
-        arrives_to_point_at = courier.get_current_time() + 10 + abs(courier.location_x - order.pickup_location_x) + abs(
-            courier.location_y - order.pickup_location_y)
-        if arrives_to_point_at > order.pickup_to:
-            return None
-        if arrives_to_point_at < order.pickup_from:
-            arrives_to_point_at += order.pickup_from - arrives_to_point_at
-        return arrives_to_point_at
+            self._couriers = new_couriers(instance.couriers)
+            self._orders = instance.orders.to_orders()
 
-    @staticmethod
-    def time_when_dropoffs_of(courier_actual_time: int, order: Order):
-        if courier_actual_time > order.dropoff_to:
-            return None
+            self._orders_immutable_map = {order.order_id: order for order in self._orders}
+            self._orders_table = instance.orders
 
-        arrives_to_point_at = courier_actual_time + 10 + abs(order.pickup_location_x - order.dropoff_location_x) + abs(
-            order.pickup_location_y - order.dropoff_location_y)
+        self._top_k = top_k
+        self._time_limit = time_limit
+        self._checkpoint_path = checkpoint_path
+        self._fsync_interval = fsync_interval
+        # courier id -> (x, y, time) it was scored at, table rows and revenues of its top_k orders
+        self._candidates = {}
 
-        if arrives_to_point_at > order.dropoff_to:
-            return None
+    time_when_picks_up = staticmethod(core.time_when_picks_up)
 
-        if arrives_to_point_at < order.dropoff_from:
-            arrives_to_point_at += order.dropoff_from - arrives_to_point_at
-        return arrives_to_point_at
+    time_when_dropoffs_of = staticmethod(core.time_when_dropoffs_of)
 
     def revenue_from_completing_order(self, courier: Courier, order: Order):
-        initial_time = courier.get_current_time()
-        arrives_to_pick_up_point = self.time_when_picks_up(courier, order)
-
-        if not arrives_to_pick_up_point:
-            return float('-inf')
-
-        arrives_to_dropoff_point = self.time_when_dropoffs_of(arrives_to_pick_up_point, order)
-        if not arrives_to_dropoff_point:
-            return float('-inf')
-
-        return order.payment - 2 * (arrives_to_dropoff_point - initial_time)
+        return core.revenue_from_completing_order(courier, order)
 
     def solve(self):
-        num_rounds = 0
+        started = time.perf_counter()
         answer = []
-
-        while True:
-            new_match = self._find_optimal_match()
-            if not new_match:
-                break
-            used_orders = set()
-            completed_orders = []
-
-            for row, column in new_match:
-                courier = self._couriers[row]
-                order = self._orders[column]
-
-                arrives_to_dropoff_point = self.time_when_dropoffs_of(self.time_when_picks_up(courier, order), order)
-                courier.update_current_time(arrives_to_dropoff_point)
-                courier.update_current_pos(order.dropoff_location_x, order.dropoff_location_y)
-                completed_orders.append((courier, order))
-                used_orders.add(column)
-
-            self._orders = [x for idx, x in enumerate(self._orders) if idx not in used_orders]
-
-            for courier, order in completed_orders:
-                answer.append({
-                    'courier_id': courier.id,
-                    'action': 'pickup',
-                    'order_id': order.order_id,
-                    'point_id': order.pickup_point_id
-                })
-
-                answer.append({
-                    'courier_id': courier.id,
-                    'action': 'dropoff',
-                    'order_id': order.order_id,
-                    'point_id': order.dropoff_point_id
-                })
-
-            num_rounds += 1
-            print('Rounds completed: {}'.format(num_rounds))
-            with open('../example/output_{}.json'.format(num_rounds), 'w') as outfile:
-                json.dump(answer, outfile)
+        log = None
+        if self._checkpoint_path:
+            log = CheckpointLog(self._checkpoint_path, self._data_path, {'solver': 'HungarianSearch',
+                                                                         'top_k': self._top_k},
+                                self._fsync_interval)
+            self._restore(log.load(), answer)
+
+        stats = self._stats
+        try:
+            num_rounds = 0
+            while log is None or not log.finished:
+                if self._time_limit is not None and time.perf_counter() - started >= self._time_limit:
+                    break
+                round_started = time.perf_counter()
+                new_match, scored_at = self._find_optimal_match()
+                if not new_match:
+                    if log is not None:
+                        log.finish()
+                    break
+                used_orders = set()
+                completed_orders = []
+
+                for row, column in new_match:
+                    courier = self._couriers[row]
+                    order = self._orders[column]
+
+                    arrives_to_dropoff_point = self.time_when_dropoffs_of(self.time_when_picks_up(courier, order),
+                                                                          order)
+                    courier.update_current_time(arrives_to_dropoff_point)
+                    courier.update_current_pos(order.dropoff_location_x, order.dropoff_location_y)
+                    completed_orders.append((courier, order))
+                    used_orders.add(column)
+                    self._orders_table.remove(order.order_id)
+
+                self._orders = [x for idx, x in enumerate(self._orders) if idx not in used_orders]
+                selected = time.perf_counter()
+                stats.add_time(SELECT, selected - scored_at)
+                stats.count(ORDERS_ASSIGNED, len(completed_orders))
+
+                round_events = []
+                for courier, order in completed_orders:
+                    round_events.extend(core.order_events(courier.id, order.order_id, order.pickup_point_id,
+                                                          order.dropoff_point_id))
+                answer.extend(round_events)
+                if log is not None:
+                    log.append(round_events, [(courier.id, courier.location_x, courier.location_y,
+                                               courier.get_current_time()) for courier, _ in completed_orders])
+
+                num_rounds += 1
+                stats.add_time(EMIT, time.perf_counter() - selected)
+                stats.observe('round', time.perf_counter() - round_started)
+                stats.progress('round', force=True, rounds=num_rounds, orders_assigned=len(completed_orders))
+        finally:
+            if log is not None:
+                log.close()
         return answer
 
+    def _restore(self, rounds, answer):
+        """Replays logged rounds: their events go to answer, their orders are taken and couriers moved."""
+        couriers = {courier.id: courier for courier in self._couriers}
+        for record in rounds:
+            answer.extend(record['events'])
+            for event in record['events']:
+                if event['action'] == 'dropoff':
+                    self._orders_table.remove(event['order_id'])
+            for courier_id, x, y, current_time in record['couriers']:
+                couriers[courier_id].update_current_pos(x, y)
+                couriers[courier_id].update_current_time(current_time)
+        if rounds:
+            alive = self._orders_table.alive
+            self._orders = [order for order in self._orders if alive[self._orders_table.row_of(order.order_id)]]
+            self._stats.progress('restored', force=True, rounds=len(rounds), checkpoint=self._checkpoint_path)
+
     def _find_optimal_match(self):
-        matrix = [[0 for _ in range(len(self._orders))] for _ in range(len(self._couriers))]
-        viewed_rows = {i: 0 for i in range(len(self._couriers))}
-
-        for i, courier in enumerate(self._couriers):
-            for j, order in enumerate(self._orders):
-                revenue_from_completion = self.revenue_from_completing_order(courier, order)
-                if revenue_from_completion == float('-inf'):
-                    matrix[i][j] = DISALLOWED
-                else:
-                    matrix[i][j] = revenue_from_completion
-        elements_to_remove = [x for x in viewed_rows if viewed_rows[x] == len(self._orders)]
-        matrix = np.delete(matrix, elements_to_remove, axis=0)
-        if elements_to_remove:
-            self._couriers = [x for idx, x in enumerate(self._couriers) if idx not in elements_to_remove]
-        if matrix.size == 0:
-            return None
-
-        cost_matrix = make_cost_matrix(matrix,
-                                       lambda cost: (sys.maxsize - cost) if (cost != DISALLOWED) else DISALLOWED)
-        indexes = self.m.compute(cost_matrix)
+        """
+        Maximum revenue assignment of couriers to remaining orders as (courier index, order index) pairs, None
+        once no courier has a profitable order, together with the time scoring ended.
+
+        The top_k orders of a courier are kept between rounds and scored again only after the courier moved or
+        one of them was taken: otherwise neither its revenues nor its best remaining orders have changed.
+        """
+        table = self._orders_table
+        alive = table.alive
+        stats = self._stats
+        started = time.perf_counter()
+        stale = []
+        for courier in self._couriers:
+            cached = self._candidates.get(courier.id)
+            if (cached is None or cached[0] != (courier.location_x, courier.location_y, courier.get_current_time())
+                    or not alive[cached[1]].all()):
+                stale.append(courier)
+        for start in range(0, len(stale), COURIERS_PER_BLOCK):
+            block = stale[start:start + COURIERS_PER_BLOCK]
+            times = [c.get_current_time() for c in block]
+            # orders none of the block can reach before their pickup window closes are not scored
+            rows = np.flatnonzero(alive & (table.pickup_to >= min(times) + 10))
+            revenues = table.revenues_block([c.location_x for c in block], [c.location_y for c in block], times,
+                                            rows)
+            if stats.enabled:
+                stats.count(REVENUE_EVALUATIONS, revenues.size)
+                stats.count(CANDIDATES_PRUNED, int(np.count_nonzero(revenues == -np.inf)))
+            for courier, (columns, row_revenues) in zip(block, top_k_profitable(revenues, self._top_k)):
+                self._candidates[courier.id] = ((courier.location_x, courier.location_y, courier.get_current_time()),
+                                                rows[columns], row_revenues)
+        # remaining orders are exactly the alive rows of the table, in the same order as self._orders
+        positions = np.cumsum(alive) - 1
+        candidates = [(positions[self._candidates[courier.id][1]], self._candidates[courier.id][2])
+                      for courier in self._couriers]
+        # the assignment below counts as selecting, solve takes it from here
+        scored_at = time.perf_counter()
+        stats.add_time(SCORE, scored_at - started)
+
+        # an unassigned courier keeps its position and time, so one without profitable orders never gets any
+        idle = {idx for idx, (columns, _) in enumerate(candidates) if not len(columns)}
+        if idle:
+            self._couriers = [x for idx, x in enumerate(self._couriers) if idx not in idle]
+            candidates = [x for idx, x in enumerate(candidates) if idx not in idle]
+        if not candidates:
+            return None, scored_at
+
+        indexes = max_revenue_assignment(candidates)
         if not indexes:
-            return None
-        return indexes
-
+            return None, scored_at
+        return indexes, scored_at
 
 if __name__ == '__main__':
-    solver = HungarianSearch('../example/contest_input.json')
-    solver.solve()
-    # with open('../example/contest_output.json', 'w') as outfile:
-    #     json.dump(solver.solve(), outfile)
+    solver = HungarianSearch('../example/contest_input.json', checkpoint_path='../example/contest_hungarian.jsonl')
+    with open('../example/contest_output_hungarian.json', 'w') as outfile:
+        json.dump(solver.solve(), outfile)
@@ -0,0 +1,122 @@
+from data_wrappers import OrderTable
+
+_UNBOUNDED = 1 << 40
+
+
+class StopRoute:
+    """
+    Route of a courier as a sequence of stops, the pickup and dropoff points of OrderTable rows in any order
+    that has every pickup before its dropoff, so a courier can carry several orders at once. Stop 0 is the
+    start of the courier.
+
+    Per stop the route keeps the time the courier serves it (arriving early, it waits for the window to open),
+    the waiting before it, its slack (how much later it could be served without any stop from it on being
+    late) and the waiting after it. A new order's pickup and dropoff can go before any two stops i <= j: the
+    pickup delays stop i, and the delay shrinks by the waiting of every later stop. So a pair (i, j) is
+    checked in O(1) against the slack of the first stop it delays, and the new end of the route is the old
+    one plus whatever delay is left over after the waiting at the end. All pairs of one pickup position take
+    O(route length).
+    """
+
+    def __init__(self, table: OrderTable, x, y, start_time):
+        self._table = table
+        self.rows = [-1]
+        self.is_pickup = [False]
+        self.x = [x]
+        self.y = [y]
+        self.opens = [start_time]
+        self.closes = [start_time]
+        self._update()
+
+    def __len__(self):
+        """Number of stops without the start."""
+        return len(self.rows) - 1
+
+    @property
+    def end_time(self):
+        return self.times[-1]
+
+    def _stop(self, row, pickup):
+        table = self._table
+        if pickup:
+            return (int(table.pickup_x[row]), int(table.pickup_y[row]), int(table.pickup_from[row]),
+                    int(table.pickup_to[row]))
+        return (int(table.dropoff_x[row]), int(table.dropoff_y[row]), int(table.dropoff_from[row]),
+                int(table.dropoff_to[row]))
+
+    def _update(self):
+        xs, ys, opens = self.x, self.y, self.opens
+        self.times = times = [opens[0]]
+        self.waits = waits = [0]
+        for k in range(1, len(xs)):
+            arrives = times[-1] + 10 + abs(xs[k] - xs[k - 1]) + abs(ys[k] - ys[k - 1])
+            times.append(max(arrives, opens[k]))
+            waits.append(times[-1] - arrives)
+        self.slack = slack = [_UNBOUNDED] * len(xs)
+        self.waits_after = waits_after = [0] * len(xs)
+        for k in range(len(xs) - 1, 0, -1):
+            slack[k] = self.closes[k] - times[k]
+            if k + 1 < len(xs):
+                slack[k] = min(slack[k], waits[k + 1] + slack[k + 1])
+                waits_after[k] = waits[k + 1] + waits_after[k + 1]
+
+    def best_insertion(self, row, first=1):
+        """
+        (gain, i, j) of the best insertion of the order with the pickup going before stop i >= first and the
+        dropoff before stop j >= i (len(self) + 1 is the end of the route), None if it fits nowhere. The gain
+        is the payment minus the wage of the time the route gets longer by.
+        """
+        px, py, p_open, p_close = self._stop(row, True)
+        dx, dy, d_open, d_close = self._stop(row, False)
+        payment = int(self._table.payment[row])
+        xs, ys, times, opens, waits, slack, waits_after = (self.x, self.y, self.times, self.opens, self.waits,
+                                                           self.slack, self.waits_after)
+        size = len(xs)
+        end = times[-1]
+        best = None
+        for i in range(max(first, 1), size + 1):
+            pickup_at = times[i - 1] + 10 + abs(xs[i - 1] - px) + abs(ys[i - 1] - py)
+            if pickup_at > p_close:
+                continue
+            pickup_at = max(pickup_at, p_open)
+            delay = 0
+            if i < size:
+                # delay of stop i with only the pickup in, the dropoff can only add to it
+                delay = max(pickup_at + 10 + abs(px - xs[i]) + abs(py - ys[i]), opens[i]) - times[i]
+                if delay > slack[i]:
+                    continue
+
+            before_at, before_x, before_y = pickup_at, px, py
+            for j in range(i, size + 1):
+                if j > i:
+                    # the stop before the dropoff is stop j - 1, delayed by the pickup
+                    if j - 1 > i:
+                        delay = max(0, delay - waits[j - 1])
+                    before_at, before_x, before_y = times[j - 1] + delay, xs[j - 1], ys[j - 1]
+                dropoff_at = before_at + 10 + abs(before_x - dx) + abs(before_y - dy)
+                if dropoff_at > d_close:
+                    continue
+                dropoff_at = max(dropoff_at, d_open)
+                if j < size:
+                    shifted = max(dropoff_at + 10 + abs(dx - xs[j]) + abs(dy - ys[j]), opens[j]) - times[j]
+                    if shifted > slack[j]:
+                        continue
+                    new_end = end + max(0, shifted - waits_after[j])
+                else:
+                    new_end = dropoff_at
+                gain = payment - 2 * (new_end - end)
+                if best is None or gain > best[0]:
+                    best = (gain, i, j)
+        return best
+
+    def insert(self, row, i, j):
+        """Inserts the pickup of the order before stop i and its dropoff before stop j, as best_insertion."""
+        for position, pickup in ((j, False), (i, True)):
+            x, y, opens, closes = self._stop(row, pickup)
+            self.rows.insert(position, row)
+            self.is_pickup.insert(position, pickup)
+            self.x.insert(position, x)
+            self.y.insert(position, y)
+            self.opens.insert(position, opens)
+            self.closes.insert(position, closes)
+        self._update()
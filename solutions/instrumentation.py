@@ -0,0 +1,141 @@
+import contextlib
+import cProfile
+import json
+import math
+import pstats
+import time
+from collections import Counter, defaultdict
+
+# counters every solver keeps
+REVENUE_EVALUATIONS = 'revenue_evaluations'
+CANDIDATES_PRUNED = 'candidates_pruned'
+ORDERS_ASSIGNED = 'orders_assigned'
+
+# phases of a solver run
+LOAD, SCORE, SELECT, EMIT = 'load', 'score', 'select', 'emit'
+
+
+class Instrumentation:
+    """
+    Counters, phase timers, sampled latency histograms and progress events of a solver run.
+
+    Solvers take one as instrumentation and use DISABLED by default. Hot loops read enabled once and keep all
+    bookkeeping under `if enabled:`, summing per step and reporting per courier or round, so a disabled run pays
+    a branch per step and nothing per candidate. Latency of a unit of work (routing a courier, a round) is only
+    timed for the units sampled() picks: the first one and then every sample_every-th. Progress events are kept
+    at most every progress_interval seconds (and always with force) and passed to on_progress if given.
+    """
+
+    def __init__(self, enabled=True, sample_every=10, progress_interval=1.0, on_progress=None):
+        self.enabled = enabled
+        self._sample_every = sample_every
+        self._units = 0
+        self._progress_interval = progress_interval
+        self._on_progress = on_progress
+        self._started = time.perf_counter()
+        self._progress_at = None
+
+        self.counters = Counter()
+        self.phase_seconds = defaultdict(float)
+        # histogram -> {bucket: count}, bucket k holds latencies in [2 ** k, 2 ** (k + 1)) microseconds
+        self.histograms = defaultdict(Counter)
+        self._latency_totals = defaultdict(float)
+        self._latency_max = defaultdict(float)
+        self.progress_events = []
+        self.profile_stats = None
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def add_time(self, phase, seconds):
+        if self.enabled:
+            self.phase_seconds[phase] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the block into phase name, for coarse phases outside of the hot loops."""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] += time.perf_counter() - started
+
+    def sampled(self):
+        """Whether to time the next unit of work, always False when disabled."""
+        if not self.enabled:
+            return False
+        self._units += 1
+        return self._units % self._sample_every == 1 % self._sample_every
+
+    def observe(self, histogram, seconds):
+        if not self.enabled:
+            return
+        microseconds = seconds * 1e6
+        self.histograms[histogram][max(0, int(math.log2(microseconds))) if microseconds >= 1 else 0] += 1
+        self._latency_totals[histogram] += seconds
+        self._latency_max[histogram] = max(self._latency_max[histogram], seconds)
+
+    def progress(self, event, force=False, **fields):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if not force and self._progress_at is not None and now - self._progress_at < self._progress_interval:
+            return
+        self._progress_at = now
+        record = dict(fields, event=event, elapsed=round(now - self._started, 3))
+        self.progress_events.append(record)
+        if self._on_progress is not None:
+            self._on_progress(record)
+
+    @contextlib.contextmanager
+    def profile(self, path=None):
+        """Runs the block under cProfile, the stats are kept in profile_stats and dumped to path if given."""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.profile_stats = pstats.Stats(profiler)
+            if path is not None:
+                self.profile_stats.dump_stats(path)
+
+    def report(self):
+        return {
+            'elapsed': round(time.perf_counter() - self._started, 6),
+            'counters': dict(self.counters),
+            'phases': {name: round(seconds, 6) for name, seconds in self.phase_seconds.items()},
+            'latency': {name: self._histogram_summary(name) for name in self.histograms},
+            'progress': list(self.progress_events),
+        }
+
+    def write_report(self, path):
+        with open(path, 'w') as outfile:
+            json.dump(self.report(), outfile, indent=2)
+
+    def _histogram_summary(self, name):
+        buckets = self.histograms[name]
+        count = sum(buckets.values())
+        summary = {
+            'count': count,
+            'mean_us': round(self._latency_totals[name] / count * 1e6, 1),
+            'max_us': round(self._latency_max[name] * 1e6, 1),
+            'buckets_us': {'{}-{}'.format(2 ** bucket if bucket else 0, 2 ** (bucket + 1)): buckets[bucket]
+                           for bucket in sorted(buckets)},
+        }
+        # upper bound of the bucket the quantile falls into
+        for quantile in (50, 90, 99):
+            seen = 0
+            for bucket in sorted(buckets):
+                seen += buckets[bucket]
+                if seen * 100 >= quantile * count:
+                    summary['p{}_us'.format(quantile)] = 2 ** (bucket + 1)
+                    break
+        return summary
+
+
+DISABLED = Instrumentation(enabled=False)
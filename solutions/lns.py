@@ -0,0 +1,280 @@
+import json
+import math
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from data_wrappers import OrderTable, load_instance, new_couriers
+from solutions.greedy_by_user import GreedyByUser
+from solutions.core import join_runs, run_profit
+from solutions.local_search import LocalSearch
+from solutions.multi_start import order_couriers
+from solutions.order_graph import load_order_graph
+
+IslandStats = namedtuple('IslandStats', ['island', 'seed', 'start_profit', 'profit', 'iterations', 'accepted',
+                                         'migrations'])
+LnsResult = namedtuple('LnsResult', ['plan', 'profit', 'islands'])
+
+DESTROY_OPERATORS = ('random', 'spatial', 'time', 'worst')
+
+
+class LnsIsland(LocalSearch):
+    """
+    Large neighbourhood search on the routes of LocalSearch, started from the LocalSearch optimum of the plan.
+
+    Every iteration removes min_removed..max_removed orders with one of the DESTROY_OPERATORS: random ones, the
+    ones closest to a random order in space (pickup and dropoff points) or in time (dropoff time on their routes),
+    or the ones whose removal costs the least. The removed orders and their unassigned graph neighbours are then
+    inserted back GreedyByUser-style, best paying first, each at its most profitable position (LocalSearch
+    insertion, where the routes the orders came from are open at every position) and with polish the orders
+    that were moved get LocalSearch moves. The new plan is accepted by simulated annealing, the temperature
+    falls geometrically from start_temperature to end_temperature over time_limit seconds; rejected iterations
+    are undone from a journal of the routes they changed. Plans are exchanged with other islands every
+    migration_interval seconds. With target_gap the search stops early once the best plan is within that share
+    of the upper bound of the instance, as in LocalSearch, which on dense instances rarely happens.
+    """
+
+    def __init__(self, data_path, plan=None, time_limit=10.0, neighbours=20, seed=0, min_removed=5, max_removed=30,
+                 start_temperature=100.0, end_temperature=1.0, migration_interval=5.0, polish=True, target_gap=None):
+        super().__init__(data_path, plan, time_limit, neighbours, seed, target_gap=target_gap)
+        self._polish = polish
+        self._repaired = set()
+        self._migration_interval = migration_interval
+        self._min_removed = min_removed
+        self._max_removed = max_removed
+        self._start_temperature = start_temperature
+        self._end_temperature = end_temperature
+        # rows of the routes an iteration changed, as they were before it
+        self._journal = {}
+        self._servable = set(self._movable)
+        self.iterations = self.accepted = self.migrations = 0
+
+    def search(self, exchange=None):
+        """
+        Runs for time_limit seconds, leaves the best plan found in the routes and returns its profit.
+        exchange(profit, routes) is called now and then with the best plan so far and returns a better plan
+        from elsewhere as (profit, routes) or None.
+        """
+        started = time.perf_counter()
+        # the annealing starts from a local optimum
+        self._descend(self._movable, range(len(self._routes)), started + self._time_limit)
+        migrated_at = started
+        current = best = self.total_revenue
+        best_routes = self._route_rows()
+        self._journal = {}
+
+        while True:
+            now = time.perf_counter()
+            elapsed = (now - started) / self._time_limit if self._time_limit else 1.0
+            if elapsed >= 1.0 or best >= self._target:
+                break
+            if exchange is not None and now - migrated_at >= self._migration_interval:
+                migrated_at = now
+                received = exchange(best, best_routes)
+                if received is not None and received[0] > best:
+                    best, best_routes = received
+                    self._load_routes(best_routes)
+                    current = best
+                    self.migrations += 1
+
+            temperature = self._start_temperature * (self._end_temperature / self._start_temperature) ** elapsed
+            operator = self._random.choice(DESTROY_OPERATORS)
+            count = self._random.randint(self._min_removed, self._max_removed)
+            self._repair(self._destroy(operator, count))
+            self.iterations += 1
+            if self._polish:
+                self._descend(self._repaired, self._journal, started + self._time_limit)
+
+            profit = self.total_revenue
+            if profit >= current or self._random.random() < math.exp((profit - current) / temperature):
+                current = profit
+                self.accepted += 1
+                if profit > best:
+                    best, best_routes = profit, self._route_rows()
+            else:
+                for idx, rows in self._journal.items():
+                    LocalSearch._set_rows(self, idx, rows)
+            self._journal = {}
+
+        self._load_routes(best_routes)
+        return self.total_revenue
+
+    def _route_rows(self):
+        return [list(route.rows) for route in self._routes]
+
+    def _load_routes(self, routes):
+        for idx, rows in enumerate(routes):
+            if rows != self._routes[idx].rows:
+                LocalSearch._set_rows(self, idx, list(rows))
+
+    def _set_rows(self, idx, rows):
+        if idx not in self._journal:
+            self._journal[idx] = self._routes[idx].rows
+        super()._set_rows(idx, rows)
+
+    def _destroy(self, operator, count):
+        """Removes count orders from the routes, returns their rows."""
+        rows = [row for route in self._routes for row in route.rows]
+        if not rows:
+            return []
+        count = min(count, len(rows))
+        if operator == 'random':
+            removed = self._random.sample(rows, count)
+        elif operator == 'worst':
+            # removal gain of every order, the least valuable first
+            gains = []
+            for row in rows:
+                route, position = self._routes[self._route_of[row]], self._position[row]
+                without = join_runs(route.prefix[position], route.suffix[position + 1])
+                gains.append(run_profit(without, route.paid[-1] - self._payment[row]) - route.profit)
+            removed = self._pick([rows[idx] for idx in np.argsort(gains, kind='stable')[::-1].tolist()], count)
+        else:
+            seed = self._random.choice(rows)
+            removed = self._pick([rows[idx] for idx in np.argsort(self._distances(operator, rows, seed),
+                                                                  kind='stable').tolist()], count)
+
+        by_route = {}
+        for row in removed:
+            by_route.setdefault(self._route_of[row], set()).add(row)
+        for idx, route_removed in by_route.items():
+            self._set_rows(idx, [row for row in self._routes[idx].rows if row not in route_removed])
+        return removed
+
+    def _distances(self, operator, rows, seed):
+        """How far every row is from seed: in space for 'spatial', in dropoff time for 'time'."""
+        table = self._orders_table
+        if operator == 'spatial':
+            rows = np.array(rows)
+            return (np.abs(table.pickup_x[rows] - table.pickup_x[seed]) +
+                    np.abs(table.pickup_y[rows] - table.pickup_y[seed]) +
+                    np.abs(table.dropoff_x[rows] - table.dropoff_x[seed]) +
+                    np.abs(table.dropoff_y[rows] - table.dropoff_y[seed]))
+        if operator == 'time':
+            times = np.array([self._dropoff_time(row) for row in rows])
+            return np.abs(times - self._dropoff_time(seed))
+        raise ValueError('Unknown destroy operator: {}'.format(operator))
+
+    def _dropoff_time(self, row):
+        run = self._routes[self._route_of[row]].prefix[self._position[row] + 1]
+        return run[0] + run[1]
+
+    def _pick(self, ranked, count):
+        """count rows of ranked, mostly from its head: the next one is at rank len * y ** 3 of the rest."""
+        picked = []
+        while ranked and len(picked) < count:
+            picked.append(ranked.pop(int(len(ranked) * self._random.random() ** 3)))
+        return picked
+
+    def _repair(self, removed):
+        candidates = set(removed)
+        for row in removed:
+            for other, _ in self._neighbours[row]:
+                if self._route_of[other] == -1 and other in self._servable:
+                    candidates.add(other)
+        # best paying first like GreedyByUser, with some noise so repeated repairs differ
+        keys = {row: self._payment[row] * (0.8 + 0.4 * self._random.random()) for row in candidates}
+        # the routes the orders were removed from are open at every position
+        open_routes = list(self._journal)
+        for row in sorted(candidates, key=lambda row: -keys[row]):
+            if self._route_of[row] == -1:
+                self._insert(row, open_routes)
+        self._repaired = candidates
+
+
+def _island_plan(data_path, seed):
+    """GreedyByUser plan for the courier order of the seed, island 0 of a run keeps the input order."""
+    instance = load_instance(data_path)
+    couriers = new_couriers(instance.couriers)
+    table = OrderTable.from_columns(instance.orders.columns())
+    if seed:
+        couriers = order_couriers(couriers, table, 'random', seed)
+    return GreedyByUser.from_table(table, couriers).solve()
+
+
+def _run_island(data_path, island, seed, options, inboxes, results):
+    """Island process: searches and sends its best plan to the next island every migration_interval."""
+    # migrants left in the queues of finished islands are dropped instead of blocking the exit
+    for inbox in inboxes:
+        inbox.cancel_join_thread()
+    try:
+        solver = LnsIsland(data_path, _island_plan(data_path, seed), seed=seed, **options)
+        start_profit = solver.total_revenue
+
+        def exchange(profit, routes):
+            try:
+                inboxes[(island + 1) % len(inboxes)].put_nowait((profit, routes))
+            except queue.Full:
+                pass
+            received = None
+            while True:
+                try:
+                    migrant = inboxes[island].get_nowait()
+                except queue.Empty:
+                    return received
+                if received is None or migrant[0] > received[0]:
+                    received = migrant
+
+        profit = solver.search(exchange if len(inboxes) > 1 else None)
+        stats = IslandStats(island, seed, start_profit, profit, solver.iterations, solver.accepted,
+                            solver.migrations)
+        results.put((stats, solver._plan()))
+    except Exception as e:
+        results.put((island, 'error: {}'.format(e)))
+
+
+def parallel_lns(data_path, islands=None, time_limit=60.0, seed=0, migration_interval=5.0, **options):
+    """
+    Runs islands LnsIsland searches (by default one per core) for time_limit seconds each, in separate processes
+    that start from differently seeded GreedyByUser plans. Every migration_interval seconds an island sends its
+    best plan to the next one over a queue and adopts the best better plan it received. Returns the best plan.
+    options go to LnsIsland.
+    """
+    islands = islands or os.cpu_count() or 1
+    # built once here, the islands load it from the cache
+    load_order_graph(data_path, options.get('neighbours', 20))
+    options = dict(options, time_limit=time_limit, migration_interval=migration_interval)
+
+    if islands == 1:
+        solver = LnsIsland(data_path, _island_plan(data_path, seed), seed=seed, **options)
+        start_profit = solver.total_revenue
+        profit = solver.search()
+        stats = IslandStats(0, seed, start_profit, profit, solver.iterations, solver.accepted, 0)
+        return LnsResult(solver._plan(), profit, [stats])
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(islands)]
+    results = context.Queue()
+    processes = [context.Process(target=_run_island,
+                                 args=(data_path, island, seed + island, options, inboxes, results))
+                 for island in range(islands)]
+    for process in processes:
+        process.start()
+    finished = []
+    try:
+        while len(finished) < islands:
+            try:
+                finished.append(results.get(timeout=1.0))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    raise RuntimeError('LNS islands exited without a result')
+    finally:
+        for process in processes:
+            process.join()
+
+    errors = [result[1] for result in finished if isinstance(result[1], str)]
+    if errors:
+        raise RuntimeError('LNS island failed: {}'.format(errors[0]))
+    best_stats, best_plan = max(finished, key=lambda result: result[0].profit)
+    return LnsResult(best_plan, best_stats.profit, sorted([stats for stats, _ in finished]))
+
+
+if __name__ == '__main__':
+    result = parallel_lns('../example/contest_input.json', time_limit=60.0)
+    for stats in result.islands:
+        print('island {} seed {:3} profit {:8} -> {:8}, {} iterations, {} accepted, {} migrations'.format(*stats))
+    with open('../example/contest_output_lns.json', 'w') as outfile:
+        json.dump(result.plan, outfile)
@@ -0,0 +1,441 @@
+import json
+import random
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, OrderTable, load_instance, new_couriers
+from solutions.bounds import profit_upper_bound
+from solutions.core import EMPTY_RUN, join_runs, order_events, order_runs, plain_rows, run_profit
+from solutions.greedy_by_user import GreedyByUser
+from solutions.instrumentation import DISABLED, EMIT, LOAD, ORDERS_ASSIGNED, SELECT
+from solutions.order_graph import build_order_graph, load_order_graph
+
+# route index of the orders served by couriers the search leaves as they are
+_FIXED = -2
+
+
+class _Route:
+    """Orders of a courier with the runs and payments of all its prefixes and suffixes."""
+
+    __slots__ = ('courier_id', 'start', 'rows', 'prefix', 'suffix', 'paid', 'profit')
+
+    def __init__(self, courier_id, x, y, rows):
+        self.courier_id = courier_id
+        # the courier stands at (x, y) at the start of the day
+        self.start = (INITIAL_TIME_CONSTANT, 0, INITIAL_TIME_CONSTANT, x, y, x, y)
+        self.rows = rows
+
+    def update(self, runs, payment):
+        """Recomputes the caches after rows changed, O(len(rows))."""
+        rows = self.rows
+        self.prefix = prefix = [self.start]
+        self.paid = paid = [0]
+        for row in rows:
+            prefix.append(join_runs(prefix[-1], runs[row]))
+            paid.append(paid[-1] + payment[row])
+        self.suffix = suffix = [EMPTY_RUN] * (len(rows) + 1)
+        for position in range(len(rows) - 1, -1, -1):
+            suffix[position] = join_runs(runs[rows[position]], suffix[position + 1])
+        if prefix[-1] is None:
+            raise ValueError('Route of courier {} is late'.format(self.courier_id))
+        self.profit = run_profit(prefix[-1], paid[-1])
+
+
+class LocalSearch:
+    """
+    Improvement stage for the plan of any solver, by default the one of GreedyByUser.
+
+    Routes made of pickup / dropoff pairs are improved by moves of single orders: relocate to another route,
+    swap with an order of another route or with an unassigned one, 2-opt* (exchange of route tails), insertion
+    of unassigned orders, removal of orders that do not pay for the time they take, and relocate / swap within
+    a route. Moves of an order only go next to its neighbours in the order graph of the instance (neighbours
+    best successors and predecessors) and to idle couriers.
+
+    Every route caches the runs (see core.join_runs) of all its prefixes and suffixes, so the feasibility and the profit
+    change of a move between routes are evaluated in constant time from a few joins. Moves within a route sweep
+    the positions and grow the run in between by one order per step. For every order the best improving move is
+    applied, passes over all orders repeat until none improves or time_limit seconds are over. With target_gap
+    the search also stops once the profit is within that share of the upper bound of the instance
+    (solutions.bounds), which is kept in upper_bound. The bound is loose on dense instances, good plans of the
+    contest input stay about 0.78 of it short, so there only a target_gap above that stops the search early.
+
+    Couriers whose events are not plain pairs (depots, several orders carried at once) are left as they are.
+    total_revenue is the profit of the routes the search works on.
+    """
+
+    def __init__(self, data_path, plan=None, time_limit=10.0, neighbours=20, seed=0, instrumentation=None,
+                 target_gap=None):
+        stats = instrumentation or DISABLED
+        with stats.phase(LOAD):
+            instance = load_instance(data_path)
+            self._setup(instance.orders, np.array(instance.couriers), load_order_graph(data_path, neighbours), plan,
+                        time_limit, seed, stats, target_gap, instance.depots)
+
+    @classmethod
+    def from_table(cls, orders_table: OrderTable, courier_columns, plan=None, time_limit=10.0, neighbours=20,
+                   seed=0, instrumentation=None, target_gap=None):
+        """
+        Search over an already loaded order table, its order graph is built without the cache. Without the
+        depots, the upper bound of target_gap only holds for plans that visit none, as the ones of the search.
+        """
+        solver = cls.__new__(cls)
+        solver._setup(orders_table, courier_columns, build_order_graph(orders_table, neighbours), plan, time_limit,
+                      seed, instrumentation or DISABLED, target_gap)
+        return solver
+
+    def _setup(self, orders_table, courier_columns, order_graph, plan, time_limit, seed, stats, target_gap=None,
+               depot_columns=None):
+        self._stats = stats
+        self._orders_table = orders_table
+        self._time_limit = time_limit
+        self._random = random.Random(seed)
+        self.upper_bound = None
+        # profit the search stops at
+        self._target = float('inf')
+        if target_gap is not None:
+            self.upper_bound = profit_upper_bound(orders_table, courier_columns, depot_columns).bound
+            self._target = (1 - target_gap) * self.upper_bound
+        if plan is None:
+            plan = GreedyByUser.from_table(OrderTable.from_columns(orders_table.columns()),
+                                           new_couriers(courier_columns)).solve()
+
+        self._runs = order_runs(orders_table)
+        self._payment = orders_table.payment.tolist()
+        self._neighbours = self._neighbour_lists(order_graph)
+
+        self._fixed_events = []
+        self._routes = []
+        self._route_of = [-1] * len(orders_table)
+        self._position = [0] * len(orders_table)
+        self._parse_plan(plan, courier_columns)
+
+        self._courier_x = np.array([route.start[3] for route in self._routes], dtype=np.int64)
+        self._courier_y = np.array([route.start[4] for route in self._routes], dtype=np.int64)
+        self._idle = np.array([not route.rows for route in self._routes], dtype=bool)
+        self._idle_routes = np.flatnonzero(self._idle)
+        # orders that can be moved around: the ones of the routes and every other order a courier can serve
+        self._movable = [row for row in range(len(orders_table))
+                         if self._route_of[row] >= 0 or (self._route_of[row] != _FIXED and
+                                                         order_graph.order_times[row] >= 0 and
+                                                         orders_table.alive[row])]
+        self.total_revenue = sum(route.profit for route in self._routes)
+
+    @staticmethod
+    def _neighbour_lists(order_graph):
+        """(row, goes before it) pairs of every order: its graph successors, then its best graph predecessors."""
+        num_orders = len(order_graph)
+        tails = np.repeat(np.arange(num_orders), np.diff(order_graph.indptr))
+        heads = np.asarray(order_graph.indices)
+        successors = [[] for _ in range(num_orders)]
+        for tail, head in zip(tails.tolist(), heads.tolist()):
+            successors[tail].append((head, True))
+
+        # as many predecessors as the graph keeps successors, the most profitable ones
+        top_k = int(np.diff(order_graph.indptr).max()) if num_orders else 0
+        by_head = np.lexsort((-np.asarray(order_graph.weights), heads))
+        counts = np.bincount(heads, minlength=num_orders)
+        ranks = np.arange(len(by_head)) - (np.cumsum(counts) - counts)[heads[by_head]]
+        kept = by_head[ranks < top_k]
+        for tail, head in zip(tails[kept].tolist(), heads[kept].tolist()):
+            successors[head].append((tail, False))
+        return successors
+
+    def _parse_plan(self, plan, courier_columns):
+        table = self._orders_table
+        events_of = defaultdict(list)
+        for event in plan:
+            events_of[event['courier_id']].append(event)
+
+        fixed = set()
+        for courier_id, x, y in courier_columns.tolist():
+            events = events_of.get(courier_id, [])
+            rows = plain_rows(table, self._runs, events)
+            if rows is None:
+                fixed.add(courier_id)
+                continue
+            route = _Route(courier_id, x, y, rows)
+            self._add_route(route)
+        for event in plan:
+            if event['courier_id'] in fixed:
+                self._fixed_events.append(event)
+                try:
+                    self._route_of[table.row_of(event['order_id'])] = _FIXED
+                except KeyError:
+                    pass
+
+    def _add_route(self, route):
+        route.update(self._runs, self._payment)
+        for position, row in enumerate(route.rows):
+            self._route_of[row] = len(self._routes)
+            self._position[row] = position
+        self._routes.append(route)
+
+    def solve(self):
+        stats = self._stats
+        started_with = self.total_revenue
+        with stats.phase(SELECT):
+            self._descend(self._movable, range(len(self._routes)), time.perf_counter() + self._time_limit)
+        stats.progress('solved', force=True, improvement=self.total_revenue - started_with)
+        with stats.phase(EMIT):
+            plan = self._plan()
+        stats.count(ORDERS_ASSIGNED, sum(len(route.rows) for route in self._routes))
+        return plan
+
+    def _descend(self, rows, changed_routes, deadline):
+        """Passes over rows, then over the routes that changed, until no move improves or deadline."""
+        changed_routes = set(changed_routes)
+        improved = True
+        while improved and not self._done(deadline):
+            improved = False
+            order = list(rows)
+            self._random.shuffle(order)
+            for row in order:
+                if self._done(deadline):
+                    break
+                touched = self._improve_order(row)
+                if touched:
+                    improved = True
+                    changed_routes.update(touched)
+
+            for idx in sorted(changed_routes):
+                if self._done(deadline):
+                    break
+                if self._improve_within(idx):
+                    improved = True
+            changed_routes = set()
+
+    def _done(self, deadline):
+        """Whether the time is over or the profit is close enough to the upper bound."""
+        return time.perf_counter() >= deadline or self.total_revenue >= self._target
+
+    def _plan(self):
+        table = self._orders_table
+        answer = list(self._fixed_events)
+        for route in self._routes:
+            for row in route.rows:
+                answer.extend(order_events(route.courier_id, int(table.order_ids[row]),
+                                           int(table.pickup_point_ids[row]), int(table.dropoff_point_ids[row])))
+        return answer
+
+    def _set_rows(self, idx, rows):
+        route = self._routes[idx]
+        for row in route.rows:
+            # rows may already belong to the other route of the same move
+            if self._route_of[row] == idx:
+                self._route_of[row] = -1
+        route.rows = rows
+        for position, row in enumerate(rows):
+            self._route_of[row] = idx
+            self._position[row] = position
+        self.total_revenue -= route.profit
+        route.update(self._runs, self._payment)
+        self.total_revenue += route.profit
+        if self._idle[idx] != (not rows):
+            self._idle[idx] = not rows
+            self._idle_routes = np.flatnonzero(self._idle)
+
+    def _improve_order(self, row):
+        """Applies the best improving move of the order, returns the indices of the routes it changed."""
+        if self._route_of[row] < 0:
+            return self._insert(row)
+        return self._remove(row) or self._move_between(row)
+
+    def _remove(self, row):
+        idx, position = self._route_of[row], self._position[row]
+        route = self._routes[idx]
+        without = join_runs(route.prefix[position], route.suffix[position + 1])
+        if run_profit(without, route.paid[-1] - self._payment[row]) <= route.profit:
+            return ()
+        self._set_rows(idx, route.rows[:position] + route.rows[position + 1:])
+        return idx,
+
+    def _best_idle(self, row, to_beat=0):
+        """(route index, profit) of the idle courier that serves the order alone most profitably, if above to_beat."""
+        idle = self._idle_routes
+        # even a courier standing at the pickup point needs 10 minutes to get there
+        if not len(idle) or self._payment[row] - 2 * (10 + self._runs[row][1]) <= to_beat:
+            return None, 0
+        drops_off_at = self._orders_table.dropoff_times(self._courier_x[idle], self._courier_y[idle],
+                                                        INITIAL_TIME_CONSTANT, rows=[row])
+        if not np.any(drops_off_at >= 0):
+            return None, 0
+        best = int(np.argmax(np.where(drops_off_at >= 0, -drops_off_at, -np.inf)))
+        return int(idle[best]), self._payment[row] - 2 * (int(drops_off_at[best]) - INITIAL_TIME_CONSTANT)
+
+    def _insert(self, row, open_routes=()):
+        """
+        Insertion of an unassigned order next to a neighbour, in place of it, for an idle courier or anywhere on
+        the routes of open_routes.
+        """
+        routes, runs, payment = self._routes, self._runs, self._payment
+        run, paid = runs[row], payment[row]
+        best_gain, best_move = 0, None
+        for idx in open_routes:
+            route = routes[idx]
+            for cut in range(len(route.rows) + 1):
+                joined = join_runs(join_runs(route.prefix[cut], run), route.suffix[cut])
+                if joined is not None:
+                    gain = run_profit(joined, route.paid[-1] + paid) - route.profit
+                    if gain > best_gain:
+                        best_gain, best_move = gain, (idx, cut, cut)
+        for other, before in self._neighbours[row]:
+            idx = self._route_of[other]
+            if idx < 0:
+                continue
+            route, position = routes[idx], self._position[other]
+            cut = position if before else position + 1
+            joined = join_runs(join_runs(route.prefix[cut], run), route.suffix[cut])
+            if joined is not None:
+                gain = run_profit(joined, route.paid[-1] + paid) - route.profit
+                if gain > best_gain:
+                    best_gain, best_move = gain, (idx, cut, cut)
+            # in place of the neighbour, which becomes unassigned
+            joined = join_runs(join_runs(route.prefix[position], run), route.suffix[position + 1])
+            if joined is not None:
+                gain = run_profit(joined, route.paid[-1] + paid - payment[other]) - route.profit
+                if gain > best_gain:
+                    best_gain, best_move = gain, (idx, position, position + 1)
+
+        idle, gain = self._best_idle(row, best_gain)
+        if idle is not None and gain > best_gain:
+            best_gain, best_move = gain, (idle, 0, 0)
+        if best_move is None:
+            return ()
+        idx, cut, rest = best_move
+        rows = routes[idx].rows
+        self._set_rows(idx, rows[:cut] + [row] + rows[rest:])
+        return idx,
+
+    def _move_between(self, row):
+        """Best relocate, swap or 2-opt* move of an order on a route with its neighbours on other routes."""
+        routes, runs, payment = self._routes, self._runs, self._payment
+        idx, position = self._route_of[row], self._position[row]
+        route = routes[idx]
+        run, paid = runs[row], payment[row]
+        prefix, suffix, route_paid = route.prefix, route.suffix, route.paid
+
+        without = join_runs(prefix[position], suffix[position + 1])
+        without_gain = run_profit(without, route_paid[-1] - paid) - route.profit
+        best_gain, best_move = 0, None
+        for other, before in self._neighbours[row]:
+            other_idx = self._route_of[other]
+            if other_idx == idx or other_idx == _FIXED:
+                continue
+            other_run, other_paid = runs[other], payment[other]
+            if other_idx < 0:
+                # swap with an unassigned order
+                joined = join_runs(join_runs(prefix[position], other_run), suffix[position + 1])
+                if joined is not None:
+                    gain = run_profit(joined, route_paid[-1] - paid + other_paid) - route.profit
+                    if gain > best_gain:
+                        best_gain, best_move = gain, ('swap', other_idx, other)
+                continue
+
+            other_route, other_position = routes[other_idx], self._position[other]
+            other_prefix, other_suffix, other_route_paid = other_route.prefix, other_route.suffix, other_route.paid
+
+            # relocate next to the neighbour
+            cut = other_position if before else other_position + 1
+            joined = join_runs(join_runs(other_prefix[cut], run), other_suffix[cut])
+            if joined is not None:
+                gain = without_gain + run_profit(joined, other_route_paid[-1] + paid) - other_route.profit
+                if gain > best_gain:
+                    best_gain, best_move = gain, ('relocate', other_idx, cut)
+
+            # swap with the neighbour
+            joined = join_runs(join_runs(prefix[position], other_run), suffix[position + 1])
+            other_joined = join_runs(join_runs(other_prefix[other_position], run), other_suffix[other_position + 1])
+            if joined is not None and other_joined is not None:
+                gain = (run_profit(joined, route_paid[-1] - paid + other_paid) - route.profit +
+                        run_profit(other_joined, other_route_paid[-1] - other_paid + paid) - other_route.profit)
+                if gain > best_gain:
+                    best_gain, best_move = gain, ('swap', other_idx, other)
+
+            # 2-opt*: the order gets the neighbour as its next one (or the other way around), the tails swap
+            cut, other_cut = (position + 1, other_position) if before else (position, other_position + 1)
+            joined = join_runs(prefix[cut], other_suffix[other_cut])
+            other_joined = join_runs(other_prefix[other_cut], suffix[cut])
+            if joined is not None and other_joined is not None:
+                tail_paid = route_paid[-1] - route_paid[cut]
+                other_tail_paid = other_route_paid[-1] - other_route_paid[other_cut]
+                gain = (run_profit(joined, route_paid[cut] + other_tail_paid) - route.profit +
+                        run_profit(other_joined, other_route_paid[other_cut] + tail_paid) - other_route.profit)
+                if gain > best_gain:
+                    best_gain, best_move = gain, ('2-opt*', other_idx, (cut, other_cut))
+
+        idle, gain = self._best_idle(row, best_gain - without_gain)
+        if idle is not None and without_gain + gain > best_gain:
+            best_gain, best_move = without_gain + gain, ('relocate', idle, 0)
+        if best_move is None:
+            return ()
+
+        kind, other_idx, argument = best_move
+        rows = route.rows
+        if kind == 'relocate':
+            other_rows = routes[other_idx].rows
+            self._set_rows(idx, rows[:position] + rows[position + 1:])
+            self._set_rows(other_idx, other_rows[:argument] + [row] + other_rows[argument:])
+        elif kind == 'swap' and other_idx < 0:
+            self._set_rows(idx, rows[:position] + [argument] + rows[position + 1:])
+            return idx,
+        elif kind == 'swap':
+            other_rows, other_position = routes[other_idx].rows, self._position[argument]
+            self._set_rows(idx, rows[:position] + [argument] + rows[position + 1:])
+            self._set_rows(other_idx, other_rows[:other_position] + [row] + other_rows[other_position + 1:])
+        else:
+            cut, other_cut = argument
+            other_rows = routes[other_idx].rows
+            self._set_rows(idx, rows[:cut] + other_rows[other_cut:])
+            self._set_rows(other_idx, other_rows[:other_cut] + rows[cut:])
+        return idx, other_idx
+
+    def _improve_within(self, idx):
+        """Relocates and swaps orders within one route while that shortens it, returns whether it did."""
+        route = self._routes[idx]
+        runs = self._runs
+        improved = False
+        while True:
+            rows, prefix, suffix = route.rows, route.prefix, route.suffix
+            # payments stay the same, so the earliest end wins
+            best_end = prefix[-1][0] + prefix[-1][1]
+            best_rows = None
+            for position, row in enumerate(rows):
+                run = runs[row]
+                # to a later position or swapped with the order there, between are the orders in between
+                between = EMPTY_RUN
+                for later in range(position + 1, len(rows)):
+                    later_run = runs[rows[later]]
+                    swapped = join_runs(join_runs(join_runs(join_runs(prefix[position], later_run), between), run),
+                                        suffix[later + 1])
+                    if swapped is not None and swapped[0] + swapped[1] < best_end:
+                        best_end = swapped[0] + swapped[1]
+                        best_rows = (rows[:position] + [rows[later]] + rows[position + 1:later] + [row] +
+                                     rows[later + 1:])
+                    between = join_runs(between, later_run)
+                    moved = join_runs(join_runs(join_runs(prefix[position], between), run), suffix[later + 1])
+                    if moved is not None and moved[0] + moved[1] < best_end:
+                        best_end = moved[0] + moved[1]
+                        best_rows = rows[:position] + rows[position + 1:later + 1] + [row] + rows[later + 1:]
+                # to an earlier position
+                between = EMPTY_RUN
+                for earlier in range(position - 1, -1, -1):
+                    between = join_runs(runs[rows[earlier]], between)
+                    moved = join_runs(join_runs(join_runs(prefix[earlier], run), between), suffix[position + 1])
+                    if moved is not None and moved[0] + moved[1] < best_end:
+                        best_end = moved[0] + moved[1]
+                        best_rows = rows[:earlier] + [row] + rows[earlier:position] + rows[position + 1:]
+            if best_rows is None:
+                return improved
+            self._set_rows(idx, best_rows)
+            improved = True
+
+
+if __name__ == '__main__':
+    solver = LocalSearch('../example/contest_input.json')
+    started_with = solver.total_revenue
+    plan = solver.solve()
+    print('Local search improved the profit by {}'.format(solver.total_revenue - started_with))
+    with open('../example/contest_output_local_search.json', 'w') as outfile:
+        json.dump(plan, outfile)
@@ -0,0 +1,196 @@
+import heapq
+
+
+def min_cost_flow(num_nodes, tails, heads, capacities, costs, source, sink, topological_order):
+    """
+    Minimum cost flow from source to sink over a DAG with integer costs, the amount of flow is free: augmenting
+    stops once no source-sink path of negative cost is left. topological_order lists all nodes of the DAG,
+    the sink must have no outgoing edges.
+
+    Successive shortest paths. The potentials are kept equal to the shortest distances from the source in the
+    residual graph together with a shortest path tree; the first ones come from a single pass over the DAG in
+    topological order (costs may be negative). Augmenting along the tree path to the sink only breaks the tree
+    below the first arc it saturates, so after every augmentation just that subtree is settled again by a
+    Dijkstra search on reduced costs, the rest of the graph keeps its distances. A shortest path never runs
+    through the sink or back into the source, a detour like that starts with a cycle and the residual graph of
+    a min cost flow has no negative ones, so arcs out of the sink and into the source are left out.
+    Returns the flow on every edge, in the order of tails / heads.
+    """
+    network = _ResidualNetwork(num_nodes, tails, heads, capacities, costs, source, sink)
+    network.settle_dag(topological_order)
+
+    parent, residual, arc_heads = network.parent, network.residual, network.arc_heads
+    while parent[sink] is not None and network.potential[sink] - network.potential[source] < 0:
+        path = []
+        node = sink
+        while node != source:
+            arc = parent[node]
+            path.append(arc)
+            node = arc_heads[arc ^ 1]
+        path.reverse()
+
+        saturated = network.augment(path)
+        network.resettle_subtree(arc_heads[saturated])
+
+    return [residual[2 * edge + 1] for edge in range(len(tails))]
+
+
+class _ResidualNetwork:
+    """Residual arcs, potentials and the shortest path tree of min_cost_flow."""
+
+    def __init__(self, num_nodes, tails, heads, capacities, costs, source, sink):
+        num_edges = len(tails)
+        self.source = source
+        self.sink = sink
+        # residual arc 2e is edge e, 2e + 1 is its reverse
+        self.arc_heads = arc_heads = [0] * (2 * num_edges)
+        self.arc_costs = arc_costs = [0] * (2 * num_edges)
+        self.residual = residual = [0] * (2 * num_edges)
+        # arcs out of and into every node, except the ones into the source and out of the sink; the sink has
+        # a heap of its incoming arcs instead. A reverse arc is only listed once flow opens it up
+        self.adjacency = adjacency = [[] for _ in range(num_nodes)]
+        self.incoming = incoming = [[] for _ in range(num_nodes)]
+        self._listed = [True, False] * num_edges
+        for edge, (tail, head, capacity, cost) in enumerate(zip(tails, heads, capacities, costs)):
+            arc_heads[2 * edge], arc_heads[2 * edge + 1] = head, tail
+            arc_costs[2 * edge], arc_costs[2 * edge + 1] = cost, -cost
+            residual[2 * edge] = capacity
+            if head != source:
+                adjacency[tail].append(2 * edge)
+                if head != sink:
+                    incoming[head].append(2 * edge)
+        self.sink_arcs = {}
+        for edge, (tail, head) in enumerate(zip(tails, heads)):
+            if head == sink:
+                self.sink_arcs.setdefault(tail, []).append(2 * edge)
+        # (tail potential + cost, tail potential, arc) for arcs into the sink, stale entries are dropped lazily
+        self.sink_queue = []
+
+        self.potential = [0] * num_nodes
+        # arc of the shortest path tree that enters the node, None for the source and for unreachable nodes
+        self.parent = [None] * num_nodes
+        self._stamp = 0
+        self._affected = [0] * num_nodes
+        self._settled = [0] * num_nodes
+        self._best = [0] * num_nodes
+        self._best_arc = [None] * num_nodes
+
+    def settle_dag(self, topological_order):
+        unreachable = float('inf')
+        potential = [unreachable] * len(self.potential)
+        potential[self.source] = 0
+        for node in topological_order:
+            if potential[node] == unreachable:
+                continue
+            for arc in self.adjacency[node]:
+                if arc & 1 == 0 and self.residual[arc]:
+                    head = self.arc_heads[arc]
+                    if potential[node] + self.arc_costs[arc] < potential[head]:
+                        potential[head] = potential[node] + self.arc_costs[arc]
+                        self.parent[head] = arc
+        # nodes out of reach of the source stay so: augmenting only adds arcs between reachable nodes
+        self.potential = [0 if value == unreachable else value for value in potential]
+        self._push_sink_arcs(node for node, value in enumerate(potential) if value != unreachable)
+
+    def augment(self, path):
+        """Pushes the most the path takes, returns its first saturated arc."""
+        residual, arc_heads = self.residual, self.arc_heads
+        amount = min(residual[arc] for arc in path)
+        for arc in path:
+            residual[arc] -= amount
+            residual[arc ^ 1] += amount
+            reverse = arc ^ 1
+            if not self._listed[reverse]:
+                self._listed[reverse] = True
+                tail, head = arc_heads[arc], arc_heads[reverse]
+                if head != self.source and tail != self.sink:
+                    self.adjacency[tail].append(reverse)
+                    self.incoming[head].append(reverse)
+        return next(arc for arc in path if not residual[arc])
+
+    def _push_sink_arcs(self, nodes):
+        for node in nodes:
+            for arc in self.sink_arcs.get(node, ()):
+                if self.residual[arc]:
+                    value = self.potential[node]
+                    heapq.heappush(self.sink_queue, (value + self.arc_costs[arc], value, arc))
+
+    def _best_sink_arc(self):
+        """Cheapest live arc into the sink from a node outside the subtree being settled, None if there is none."""
+        queue = self.sink_queue
+        while queue:
+            _, value, arc = queue[0]
+            tail = self.arc_heads[arc ^ 1]
+            if (self.residual[arc] and self.potential[tail] == value and self._affected[tail] != self._stamp and
+                    (tail == self.source or self.parent[tail] is not None)):
+                return arc
+            # entries of the subtree are pushed again once its potentials are updated
+            heapq.heappop(queue)
+        return None
+
+    def resettle_subtree(self, root):
+        """Recomputes distances and tree arcs of the subtree of root, whose tree arc was just saturated."""
+        self._stamp += 1
+        stamp = self._stamp
+        affected, settled, best, best_arc = self._affected, self._settled, self._best, self._best_arc
+        arc_heads, arc_costs, residual = self.arc_heads, self.arc_costs, self.residual
+        potential, parent, adjacency, source, sink = self.potential, self.parent, self.adjacency, self.source, self.sink
+
+        subtree = [root]
+        affected[root] = stamp
+        for node in subtree:
+            if node == sink:
+                continue
+            for arc in adjacency[node]:
+                head = arc_heads[arc]
+                if parent[head] == arc and affected[head] != stamp:
+                    affected[head] = stamp
+                    subtree.append(head)
+
+        # every node outside the subtree is at reduced distance 0, so the search starts from their arcs into it
+        queue = []
+        for node in subtree:
+            parent[node] = None
+            best_arc[node] = None
+            node_potential = potential[node]
+            if node == sink:
+                candidates = [self._best_sink_arc()] if self.sink_queue else []
+            else:
+                candidates = self.incoming[node]
+            for arc in candidates:
+                if arc is None:
+                    continue
+                tail = arc_heads[arc ^ 1]
+                if (not residual[arc] or affected[tail] == stamp or tail == sink or
+                        (parent[tail] is None and tail != source)):
+                    continue
+                reduced = arc_costs[arc] + potential[tail] - node_potential
+                if best_arc[node] is None or reduced < best[node]:
+                    best[node], best_arc[node] = reduced, arc
+            if best_arc[node] is not None:
+                queue.append((best[node], node))
+        heapq.heapify(queue)
+
+        farthest = 0
+        while queue:
+            value, node = heapq.heappop(queue)
+            if settled[node] == stamp:
+                continue
+            settled[node] = stamp
+            best[node] = farthest = value
+            parent[node] = best_arc[node]
+            if node == sink:
+                continue
+            node_potential = potential[node]
+            for arc in adjacency[node]:
+                head = arc_heads[arc]
+                if not residual[arc] or affected[head] != stamp or settled[head] == stamp:
+                    continue
+                reduced = value + arc_costs[arc] + node_potential - potential[head]
+                if best_arc[head] is None or reduced < best[head]:
+                    best[head], best_arc[head] = reduced, arc
+                    heapq.heappush(queue, (reduced, head))
+
+        for node in subtree:
+            potential[node] += best[node] if settled[node] == stamp else farthest
+        self._push_sink_arcs(node for node in subtree if settled[node] == stamp)
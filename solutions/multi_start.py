@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_wrappers import OrderTable, load_instance, new_couriers
+from solutions.greedy_by_user import GreedyByUser
+from solutions.shared_table import attach_order_table, share_order_table
+
+RunStats = namedtuple('RunStats', ['strategy', 'seed', 'profit', 'seconds'])
+MultiStartResult = namedtuple('MultiStartResult', ['plan', 'profit', 'runs'])
+
+STRATEGIES = ('random', 'x', 'y', 'nearest')
+
+# set in every worker process by _init_worker
+_worker_state = {}
+
+
+def order_couriers(couriers, table: OrderTable, strategy, seed):
+    """
+    Courier permutation for one GreedyByUser run. 'random' is a seeded shuffle, 'x' / 'y' sweep the city
+    along an axis, 'nearest' routes couriers closest to some pickup point first; the seed breaks ties.
+    """
+    rng = random.Random(seed)
+    couriers = list(couriers)
+    if strategy == 'random':
+        rng.shuffle(couriers)
+        return couriers
+
+    if strategy == 'x':
+        keys = [c.location_x for c in couriers]
+    elif strategy == 'y':
+        keys = [c.location_y for c in couriers]
+    elif strategy == 'nearest':
+        keys = [int(np.min(np.abs(table.pickup_x - c.location_x) + np.abs(table.pickup_y - c.location_y)))
+                if len(table) else 0 for c in couriers]
+    else:
+        raise ValueError('Unknown courier order strategy: {}'.format(strategy))
+
+    tie_breaks = [rng.random() for _ in couriers]
+    permutation = sorted(range(len(couriers)), key=lambda idx: (keys[idx], tie_breaks[idx]))
+    return [couriers[idx] for idx in permutation]
+
+
+def _init_worker(table_handle, courier_columns):
+    block, table = attach_order_table(table_handle)
+    _worker_state['block'] = block
+    _worker_state['table'] = table
+    _worker_state['couriers'] = courier_columns
+
+
+def _run_greedy(table, courier_columns, strategy, seed):
+    started = time.perf_counter()
+    couriers = order_couriers(new_couriers(courier_columns), table, strategy, seed)
+    solver = GreedyByUser.from_table(OrderTable.from_columns(table.columns()), couriers)
+    plan = solver.solve()
+    return RunStats(strategy, seed, solver.total_revenue, time.perf_counter() - started), plan
+
+
+def _run_in_worker(strategy, seed):
+    return _run_greedy(_worker_state['table'], _worker_state['couriers'], strategy, seed)
+
+
+def multi_start_greedy(data_path, seeds=range(4), strategies=STRATEGIES, jobs=None):
+    """
+    Runs GreedyByUser once for every (strategy, seed) pair in a process pool and keeps the most profitable plan.
+    Workers read the orders from one shared memory block instead of parsing the input again.
+    """
+    instance = load_instance(data_path)
+    table = instance.orders
+    courier_columns = np.array(instance.couriers)
+    tasks = [(strategy, seed) for strategy in strategies for seed in seeds]
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+
+    if jobs <= 1:
+        results = [_run_greedy(table, courier_columns, strategy, seed) for strategy, seed in tasks]
+    else:
+        block, handle = share_order_table(table)
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                     initargs=(handle, courier_columns)) as pool:
+                results = list(pool.map(_run_in_worker, *zip(*tasks)))
+        finally:
+            block.close()
+            block.unlink()
+
+    runs = [stats for stats, _ in results]
+    best_stats, best_plan = max(results, key=lambda result: result[0].profit)
+    return MultiStartResult(best_plan, best_stats.profit, runs)
+
+
+if __name__ == '__main__':
+    result = multi_start_greedy('../example/contest_input.json')
+    for run in sorted(result.runs, key=lambda x: -x.profit):
+        print('{:8} seed {:3} profit {:8} in {:.2f}s'.format(run.strategy, run.seed, run.profit, run.seconds))
+    with open('../example/contest_output_greedy_by_user_multi_start.json', 'w') as outfile:
+        json.dump(result.plan, outfile)
@@ -0,0 +1,188 @@
+import json
+import os
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, OrderTable, load_instance
+from solutions.spatial_index import PickupGrid
+
+# bump when the layout of the cached graph arrays changes
+ORDER_GRAPH_CACHE_VERSION = 2
+
+_ARRAYS = ('order_times', 'indptr', 'indices', 'weights', 'dropoff_times')
+
+
+class OrderGraph:
+    """
+    Feasible order -> order transitions of an instance in CSR arrays, rows are OrderTable rows.
+
+    order_times[i] is the time order i is dropped off at, -1 if no courier can serve it. By default it is the
+    earliest time any courier can finish the order: the edge i -> j exists when order_times[j] > order_times[i]
+    and a courier that drops off i at order_times[i] can still serve j; dropoff_times of the edge is when j is
+    then dropped off and weights is its payment minus the courier wage for the time spent since dropping off i.
+    A courier that finishes i later can only lose edges, so walkers recheck them with OrderTable.dropoff_times
+    at the actual time.
+
+    Cut down to planned dropoff times by plan_order_graph, order_times are the plan and the edge i -> j only
+    exists when a courier leaving i at order_times[i] drops off j no later than order_times[j]; weights then
+    count the wage up to order_times[j]. A courier that is never late keeps every edge, so any path is a
+    valid route and its weights never overstate its profit.
+
+    Since every edge goes forward in order_times, the graph is a DAG and sorting by order_times is a
+    topological order. The edges of a row are sorted by weight, best first.
+    """
+
+    def __init__(self, order_times, indptr, indices, weights, dropoff_times):
+        self.order_times = order_times
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.dropoff_times = dropoff_times
+
+    def __len__(self):
+        return len(self.order_times)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def successors(self, row):
+        """(rows, weights, dropoff_times) of the edges leaving row, best weight first."""
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.weights[start:end], self.dropoff_times[start:end]
+
+    def topological_order(self):
+        """Rows of orders that can be served at all, by order_times."""
+        feasible = np.flatnonzero(self.order_times >= 0)
+        return feasible[np.argsort(self.order_times[feasible], kind='stable')]
+
+
+def earliest_dropoff_times(table: OrderTable):
+    """Earliest dropoff time of every order over all couriers, -1 for orders nobody can complete."""
+    # every courier starts at INITIAL_TIME_CONSTANT and needs at least 10 minutes to reach any point
+    picks_up_at = np.maximum(table.pickup_from, INITIAL_TIME_CONSTANT + 10)
+    feasible = picks_up_at <= table.pickup_to
+    drops_off_at = picks_up_at + table.trip
+    feasible &= drops_off_at <= table.dropoff_to
+    return np.where(feasible, np.maximum(drops_off_at, table.dropoff_from), -1)
+
+
+def build_order_graph(table: OrderTable, top_k=None):
+    """Order graph of all orders of the table (removed ones included), keeping top_k best edges per order."""
+    table = OrderTable.from_columns(table.columns())
+    pickup_index = PickupGrid(table)
+    order_times = earliest_dropoff_times(table)
+
+    counts = np.zeros(len(table), dtype=np.int64)
+    indices, weights, dropoff_times = [], [], []
+    for row in np.flatnonzero(order_times >= 0).tolist():
+        x, y, now = int(table.dropoff_x[row]), int(table.dropoff_y[row]), int(order_times[row])
+        rows = pickup_index.query(x, y, now)
+        # only forward in time, which keeps the graph acyclic: an order with a wide window could otherwise
+        # follow one that can also follow it
+        rows = rows[order_times[rows] > now]
+        drops_off_at = table.dropoff_times(x, y, now, rows=rows)
+        feasible = drops_off_at >= 0
+        rows, drops_off_at = rows[feasible], drops_off_at[feasible]
+        revenues = table.payment[rows] - 2 * (drops_off_at - now)
+
+        if top_k is not None and len(rows) > top_k:
+            best = np.argpartition(-revenues, top_k - 1)[:top_k]
+            rows, drops_off_at, revenues = rows[best], drops_off_at[best], revenues[best]
+        best_first = np.argsort(-revenues, kind='stable')
+
+        counts[row] = len(rows)
+        indices.append(rows[best_first])
+        weights.append(revenues[best_first])
+        dropoff_times.append(drops_off_at[best_first])
+
+    indptr = np.zeros(len(table) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    def concatenate(parts):
+        return np.concatenate(parts).astype(np.int64) if parts else np.empty(0, dtype=np.int64)
+
+    return OrderGraph(order_times, indptr, concatenate(indices), concatenate(weights),
+                      concatenate(dropoff_times))
+
+
+def plan_order_graph(graph: OrderGraph, table: OrderTable, planned_dropoff, top_k=None):
+    """
+    Order graph for planned dropoff times (-1 for orders left out) cut out of an earliest time graph of the
+    same table, keeping top_k best edges per order. Planned times are never earlier than the earliest ones,
+    so only edges of the given graph can survive; edges it cut off at its own top_k are missed.
+    """
+    planned_dropoff = np.asarray(planned_dropoff)
+    tails = np.repeat(np.arange(len(graph)), np.diff(graph.indptr))
+    heads = np.asarray(graph.indices)
+    kept = (planned_dropoff[tails] >= 0) & (planned_dropoff[heads] > planned_dropoff[tails])
+    tails, heads = tails[kept], heads[kept]
+
+    drops_off_at = table.dropoff_times(table.dropoff_x[tails], table.dropoff_y[tails], planned_dropoff[tails],
+                                       rows=heads)
+    kept = (drops_off_at >= 0) & (drops_off_at <= planned_dropoff[heads])
+    tails, heads, drops_off_at = tails[kept], heads[kept], drops_off_at[kept]
+    weights = table.payment[heads] - 2 * (planned_dropoff[heads] - planned_dropoff[tails])
+
+    # by tail, best weight first, then the first top_k of every tail
+    permutation = np.lexsort((-weights, tails))
+    tails, heads, weights, drops_off_at = (tails[permutation], heads[permutation], weights[permutation],
+                                           drops_off_at[permutation])
+    counts = np.bincount(tails, minlength=len(graph))
+    if top_k is not None:
+        starts = np.cumsum(counts) - counts
+        kept = np.arange(len(tails)) - starts[tails] < top_k
+        tails, heads, weights, drops_off_at = tails[kept], heads[kept], weights[kept], drops_off_at[kept]
+        counts = np.minimum(counts, top_k)
+
+    indptr = np.zeros(len(graph) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return OrderGraph(planned_dropoff, indptr, heads.astype(np.int64), weights.astype(np.int64),
+                      drops_off_at.astype(np.int64))
+
+
+def load_order_graph(data_path, top_k=None, use_cache=True):
+    """
+    Order graph of an input file. Like load_instance, it is saved as .npy files into
+    <data_path>.cache/order_graph_<top_k>/ and memory-mapped on later loads while the input file is unchanged.
+    """
+    cache_dir = os.path.join(data_path + '.cache', 'order_graph_{}'.format('all' if top_k is None else top_k))
+    stat = os.stat(data_path)
+    source = {'version': ORDER_GRAPH_CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+              'top_k': top_k}
+
+    if use_cache:
+        try:
+            with open(os.path.join(cache_dir, 'source.json')) as f:
+                cached_source = json.load(f)
+        except (OSError, ValueError):
+            cached_source = None
+        if cached_source == source:
+            return OrderGraph(*[np.asarray(np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r'))
+                                for name in _ARRAYS])
+
+    graph = build_order_graph(load_instance(data_path, use_cache).orders, top_k)
+
+    if use_cache:
+        try:
+            _save_order_graph(cache_dir, graph, source)
+        except OSError:
+            pass
+    return graph
+
+
+def _save_order_graph(cache_dir, graph, source):
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(os.path.join(cache_dir, 'source.json')):
+        os.remove(os.path.join(cache_dir, 'source.json'))
+    for name in _ARRAYS:
+        np.save(os.path.join(cache_dir, name + '.npy'), getattr(graph, name))
+    # written last, so a cache interrupted halfway is never picked up
+    with open(os.path.join(cache_dir, 'source.json'), 'w') as f:
+        json.dump(source, f)
+
+
+if __name__ == '__main__':
+    graph = load_order_graph('../example/contest_input.json', top_k=20)
+    print('orders: {}, servable: {}, edges: {}'.format(len(graph), int((graph.order_times >= 0).sum()),
+                                                        graph.num_edges))
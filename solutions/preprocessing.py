@@ -0,0 +1,160 @@
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, Instance, OrderTable, load_instance
+from solutions.core import write_instance
+from solutions.greedy_by_user import GreedyByUser
+
+RuleReport = namedtuple('RuleReport', ['rule', 'orders', 'couriers'])
+ReducedResult = namedtuple('ReducedResult', ['plan', 'reduction'])
+
+# a courier can be nowhere earlier than this plus the distance from its start point
+_EARLIEST_VISIT = INITIAL_TIME_CONSTANT + 10
+
+
+def _late(visit, window_from, window_to):
+    """Whether a visit is late in the checker: early visits wait for the window to open and are never late."""
+    return (visit >= window_from) & (visit > window_to)
+
+
+def _undeliverable(table, rows, picks_up_at):
+    """Orders picked up no earlier than picks_up_at (where it is not late) that reach the dropoff late."""
+    pickup_late = _late(picks_up_at, table.pickup_from[rows], table.pickup_to[rows])
+    drops_off_at = np.maximum(picks_up_at, table.pickup_from[rows]) + table.trip[rows]
+    return pickup_late | _late(drops_off_at, table.dropoff_from[rows], table.dropoff_to[rows])
+
+
+def _nearest_courier(table, rows, courier_columns):
+    """Distance from every pickup point to the nearest courier start point."""
+    nearest = np.full(len(rows), np.iinfo(np.int64).max, dtype=np.int64)
+    x, y = table.pickup_x[rows], table.pickup_y[rows]
+    # couriers a block at a time to bound the couriers x orders matrix
+    for begin in range(0, len(courier_columns), 256):
+        block = courier_columns[begin:begin + 256]
+        distances = np.abs(block[:, 1, None] - x) + np.abs(block[:, 2, None] - y)
+        nearest = np.minimum(nearest, distances.min(axis=0))
+    return nearest
+
+
+def _dead_window(table, rows, courier_columns, kept_couriers):
+    """Orders that are late at the dropoff even when picked up the moment their pickup window opens."""
+    return _undeliverable(table, rows, table.pickup_from[rows]), np.zeros(len(kept_couriers), dtype=bool)
+
+
+def _unreachable(table, rows, courier_columns, kept_couriers):
+    """Orders no courier gets to in time, even going straight to the pickup point from its start."""
+    nearest = _nearest_courier(table, rows, courier_columns[kept_couriers])
+    return _undeliverable(table, rows, _EARLIEST_VISIT + nearest), np.zeros(len(kept_couriers), dtype=bool)
+
+
+def _unprofitable(table, rows, courier_columns, kept_couriers):
+    """
+    Orders paying less than the wage of driving from their pickup to their dropoff point. Not exact: a
+    courier who would wait somewhere anyway can take such an order within the wait, so it is not a default.
+    """
+    return table.payment[rows] < 2 * table.trip[rows], np.zeros(len(kept_couriers), dtype=bool)
+
+
+def _idle_courier(table, rows, courier_columns, kept_couriers):
+    """Couriers that get to no order in time, even going straight to it from their start."""
+    idle = np.zeros(len(kept_couriers), dtype=bool)
+    candidates = np.flatnonzero(kept_couriers)
+    for begin in range(0, len(candidates), 256):
+        block = courier_columns[candidates[begin:begin + 256]]
+        arrives = _EARLIEST_VISIT + (np.abs(block[:, 1, None] - table.pickup_x[rows]) +
+                                     np.abs(block[:, 2, None] - table.pickup_y[rows]))
+        idle[candidates[begin:begin + 256]] = np.all(_undeliverable(table, rows, arrives), axis=1)
+    return np.zeros(len(rows), dtype=bool), idle
+
+
+# rule name -> function of (table, alive rows, courier columns, mask of kept couriers) returning the masks of
+# the rows and the couriers it removes
+RULES = {
+    'dead_window': _dead_window,
+    'unreachable': _unreachable,
+    'unprofitable': _unprofitable,
+    'idle_courier': _idle_courier,
+}
+# the rules that never remove anything a plan could profit from
+DEFAULT_RULES = ('dead_window', 'unreachable', 'idle_courier')
+
+
+class Reduction:
+    """
+    Smaller instance for the solvers to start from, with the maps back to the ids of the input.
+
+    The rules run in the given order on what the previous ones left, each one reporting how many orders and
+    couriers it removed. The rest gets dense ids, order and courier ids become their indexes in order_ids and
+    courier_ids (the input ids). Point ids are kept, the checker tells depots by their ids and keys the
+    state of every point by it.
+    """
+
+    def __init__(self, instance: Instance, rules=DEFAULT_RULES):
+        table = instance.orders
+        courier_columns = np.asarray(instance.couriers)
+        kept_orders = table.alive.copy()
+        kept_couriers = np.ones(len(courier_columns), dtype=bool)
+        self.report = []
+        for rule in rules:
+            if rule not in RULES:
+                raise ValueError('Unknown reduction rule: {}'.format(rule))
+            rows = np.flatnonzero(kept_orders)
+            orders, couriers = RULES[rule](table, rows, courier_columns, kept_couriers)
+            kept_orders[rows[orders]] = False
+            kept_couriers &= ~couriers
+            self.report.append(RuleReport(rule, int(np.count_nonzero(orders)), int(np.count_nonzero(couriers))))
+
+        rows = np.flatnonzero(kept_orders)
+        self.order_ids = table.order_ids[rows]
+        self.courier_ids = courier_columns[kept_couriers, 0]
+        columns = {column: getattr(table, column)[rows] for column in OrderTable.COLUMNS}
+        columns['order_ids'] = np.arange(len(rows), dtype=np.int64)
+        couriers = courier_columns[kept_couriers].copy()
+        couriers[:, 0] = np.arange(len(couriers))
+        self.instance = Instance(couriers, np.asarray(instance.depots), OrderTable.from_columns(columns))
+        self.input_orders, self.input_couriers = len(table), len(courier_columns)
+
+    def format_report(self):
+        lines = ['{}: {} orders, {} couriers removed'.format(*rule) for rule in self.report]
+        lines.append('{} of {} orders and {} of {} couriers left'.format(
+            len(self.order_ids), self.input_orders, len(self.courier_ids), self.input_couriers))
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """Writes the reduced instance as an input file."""
+        instance = self.instance
+        write_instance(path, instance.orders, np.arange(len(instance.orders)), instance.couriers, instance.depots)
+
+    def restore(self, plan):
+        """Plan over the reduced instance with the ids of the input."""
+        order_ids, courier_ids = self.order_ids.tolist(), self.courier_ids.tolist()
+        return [dict(event, courier_id=courier_ids[event['courier_id']], order_id=order_ids[event['order_id']])
+                for event in plan]
+
+
+def reduce_instance(data_path, rules=DEFAULT_RULES):
+    return Reduction(load_instance(data_path), rules)
+
+
+def reduced_solve(data_path, solver=GreedyByUser, rules=DEFAULT_RULES, **params):
+    """
+    Plan of solver (any solver class taking the path of an input file) run on the reduced instance, in the
+    ids of the input, and the Reduction.
+    """
+    reduction = reduce_instance(data_path, rules)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'reduced.json')
+        reduction.write(path)
+        plan = solver(path, **params).solve()
+    return ReducedResult(reduction.restore(plan), reduction)
+
+
+if __name__ == '__main__':
+    result = reduced_solve('../example/contest_input.json')
+    print(result.reduction.format_report())
+    with open('../example/contest_output_reduced.json', 'w') as outfile:
+        json.dump(result.plan, outfile)
@@ -0,0 +1,268 @@
+import contextlib
+import functools
+import glob
+import hashlib
+import inspect
+import io
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, load_instance
+from solutions.order_graph import OrderGraph, build_order_graph
+
+# bump when the layout of the entries changes, entries of other versions are never hit and age out
+RESULT_CACHE_VERSION = 2
+
+# sources the plans and arrays depend on, relative to the repository: the instance models, the solvers and the
+# checker that verifies the cached profits
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CODE_PATTERNS = ('data_wrappers.py', os.path.join('solutions', '*.py'), os.path.join('src', '*.py'))
+
+DEFAULT_CACHE_DIR = os.environ.get('DOSTAVISTA_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'dostavista'))
+
+_ORDER_GRAPH_ARRAYS = ('order_times', 'indptr', 'indices', 'weights', 'dropoff_times')
+
+CachedPlan = namedtuple('CachedPlan', ['plan', 'profit', 'solver', 'params', 'key'])
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint():
+    """Hash of the sources of _CODE_PATTERNS, read once per process."""
+    digest = hashlib.sha256()
+    paths = sorted(path for pattern in _CODE_PATTERNS for path in glob.glob(os.path.join(_ROOT, pattern)))
+    for path in paths:
+        digest.update(os.path.relpath(path, _ROOT).encode())
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    Disk cache of plans and precomputed arrays, addressed by the content of the input file.
+
+    An entry lives in <root>/<sha256 of the input file>/ under a hash of the solver (or intermediate) name, its
+    parameters and code_fingerprint(), so the same instance hits under any path or mtime and an edited one never
+    does, and neither does any entry after a change to the solvers, the instance models or the checker. Plans are
+    stored with their profit as check_plan verifies it, arrays as .npz files. Reading an entry makes it the
+    most recently used; once the entries take more than max_bytes, the least recently used ones are removed.
+    The size of the cache is scanned on the first write and then estimated by adding up what this process
+    writes, the cache is scanned again only when the estimate crosses max_bytes. Entries are written to a
+    temporary file and renamed, so concurrent runs never read half an entry, and never count or remove the
+    temporary files of each other.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=1 << 30):
+        self._root = root
+        self._max_bytes = max_bytes
+        # bytes taken by the entries as of the last scan plus the ones written since, None before the first write
+        self._size = None
+        # (path, size, mtime) -> content hash, the input is hashed once per process while unchanged
+        self._instance_keys = {}
+
+    def instance_key(self, data_path):
+        stat = os.stat(data_path)
+        source = (os.path.abspath(data_path), stat.st_size, stat.st_mtime_ns)
+        if source not in self._instance_keys:
+            digest = hashlib.sha256()
+            with open(data_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            self._instance_keys[source] = digest.hexdigest()
+        return self._instance_keys[source]
+
+    @staticmethod
+    def entry_key(name, params):
+        text = json.dumps({'version': RESULT_CACHE_VERSION, 'code': code_fingerprint(), 'name': name,
+                           'params': params}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+    def _path(self, data_path, kind, key, extension):
+        return os.path.join(self._root, self.instance_key(data_path), '{}-{}{}'.format(kind, key, extension))
+
+    def get_plan(self, data_path, solver, params=None):
+        """CachedPlan of the solver run with params on the instance, None on a miss."""
+        key = self.entry_key(solver, params or {})
+        try:
+            with open(self._path(data_path, 'plan', key, '.jsonl')) as f:
+                meta = json.loads(f.readline())
+                plan = json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        self._touch(self._path(data_path, 'plan', key, '.jsonl'))
+        return CachedPlan(plan, meta['profit'], meta['solver'], meta['params'], key)
+
+    def put_plan(self, data_path, solver, params, plan):
+        """Verifies the plan with check_plan (raising for an invalid one), stores it and returns its CachedPlan."""
+        from src.check import check_plan
+        with contextlib.redirect_stdout(io.StringIO()):
+            profit = check_plan(data_path, plan)['profit']
+        params = params or {}
+        key = self.entry_key(solver, params)
+        meta = {'solver': solver, 'params': params, 'profit': profit}
+        self._write(self._path(data_path, 'plan', key, '.jsonl'),
+                    lambda f: f.write((json.dumps(meta) + '\n' + json.dumps(plan) + '\n').encode()))
+        return CachedPlan(plan, profit, solver, params, key)
+
+    def best_plan(self, data_path):
+        """Most profitable cached plan of the instance by any solver, None if there is none."""
+        directory = os.path.join(self._root, self.instance_key(data_path))
+        best_profit, best_key = None, None
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return None
+        for name in names:
+            if not (name.startswith('plan-') and name.endswith('.jsonl')):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    profit = json.loads(f.readline())['profit']
+            except (OSError, ValueError, KeyError):
+                continue
+            if best_profit is None or profit > best_profit:
+                best_profit, best_key = profit, name[len('plan-'):-len('.jsonl')]
+        if best_key is None:
+            return None
+        with open(os.path.join(directory, 'plan-{}.jsonl'.format(best_key))) as f:
+            meta = json.loads(f.readline())
+            plan = json.loads(f.readline())
+        self._touch(os.path.join(directory, 'plan-{}.jsonl'.format(best_key)))
+        return CachedPlan(plan, meta['profit'], meta['solver'], meta['params'], best_key)
+
+    def arrays(self, data_path, name, params, compute):
+        """Named arrays an intermediate of the instance consists of, compute() builds them on a miss."""
+        path = self._path(data_path, name, self.entry_key(name, params), '.npz')
+        try:
+            with np.load(path) as stored:
+                arrays = {array: stored[array] for array in stored.files}
+            self._touch(path)
+            return arrays
+        except (OSError, ValueError):
+            pass
+        arrays = compute()
+        self._write(path, lambda f: np.savez(f, **arrays))
+        return arrays
+
+    def order_graph(self, data_path, top_k=None):
+        """Order graph of the instance (the feasible order -> order transitions), see build_order_graph."""
+        def compute():
+            graph = build_order_graph(load_instance(data_path).orders, top_k)
+            return {name: getattr(graph, name) for name in _ORDER_GRAPH_ARRAYS}
+
+        arrays = self.arrays(data_path, 'order_graph', {'top_k': top_k}, compute)
+        return OrderGraph(*[arrays[name] for name in _ORDER_GRAPH_ARRAYS])
+
+    def courier_candidates(self, data_path, top_k=20):
+        """
+        The top_k most profitable first orders of every courier from its start point at the start of the day,
+        as (couriers x top_k) arrays of rows and revenues, best first and padded with row -1.
+        """
+        def compute():
+            instance = load_instance(data_path)
+            couriers = instance.couriers
+            rows = np.full((len(couriers), top_k), -1, dtype=np.int64)
+            revenues = np.zeros((len(couriers), top_k), dtype=np.int64)
+            # couriers are scored a block at a time to bound the couriers x orders matrix
+            for begin in range(0, len(couriers), 256):
+                block = couriers[begin:begin + 256]
+                scored = instance.orders.revenues_block(block[:, 1], block[:, 2],
+                                                        np.full(len(block), INITIAL_TIME_CONSTANT))
+                for line, candidates in enumerate(scored):
+                    best = np.argsort(-candidates, kind='stable')[:top_k]
+                    best = best[candidates[best] > 0]
+                    rows[begin + line, :len(best)] = best
+                    revenues[begin + line, :len(best)] = candidates[best]
+            return {'rows': rows, 'revenues': revenues}
+
+        arrays = self.arrays(data_path, 'courier_candidates', {'top_k': top_k}, compute)
+        return arrays['rows'], arrays['revenues']
+
+    def _write(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as f:
+            write(f)
+            size = f.tell()
+        os.replace(temporary, path)
+        if self._size is not None:
+            self._size += size
+        if self._size is None or self._size > self._max_bytes:
+            self._evict()
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Removes the least recently used entries until all of them fit into max_bytes."""
+        entries, total = [], 0
+        for directory in os.scandir(self._root):
+            if not directory.is_dir():
+                continue
+            # entries and directories may be removed by other processes while they are listed
+            with contextlib.suppress(OSError):
+                for entry in os.scandir(directory.path):
+                    if entry.name.endswith('.tmp'):
+                        continue
+                    with contextlib.suppress(OSError):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                        total += stat.st_size
+        self._size = total
+        if total <= self._max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                total -= size
+        self._size = total
+        for directory in os.scandir(self._root):
+            if directory.is_dir():
+                with contextlib.suppress(OSError):
+                    # only empty directories go
+                    os.rmdir(directory.path)
+
+
+def cached_solve(data_path, solver, params=None, cache=None, warm_start=False, salt=None):
+    """
+    CachedPlan of solver (a solver class taking the path of an input file) run with params on the instance,
+    from the cache if it was run before. With warm_start, solvers that take a starting plan (LocalSearch)
+    start from the best cached plan of the instance, which becomes part of the key. salt is a dict of what
+    else the plan depends on (the seed of the random module), it goes into the key but not to the solver.
+    """
+    cache = cache or ResultCache()
+    params = dict(params or {})
+    key_params = dict(params, **(salt or {}))
+    seed = None
+    if warm_start and 'plan' in inspect.signature(solver).parameters:
+        seed = cache.best_plan(data_path)
+        if seed is not None:
+            key_params['warm_start'] = seed.key
+
+    cached = cache.get_plan(data_path, solver.__name__, key_params)
+    if cached is not None:
+        return cached
+
+    if seed is not None:
+        params['plan'] = seed.plan
+    plan = solver(data_path, **params).solve()
+    return cache.put_plan(data_path, solver.__name__, key_params, plan)
+
+
+if __name__ == '__main__':
+    from solutions.local_search import LocalSearch
+    result = cached_solve('../example/contest_input.json', LocalSearch, {'time_limit': 10.0}, warm_start=True)
+    print('profit {} of {} with {}'.format(result.profit, result.solver, result.params))
+    with open('../example/contest_output_cached.json', 'w') as outfile:
+        json.dump(result.plan, outfile)
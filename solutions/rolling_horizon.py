@@ -0,0 +1,349 @@
+import heapq
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from data_wrappers import INITIAL_TIME_CONSTANT, OrderTable, load_instance, new_couriers
+from solutions.greedy_by_user import GreedyByUser
+from solutions.core import EMPTY_RUN, join_runs, order_events, order_runs, plain_rows
+
+# completion time of the cells of the stop arrays that are no insertion point
+_NEVER = 1 << 40
+
+
+class _LiveRoute:
+    """
+    Route of a courier during the day: the orders it already set off for (done) and the ones ahead (rows),
+    with the runs (see core.join_runs) of all prefixes and suffixes of rows. start is the run of the
+    courier standing at the end of its done orders.
+    """
+
+    __slots__ = ('courier_id', 'start', 'rows', 'prefix', 'suffix', 'paid', 'profit', 'done', 'done_paid',
+                 'done_end', 'available')
+
+    def __init__(self, courier_id, x, y):
+        self.courier_id = courier_id
+        self.start = (INITIAL_TIME_CONSTANT, 0, INITIAL_TIME_CONSTANT, x, y, x, y)
+        self.rows = []
+        self.done = []
+        self.done_paid = 0
+        self.done_end = INITIAL_TIME_CONSTANT
+        self.available = True
+
+    def update(self, runs, payment):
+        """Recomputes the caches after rows or start changed, O(len(rows))."""
+        rows = self.rows
+        self.prefix = prefix = [self.start]
+        self.paid = paid = [0]
+        for row in rows:
+            prefix.append(join_runs(prefix[-1], runs[row]))
+            paid.append(paid[-1] + payment[row])
+        self.suffix = suffix = [EMPTY_RUN] * (len(rows) + 1)
+        for position in range(len(rows) - 1, -1, -1):
+            suffix[position] = join_runs(runs[rows[position]], suffix[position + 1])
+        if prefix[-1] is None:
+            raise ValueError('Route of courier {} is late'.format(self.courier_id))
+        self.profit = self.profit_with(prefix[-1], paid[-1])
+
+    def profit_with(self, run, paid):
+        """Profit of the whole day of the courier if the orders ahead make up run and pay paid."""
+        end = run[0] + run[1] if run is not self.start else self.done_end
+        return self.done_paid + paid - 2 * (end - INITIAL_TIME_CONSTANT)
+
+
+class RollingPlanner:
+    """
+    Keeps the plan of the day up to date while orders come and go and couriers drop out.
+
+    The planner starts from a plan (by default the one of GreedyByUser) at the start of the day and is told
+    about changes as they happen: add_order, cancel_order and courier_unavailable, each at a time that
+    never goes back. An order is executed, and frozen, once its courier sets off for it, that is when the
+    courier completes the order before it; executed orders are never touched again. Only the routes a change
+    affects are repaired:
+
+    - a new order is inserted where it adds the most profit, or waits in the pool of unassigned orders;
+    - a cancelled order leaves its route, which then takes the pool orders that pay most on it;
+    - the orders ahead of a courier that drops out are inserted elsewhere, best paying first.
+
+    Routes keep the runs of their prefixes and suffixes as in LocalSearch, so an insertion is checked in
+    constant time. The completion times and end points of all prefixes sit in (courier x position) arrays, a
+    vectorized reachability test picks the few insertion points worth checking, so an update takes
+    milliseconds even with thousands of couriers. Couriers whose events are not plain pickup / dropoff pairs
+    are kept as they are; total_revenue is the profit of the other routes.
+    """
+
+    def __init__(self, data_path, plan=None):
+        instance = load_instance(data_path)
+        self._setup(instance.orders, np.array(instance.couriers), plan)
+
+    @classmethod
+    def from_table(cls, orders_table: OrderTable, courier_columns, plan=None):
+        """Planner over an already loaded order table, the table is not changed."""
+        planner = cls.__new__(cls)
+        planner._setup(orders_table, courier_columns, plan)
+        return planner
+
+    def _setup(self, orders_table, courier_columns, plan):
+        if plan is None:
+            plan = GreedyByUser.from_table(OrderTable.from_columns(orders_table.columns()),
+                                           new_couriers(courier_columns)).solve()
+        self.now = INITIAL_TIME_CONSTANT
+        self._runs = order_runs(orders_table)
+        self._payment = orders_table.payment.tolist()
+        self._order_ids = orders_table.order_ids.tolist()
+        self._pickup_points = orders_table.pickup_point_ids.tolist()
+        self._dropoff_points = orders_table.dropoff_point_ids.tolist()
+        self._row_of = {order_id: row for row, order_id in enumerate(self._order_ids)}
+        self._route_of = [-1] * len(orders_table)
+
+        self.total_revenue = 0
+        self._routes = []
+        self._fixed_events = []
+        self._departures = []
+        width = 8
+        self._stop_time = np.full((len(courier_columns), width), _NEVER, dtype=np.int64)
+        self._stop_x = np.zeros((len(courier_columns), width), dtype=np.int64)
+        self._stop_y = np.zeros((len(courier_columns), width), dtype=np.int64)
+
+        events_of = defaultdict(list)
+        for event in plan:
+            events_of[event['courier_id']].append(event)
+        for courier_id, x, y in courier_columns.tolist():
+            route = _LiveRoute(courier_id, x, y)
+            idx = len(self._routes)
+            self._routes.append(route)
+            rows = plain_rows(orders_table, self._runs, events_of.get(courier_id, []))
+            if rows is None:
+                # couriers with depot visits or several orders on board are kept as they are
+                route.available = False
+                self._fixed_events.extend(events_of[courier_id])
+                for event in events_of[courier_id]:
+                    if event['order_id'] in self._row_of:
+                        self._route_of[self._row_of[event['order_id']]] = idx
+                rows = []
+            self._set_rows(idx, rows)
+
+        self._pool = {row for row in range(len(orders_table))
+                      if self._route_of[row] == -1 and orders_table.alive[row] and self._runs[row] is not None}
+
+    def add_order(self, order, at):
+        """
+        New order at time at, order is a dict of the input file format. Returns the courier ids whose routes
+        changed.
+        """
+        self.advance(at)
+        if order['order_id'] in self._row_of:
+            raise ValueError('Order {} already exists'.format(order['order_id']))
+        row = len(self._runs)
+        self._row_of[order['order_id']] = row
+        self._order_ids.append(order['order_id'])
+        self._pickup_points.append(order['pickup_point_id'])
+        self._dropoff_points.append(order['dropoff_point_id'])
+        self._payment.append(order['payment'])
+        self._route_of.append(-1)
+        self._runs.append(self._order_run(order))
+        if self._runs[row] is None:
+            return []
+        return self._place([row])
+
+    def cancel_order(self, order_id, at):
+        """Order cancelled at time at. Returns the courier ids whose routes changed."""
+        self.advance(at)
+        row = self._row_of.get(order_id)
+        if row is None:
+            raise ValueError('Unknown order {}'.format(order_id))
+        self._pool.discard(row)
+        idx = self._route_of[row]
+        if idx == -1:
+            self._runs[row] = None
+            return []
+        route = self._routes[idx]
+        if row not in route.rows:
+            raise ValueError('Order {} is executed or on a route the planner keeps as it is'.format(order_id))
+        self._runs[row] = None
+        self._set_rows(idx, [other for other in route.rows if other != row])
+        self._route_of[row] = -1
+        self._refill(idx)
+        return [route.courier_id]
+
+    def courier_unavailable(self, courier_id, at):
+        """
+        Courier drops out at time at, after the order it is on. Its orders ahead go to other couriers.
+        Returns the courier ids whose routes changed.
+        """
+        self.advance(at)
+        idx = next((idx for idx, route in enumerate(self._routes) if route.courier_id == courier_id), None)
+        if idx is None:
+            raise ValueError('Unknown courier {}'.format(courier_id))
+        route = self._routes[idx]
+        released = route.rows
+        route.available = False
+        self._set_rows(idx, [])
+        return sorted({route.courier_id} | set(self._place(released)))
+
+    def advance(self, now):
+        """Moves the clock to now and freezes the orders couriers set off for in the meantime."""
+        if now < self.now:
+            raise ValueError('Time goes back from {} to {}'.format(self.now, now))
+        self.now = now
+        departures = self._departures
+        while departures and departures[0][0] <= now:
+            departs_at, idx = heapq.heappop(departures)
+            route = self._routes[idx]
+            if not route.rows or route.start[0] != departs_at:
+                continue
+            # the courier set off for its next order and goes on to the following ones until one is ahead of now
+            executed = 0
+            while executed < len(route.rows) and route.prefix[executed][0] + route.prefix[executed][1] <= now:
+                executed += 1
+            rows = route.rows
+            end = route.prefix[executed]
+            for row in rows[:executed]:
+                self._pool.discard(row)
+            route.done.extend(rows[:executed])
+            route.done_paid += route.paid[executed]
+            route.done_end = end[0] + end[1]
+            route.start = (route.done_end, 0, route.done_end, end[5], end[6], end[5], end[6])
+            # executed orders stay on the route
+            route.rows = rows[executed:]
+            self._set_rows(idx, route.rows)
+
+    def plan(self):
+        """Events of the current plan, executed and ahead, in the input order of the couriers."""
+        answer = list(self._fixed_events)
+        for route in self._routes:
+            for row in route.done + route.rows:
+                answer.extend(order_events(route.courier_id, self._order_ids[row], self._pickup_points[row],
+                                           self._dropoff_points[row]))
+        return answer
+
+    @staticmethod
+    def _order_run(order):
+        trip = (10 + abs(order['pickup_location_x'] - order['dropoff_location_x']) +
+                abs(order['pickup_location_y'] - order['dropoff_location_y']))
+        if order['pickup_from'] + trip > order['dropoff_to']:
+            return None
+        return (max(order['pickup_from'], order['dropoff_from'] - trip), trip,
+                min(order['pickup_to'], order['dropoff_to'] - trip), order['pickup_location_x'],
+                order['pickup_location_y'], order['dropoff_location_x'], order['dropoff_location_y'])
+
+    def _set_rows(self, idx, rows):
+        route = self._routes[idx]
+        if route.rows is not rows:
+            for row in route.rows:
+                if self._route_of[row] == idx:
+                    self._route_of[row] = -1
+        route.rows = rows
+        for row in rows:
+            self._route_of[row] = idx
+        if rows:
+            # an idle courier given work sets off now at the earliest
+            route.start = self._anchor(route)
+        if hasattr(route, 'profit'):
+            self.total_revenue -= route.profit
+        route.update(self._runs, self._payment)
+        self.total_revenue += route.profit
+
+        if len(rows) + 1 > self._stop_time.shape[1]:
+            extra = self._stop_time.shape[1]
+            self._stop_time = np.pad(self._stop_time, ((0, 0), (0, extra)), constant_values=_NEVER)
+            self._stop_x = np.pad(self._stop_x, ((0, 0), (0, extra)))
+            self._stop_y = np.pad(self._stop_y, ((0, 0), (0, extra)))
+        self._stop_time[idx] = _NEVER
+        if route.available:
+            prefix = route.prefix
+            self._stop_time[idx, :len(prefix)] = [run[0] + run[1] for run in prefix]
+            self._stop_x[idx, :len(prefix)] = [run[5] for run in prefix]
+            self._stop_y[idx, :len(prefix)] = [run[6] for run in prefix]
+        if rows:
+            heapq.heappush(self._departures, (route.start[0], idx))
+
+    def _anchor(self, route):
+        """Run of the courier before its orders ahead, it cannot set off before now."""
+        start = route.start
+        if start[0] >= self.now:
+            return start
+        return (self.now, 0, self.now) + start[3:]
+
+    def _gain(self, idx, cut, row):
+        """Profit change of inserting the order at position cut of the route, None if it is late."""
+        route = self._routes[idx]
+        start = route.prefix[cut] if cut else self._anchor(route)
+        joined = join_runs(join_runs(start, self._runs[row]), route.suffix[cut])
+        if joined is None:
+            return None
+        return route.profit_with(joined, route.paid[-1] + self._payment[row]) - route.profit
+
+    def _reachable(self, run, routes=slice(None)):
+        """(route, cut) pairs where a courier can still get to the pickup point of run in time."""
+        times = np.maximum(self._stop_time[routes], self.now)
+        reach = (times + 10 + np.abs(self._stop_x[routes] - run[3]) + np.abs(self._stop_y[routes] - run[4]) <=
+                 run[2])
+        return np.nonzero(reach)
+
+    def _insert_best(self, row):
+        """Inserts the order where it adds most profit, returns the route index or -1 if nowhere pays."""
+        best_gain, best_move = 0, None
+        for idx, cut in zip(*(axis.tolist() for axis in self._reachable(self._runs[row]))):
+            gain = self._gain(idx, cut, row)
+            if gain is not None and gain > best_gain:
+                best_gain, best_move = gain, (idx, cut)
+        if best_move is None:
+            return -1
+        idx, cut = best_move
+        rows = self._routes[idx].rows
+        self._set_rows(idx, rows[:cut] + [row] + rows[cut:])
+        return idx
+
+    def _place(self, rows):
+        """Inserts the orders best paying first, the ones nowhere pays for go to the pool."""
+        changed = set()
+        for row in sorted(rows, key=lambda row: -self._payment[row]):
+            idx = self._insert_best(row)
+            if idx == -1:
+                self._pool.add(row)
+            else:
+                self._pool.discard(row)
+                changed.add(self._routes[idx].courier_id)
+        return sorted(changed)
+
+    def _refill(self, idx):
+        """Inserts into the route the pool orders that add most profit to it, one at a time."""
+        route = self._routes[idx]
+        while self._pool and route.available:
+            pool = [row for row in self._pool if self._runs[row] is not None and self._runs[row][2] >= self.now]
+            self._pool = set(pool)
+            runs = [self._runs[row] for row in pool]
+            latest = np.array([run[2] for run in runs], dtype=np.int64)
+            pickup_x = np.array([run[3] for run in runs], dtype=np.int64)
+            pickup_y = np.array([run[4] for run in runs], dtype=np.int64)
+
+            best_gain, best_move = 0, None
+            for cut in range(len(route.rows) + 1):
+                if cut:
+                    x, y, ready = self._stop_x[idx, cut], self._stop_y[idx, cut], self._stop_time[idx, cut]
+                else:
+                    anchor = self._anchor(route)
+                    x, y, ready = anchor[5], anchor[6], anchor[0]
+                candidates = np.flatnonzero(ready + 10 + np.abs(pickup_x - x) + np.abs(pickup_y - y) <= latest)
+                for position in candidates.tolist():
+                    gain = self._gain(idx, cut, pool[position])
+                    if gain is not None and gain > best_gain:
+                        best_gain, best_move = gain, (cut, pool[position])
+            if best_move is None:
+                return
+            cut, row = best_move
+            self._pool.discard(row)
+            self._set_rows(idx, route.rows[:cut] + [row] + route.rows[cut:])
+
+
+if __name__ == '__main__':
+    planner = RollingPlanner('../example/contest_input.json')
+    started = time.perf_counter()
+    changed = planner.courier_unavailable(planner.plan()[0]['courier_id'], 600)
+    print('Courier dropped out at 600, {} routes changed in {:.1f} ms, profit {}'.format(
+        len(changed), (time.perf_counter() - started) * 1000, planner.total_revenue))
+    with open('../example/contest_output_rolling_horizon.json', 'w') as outfile:
+        json.dump(planner.plan(), outfile)
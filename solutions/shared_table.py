@@ -0,0 +1,30 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from data_wrappers import OrderTable
+
+
+def share_order_table(table: OrderTable):
+    """
+    Copy the columns of the table into one shared memory block.
+    Returns the block (the caller closes and unlinks it) and a small picklable handle for attach_order_table.
+    """
+    num_rows = len(table)
+    block = shared_memory.SharedMemory(create=True, size=max(len(OrderTable.COLUMNS) * num_rows * 8, 1))
+    matrix = np.ndarray((len(OrderTable.COLUMNS), num_rows), dtype=np.int64, buffer=block.buf)
+    for idx, column in enumerate(OrderTable.COLUMNS):
+        matrix[idx] = getattr(table, column)
+    return block, (block.name, num_rows)
+
+
+def attach_order_table(handle):
+    """
+    Fresh OrderTable (all orders alive) whose columns are read-only views of the shared block.
+    The returned block must be kept referenced for as long as the table is used.
+    """
+    name, num_rows = handle
+    block = shared_memory.SharedMemory(name=name)
+    matrix = np.ndarray((len(OrderTable.COLUMNS), num_rows), dtype=np.int64, buffer=block.buf)
+    matrix.flags.writeable = False
+    return block, OrderTable.from_columns(dict(zip(OrderTable.COLUMNS, matrix)))
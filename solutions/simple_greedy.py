@@ -1,125 +1,131 @@
+import heapq
 import json
+import time
 import numpy as np
 
-from data_wrappers import Courier, Order
-from collections import namedtuple
+from data_wrappers import Courier, Order, load_instance, new_couriers
+from solutions import core
+from solutions.instrumentation import (CANDIDATES_PRUNED, DISABLED, EMIT, LOAD, ORDERS_ASSIGNED,
+                                       REVENUE_EVALUATIONS, SCORE, SELECT)
+from solutions.spatial_index import PickupGrid
+from collections import defaultdict, namedtuple
 
 CompletedOrderInfo = namedtuple('OrderInfo', ['courier_id', 'order_id', 'revenue'])
 
 
 class OneStepGreedy:
-    def __init__(self, data_path):
-        with open(data_path) as f:
-            data = json.loads(f.read())
+    def __init__(self, data_path, instrumentation=None):
+        self._stats = instrumentation or DISABLED
+        with self._stats.phase(LOAD):
+            instance = load_instance(data_path)
 
-        self._couriers = [Courier(x) for x in data['couriers']]
-        self._orders = [Order(x) for x in data['orders']]
+            self._couriers = new_couriers(instance.couriers)
+            self._orders = instance.orders.to_orders()
 
-        print(len(self._couriers))
-        print(len(self._orders))
+            self._orders_map = {order.order_id: order for order in self._orders}
+            self._couriers_map = {courier.id: courier for courier in self._couriers}
 
-        self._orders_map = {order.order_id: order for order in self._orders}
-        self._couriers_map = {courier.id: courier for courier in self._couriers}
+            self._orders_immutable_map = {order.order_id: order for order in self._orders}
+            self._orders_table = instance.orders
+            self._pickup_index = PickupGrid(self._orders_table)
 
-        self._orders_immutable_map = {order.order_id: order for order in self._orders}
+    time_when_picks_up = staticmethod(core.time_when_picks_up)
 
-    @staticmethod
-    def time_when_picks_up(courier: Courier, order: Order):
-        if courier.get_current_time() > order.pickup_to:
-            return None
-        arrives_to_point_at = courier.get_current_time() + 10 + abs(courier.location_x - order.pickup_location_x) + abs(
-            courier.location_y - order.pickup_location_y)
-        if arrives_to_point_at > order.pickup_to:
-            return None
-        if arrives_to_point_at < order.pickup_from:
-            arrives_to_point_at += order.pickup_from - arrives_to_point_at
-        return arrives_to_point_at
-
-    @staticmethod
-    def time_when_dropoffs_of(courier_actual_time: int, order: Order):
-        if courier_actual_time > order.dropoff_to:
-            return None
-
-        arrives_to_point_at = courier_actual_time + 10 + abs(order.pickup_location_x - order.dropoff_location_x) + abs(
-            order.pickup_location_y - order.dropoff_location_y)
-
-        if arrives_to_point_at > order.dropoff_to:
-            return None
-
-        if arrives_to_point_at < order.dropoff_from:
-            arrives_to_point_at += order.dropoff_from - arrives_to_point_at
-        return arrives_to_point_at
+    time_when_dropoffs_of = staticmethod(core.time_when_dropoffs_of)
 
     def revenue_from_completing_order(self, courier: Courier, order: Order):
-        initial_time = courier.get_current_time()
-        arrives_to_pick_up_point = self.time_when_picks_up(courier, order)
-
-        if not arrives_to_pick_up_point:
-            return float('-inf')
-
-        arrives_to_dropoff_point = self.time_when_dropoffs_of(arrives_to_pick_up_point, order)
-        if not arrives_to_dropoff_point:
-            return float('-inf')
-
-        return order.payment - 2 * (arrives_to_dropoff_point - initial_time)
+        return core.revenue_from_completing_order(courier, order)
 
     def solve(self):
         completed_orders = []
         total_revenue = 0
 
-        while True and len(self._orders) > 0:
-            found_positive_revenues = [self._find_optimal_courier_step(c) for c in self._couriers]
-
-            all_revenues = [x.revenue for x in found_positive_revenues]
-            max_index = np.argmax(all_revenues)
-            if found_positive_revenues[max_index].revenue < 0:
-                break
-
-            total_revenue += found_positive_revenues[max_index].revenue
-
-            cur_order_info = found_positive_revenues[0]
-            courier = self._couriers_map[cur_order_info.courier_id]
-            order = self._orders_map.pop(cur_order_info.order_id)
+        # heap of (-revenue, courier index, order_id) with the cached best move of every courier,
+        # entries that no longer match _cached_steps are stale and skipped
+        self._best_steps = []
+        self._cached_steps = {}
+        self._couriers_waiting_for = defaultdict(set)
+        stats = self._stats
+        enabled = stats.enabled
+        with stats.phase(SCORE):
+            for idx in range(len(self._couriers)):
+                self._cache_best_step(idx)
+
+        while self._best_steps:
+            if enabled:
+                started = time.perf_counter()
+            _, idx, order_id = heapq.heappop(self._best_steps)
+            cur_order_info = self._cached_steps.get(idx)
+            if cur_order_info is None or cur_order_info.order_id != order_id:
+                continue
+
+            total_revenue += cur_order_info.revenue
+
+            courier = self._couriers[idx]
+            order = self._orders_map.pop(order_id)
+            self._orders_table.remove(order_id)
+            self._pickup_index.remove(order_id)
 
             arrives_to_dropoff_point = self.time_when_dropoffs_of(self.time_when_picks_up(courier, order), order)
             courier.update_current_time(arrives_to_dropoff_point)
             courier.update_current_pos(order.dropoff_location_x, order.dropoff_location_y)
 
-            completed_orders.append(found_positive_revenues[0])
-            print('Update records, num: {}'.format(len(completed_orders)))
-
+            completed_orders.append(cur_order_info)
+            if enabled:
+                selected = time.perf_counter()
+                stats.add_time(SELECT, selected - started)
+
+            # other couriers' best moves stay valid unless they were aiming at the order just taken
+            affected = self._couriers_waiting_for.pop(order_id, set())
+            affected.add(idx)
+            for courier_idx in sorted(affected):
+                self._cache_best_step(courier_idx)
+            if enabled:
+                rescored = time.perf_counter()
+                stats.add_time(SCORE, rescored - selected)
+                if stats.sampled():
+                    stats.observe('assignment', rescored - started)
+                stats.progress('assignment', orders_assigned=len(completed_orders))
+
+        if enabled:
+            stats.count(ORDERS_ASSIGNED, len(completed_orders))
+            emitted = time.perf_counter()
         answer = []
         for record in completed_orders:
-            answer.append({
-                'courier_id': record.courier_id,
-                'action': 'pickup',
-                'order_id': record.order_id,
-                'point_id': self._orders_immutable_map[record.order_id].pickup_point_id
-            })
-
-            answer.append({
-                'courier_id': record.courier_id,
-                'action': 'dropoff',
-                'order_id': record.order_id,
-                'point_id': self._orders_immutable_map[record.order_id].dropoff_point_id
-            })
+            order = self._orders_immutable_map[record.order_id]
+            answer.extend(core.order_events(record.courier_id, record.order_id, order.pickup_point_id,
+                                            order.dropoff_point_id))
+        if enabled:
+            stats.add_time(EMIT, time.perf_counter() - emitted)
         return answer
 
+    def _cache_best_step(self, idx):
+        previous = self._cached_steps.pop(idx, None)
+        if previous is not None:
+            self._couriers_waiting_for[previous.order_id].discard(idx)
+
+        step = self._find_optimal_courier_step(self._couriers[idx])
+        if step.revenue <= 0:
+            return
+        self._cached_steps[idx] = step
+        self._couriers_waiting_for[step.order_id].add(idx)
+        heapq.heappush(self._best_steps, (-step.revenue, idx, step.order_id))
+
     def _find_optimal_courier_step(self, courier):
-        variants = []
-        for key in self._orders_map:
-            revenue = self.revenue_from_completing_order(courier, self._orders_map[key])
-            if revenue > 0:
-                variants.append(CompletedOrderInfo(courier.id, self._orders_map[key].order_id, revenue))
-        if not variants:
+        rows = self._pickup_index.query(courier.location_x, courier.location_y, courier.get_current_time())
+        if not len(rows):
             return CompletedOrderInfo(courier.id, -1, float('-inf'))
 
-        variants.sort(key=lambda x: x.revenue, reverse=True)
-        revenues = [x.revenue for x in variants]
-        max_index = np.argmax(revenues)
-        if variants[max_index].revenue < 0:
+        revenues = self._orders_table.revenues(courier.location_x, courier.location_y, courier.get_current_time(),
+                                               rows=rows)
+        if self._stats.enabled:
+            self._stats.count(REVENUE_EVALUATIONS, len(rows))
+            self._stats.count(CANDIDATES_PRUNED, int(np.count_nonzero(revenues == -np.inf)))
+        max_index = int(np.argmax(revenues))
+        if revenues[max_index] <= 0:
             return CompletedOrderInfo(courier.id, -1, float('-inf'))
-        return variants[max_index]
+        return CompletedOrderInfo(courier.id, int(self._orders_table.order_ids[rows[max_index]]),
+                                  int(revenues[max_index]))
 
 
 if __name__ == '__main__':
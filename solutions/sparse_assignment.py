@@ -0,0 +1,92 @@
+import heapq
+
+import numpy as np
+
+
+def top_k_profitable(revenues, k):
+    """
+    For every row of a couriers x orders revenue block keep at most k columns with the largest positive revenue.
+    Returns a list with a (columns, revenues) pair of int arrays per row.
+    """
+    candidates = []
+    for row in revenues:
+        columns = np.flatnonzero(row > 0)
+        if len(columns) > k:
+            columns = columns[np.argpartition(-row[columns], k - 1)[:k]]
+        candidates.append((columns, row[columns].astype(np.int64)))
+    return candidates
+
+
+def max_revenue_assignment(candidates):
+    """
+    Maximum total revenue matching of rows to columns, every row gets at most one column and every column at most
+    one row. candidates[row] is a (columns, revenues) pair, only those edges exist.
+
+    Shortest augmenting path with dual potentials (Jonker-Volgenant style) run over the sparse edges: every row also
+    owns a private zero-cost dummy column that stands for 'stay unassigned', so an augmentation is a Dijkstra search
+    that stops at the first free column and only ever touches columns reachable through the candidate lists.
+    Returns a list of (row, column) pairs for rows matched to a real column.
+    """
+    num_rows = len(candidates)
+    edges = [list(zip(columns.tolist(), (-revenues).tolist())) for columns, revenues in candidates]
+
+    row_potential = [0] * num_rows
+    # columns are either real (>= 0) or the dummy of row r, encoded as -r - 1
+    column_potential = {}
+    row_for_column = {}
+    column_for_row = [None] * num_rows
+
+    for start_row in range(num_rows):
+        if not edges[start_row]:
+            column_for_row[start_row] = -start_row - 1
+            row_for_column[-start_row - 1] = start_row
+            continue
+
+        path_cost = {}
+        previous_row = {}
+        visited_rows = []
+        scanned_columns = {}
+        queue = []
+        min_value = 0
+        row = start_row
+        sink = None
+
+        while sink is None:
+            visited_rows.append(row)
+            row_edges = edges[row] + [(-row - 1, 0)]
+            for column, cost in row_edges:
+                if column in scanned_columns:
+                    continue
+                reduced = min_value + cost - row_potential[row] - column_potential.get(column, 0)
+                if reduced < path_cost.get(column, float('inf')):
+                    path_cost[column] = reduced
+                    previous_row[column] = row
+                    # free columns win ties so the search ends as early as possible
+                    heapq.heappush(queue, (reduced, column in row_for_column, column))
+
+            while True:
+                min_value, _, column = heapq.heappop(queue)
+                if column not in scanned_columns and path_cost[column] == min_value:
+                    break
+            scanned_columns[column] = min_value
+
+            if column in row_for_column:
+                row = row_for_column[column]
+            else:
+                sink = column
+
+        row_potential[start_row] += min_value
+        for row in visited_rows[1:]:
+            row_potential[row] += min_value - scanned_columns[column_for_row[row]]
+        for column, cost in scanned_columns.items():
+            column_potential[column] = column_potential.get(column, 0) - (min_value - cost)
+
+        column = sink
+        while True:
+            row = previous_row[column]
+            row_for_column[column] = row
+            column, column_for_row[row] = column_for_row[row], column
+            if row == start_row:
+                break
+
+    return [(row, column) for row, column in enumerate(column_for_row) if column is not None and column >= 0]
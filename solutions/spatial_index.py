@@ -0,0 +1,94 @@
+import numpy as np
+
+from data_wrappers import OrderTable
+
+# pickup_to fits well below this, so cell * _KEY_STRIDE - pickup_to orders rows by cell, then by pickup_to descending
+_KEY_STRIDE = 1 << 20
+
+
+class PickupGrid:
+    """
+    Uniform grid over pickup points of an OrderTable.
+
+    Rows of every cell are kept sorted by pickup_to descending, so for a query only the prefix of a cell with
+    pickup_to >= now + 10 + (distance to the cell) is touched. Removed orders are skipped lazily and the grid
+    is rebuilt once more than half of its rows are dead.
+    """
+
+    def __init__(self, table: OrderTable, orders_per_cell=128):
+        self._table = table
+        self._orders_per_cell = orders_per_cell
+        self._build()
+
+    def _build(self):
+        table = self._table
+        rows = np.flatnonzero(table.alive)
+        self._num_dead = 0
+        self._num_rows = len(rows)
+
+        if not len(rows):
+            self._rows = rows
+            self._keys = np.empty(0, dtype=np.int64)
+            self._cell_base = self._cell_starts = np.empty(0, dtype=np.int64)
+            self._cell_lo_x = self._cell_hi_x = self._cell_lo_y = self._cell_hi_y = np.empty(0, dtype=np.int64)
+            return
+
+        x = table.pickup_x[rows]
+        y = table.pickup_y[rows]
+        x0, y0 = x.min(), y.min()
+        area = max(int(x.max() - x0 + 1) * int(y.max() - y0 + 1), 1)
+        cell_size = max(1, int(np.ceil(np.sqrt(area * self._orders_per_cell / len(rows)))))
+        num_y = int((y.max() - y0) // cell_size) + 1
+
+        cx = (x - x0) // cell_size
+        cy = (y - y0) // cell_size
+        cells = cx * num_y + cy
+        keys = cells * _KEY_STRIDE - table.pickup_to[rows]
+        permutation = np.argsort(keys, kind='stable')
+        self._rows = rows[permutation]
+        self._keys = keys[permutation]
+
+        occupied = np.unique(cells)
+        self._cell_base = occupied * _KEY_STRIDE
+        self._cell_starts = np.searchsorted(self._keys, self._cell_base - _KEY_STRIDE, side='right')
+        self._cell_lo_x = x0 + (occupied // num_y) * cell_size
+        self._cell_hi_x = self._cell_lo_x + cell_size - 1
+        self._cell_lo_y = y0 + (occupied % num_y) * cell_size
+        self._cell_hi_y = self._cell_lo_y + cell_size - 1
+
+    def remove(self, order_id):
+        """Must be called after the order is removed from the table."""
+        self._num_dead += 1
+        if self._num_dead * 2 > self._num_rows:
+            self._build()
+
+    def query(self, x, y, current_time):
+        """
+        Rows of alive orders whose pickup point lies within the manhattan radius pickup_to - current_time - 10
+        of (x, y), in ascending row order. Every order that a courier can still pick up in time is among them.
+        """
+        if not len(self._cell_base):
+            return self._rows
+
+        lower_bound = (np.maximum(np.maximum(self._cell_lo_x - x, x - self._cell_hi_x), 0) +
+                       np.maximum(np.maximum(self._cell_lo_y - y, y - self._cell_hi_y), 0))
+        ends = np.searchsorted(self._keys, self._cell_base - (current_time + 10 + lower_bound), side='right')
+        lengths = np.maximum(ends - self._cell_starts, 0)
+        total = int(lengths.sum())
+        if not total:
+            return self._rows[:0]
+
+        table = self._table
+        if total * 2 > self._num_rows - self._num_dead:
+            # most of the city is still reachable (early in the day), a contiguous scan beats gathering
+            reachable = (np.abs(table.pickup_x - x) + np.abs(table.pickup_y - y) <=
+                         table.pickup_to - current_time - 10)
+            return np.flatnonzero(reachable & table.alive)
+
+        offsets = np.repeat(self._cell_starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        rows = self._rows[offsets]
+
+        reachable = (np.abs(table.pickup_x[rows] - x) + np.abs(table.pickup_y[rows] - y) <=
+                     table.pickup_to[rows] - current_time - 10)
+        reachable &= table.alive[rows]
+        return np.sort(rows[reachable])
@@ -1,10 +1,14 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
+import argparse
 import json
 import os
 import sys
 
-from solutions.greedy_by_user import GreedyByUser
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from data_wrappers import OrderTable, load_instance  # noqa: E402
 
 
 def main(input_file, output_file):
@@ -13,6 +17,12 @@ def main(input_file, output_file):
     couriers, orders, points = load_data(input_file)
     with open(output_file, 'r') as f:
         output_data = json.load(f)
+    replay_events(output_data, couriers, orders, points, verbose=True)
+    summarize(couriers, orders, points, verbose=True)
+
+
+def replay_events(output_data, couriers, orders, points, verbose=False):
+    """Последовательное выполнение маршрутных листов, меняет состояние couriers и points"""
     for step, event in enumerate(output_data):
         courier_id = event['courier_id']
         action = event['action']
@@ -65,45 +75,238 @@ def main(input_file, output_file):
         courier['time'] = visit_time
         courier['location'] = destination_location
 
-        print('{}. Courier #{} {} order #{} at point #{} at time {}'.format(step, courier_id, action, order_id, point_id, visit_time))
+        if verbose:
+            print('{}. Courier #{} {} order #{} at point #{} at time {}'.format(step, courier_id, action, order_id,
+                                                                                point_id, visit_time))
 
-    print('Routes ok')
+    if verbose:
+        print('Routes ok')
 
+
+def summarize(couriers, orders, points, verbose=False):
+    """Проверка незаконченных заказов и подсчет прибыли по состоянию после replay_events"""
     # Проверяем, что курьеры выполнили все заказы, которые взяли
     # И посчитаем общую стоимость выполненных заказов
     has_unfinished_orders = False
     orders_payment = 0
+    completed = unassigned = unfinished = 0
     for order_id, order in orders.items():
         pickup_point_id = order['pickup_point_id']
         dropoff_point_id = order['dropoff_point_id']
         if 'order_time' in points[dropoff_point_id] and order_id in points[dropoff_point_id]['order_time']:
             orders_payment += order['payment']
-            print('Order #{} completed'.format(order_id))
+            completed += 1
+            if verbose:
+                print('Order #{} completed'.format(order_id))
         elif 'order_time' in points[pickup_point_id] and order_id in points[pickup_point_id]['order_time']:
-            print('Order #{} unassigned'.format(order_id))
+            unassigned += 1
+            if verbose:
+                print('Order #{} unassigned'.format(order_id))
         else:
-            print('Order #{} unfinished'.format(order_id))
+            unfinished += 1
+            if verbose:
+                print('Order #{} unfinished'.format(order_id))
             has_unfinished_orders = True
 
     if has_unfinished_orders:
         raise Exception('Not all started orders are completed')
 
-    print('Orders ok')
+    if verbose:
+        print('Orders ok')
 
     # Считаем общую продолжительность работы курьера в минутах
     work_duration = sum([x['time'] - 360 for x in couriers.values()])
     work_payment = work_duration * 2
     profit = orders_payment - work_payment
 
-    print('Total orders payment: {}'.format(orders_payment))
-    print('Total couriers payment: {}'.format(work_payment))
-    print('Profit: {}'.format(profit))
+    if verbose:
+        print('Total orders payment: {}'.format(orders_payment))
+        print('Total couriers payment: {}'.format(work_payment))
+        print('Profit: {}'.format(profit))
+
+    return {
+        'profit': profit,
+        'orders_payment': orders_payment,
+        'couriers_payment': work_payment,
+        'completed': completed,
+        'unassigned': unassigned,
+        'unfinished': unfinished,
+    }
+
+
+class FastCheckUnsupported(Exception):
+    """План нельзя проверить быстрым способом, нужна последовательная проверка"""
+
+
+ACTIONS = {'pickup': 0, 'dropoff': 1}
+
+
+def check_fast(input_file, output_file):
+    """
+    Проверка без вывода на экран, результат тот же, что у summarize.
+    Маршруты курьеров, которые не заезжают на склады, проверяются независимо друг от друга массивами numpy,
+    маршруты со складами выполняются последовательно через replay_events. Правила те же, что и у main:
+    при любой ошибке план проверяется заново последовательно, чтобы получить ровно ту же ошибку.
+    """
+    with open(output_file, 'r') as f:
+        output_data = json.load(f)
+    return check_plan(input_file, output_data)
+
+
+def check_plan(input_file, output_data):
+    """То же, что check_fast, но план передаётся списком событий, а не файлом"""
+    instance = load_instance(input_file)
+    try:
+        return _check_fast(instance, output_data)
+    except Exception:
+        couriers, orders, points = load_data(input_file)
+        replay_events(output_data, couriers, orders, points)
+        return summarize(couriers, orders, points)
+
+
+def _lookup(sorted_ids, order, ids):
+    """Индексы строк для ids по отсортированному массиву идентификаторов"""
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), max(len(sorted_ids) - 1, 0))
+    if not len(sorted_ids) or np.any(sorted_ids[positions] != ids):
+        raise FastCheckUnsupported()
+    return order[positions]
+
+
+def _instance_records(instance, couriers, orders):
+    """Входные данные в виде словарей для build_state: заданные курьеры и заказы (номера строк) и все склады"""
+    fields = [field for _, field in OrderTable.FIELDS]
+    order_columns = np.stack([getattr(instance.orders, column) for column in OrderTable.COLUMNS])
+    return {
+        'couriers': [dict(zip(('courier_id', 'location_x', 'location_y'), x))
+                     for x in instance.couriers[couriers].tolist()],
+        'depots': [dict(zip(('point_id', 'location_x', 'location_y'), x)) for x in instance.depots.tolist()],
+        'orders': [dict(zip(fields, x)) for x in order_columns[:, orders].T.tolist()],
+    }
+
+
+def _check_fast(instance, output_data):
+    orders = instance.orders
+    order_ids, pickup_point_ids, dropoff_point_ids, payment = (orders.order_ids, orders.pickup_point_ids,
+                                                               orders.dropoff_point_ids, orders.payment)
+    courier_ids = np.asarray(instance.couriers[:, 0])
+    depot_ids = np.asarray(instance.depots[:, 0])
+
+    # Каждая точка заказа принадлежит ровно одному заказу и не является складом
+    all_points = np.concatenate([pickup_point_ids, dropoff_point_ids, depot_ids])
+    order_points = all_points[:2 * len(order_ids)]
+    if (len(np.unique(all_points)) != len(all_points) or len(np.unique(order_ids)) != len(order_ids) or
+            len(np.unique(courier_ids)) != len(courier_ids) or
+            np.any((order_points >= 30001) & (order_points <= 40000))):
+        raise FastCheckUnsupported()
+
+    order_sort = np.argsort(order_ids)
+    courier_sort = np.argsort(courier_ids)
+    events = np.array([[x['courier_id'], ACTIONS[x['action']], x['order_id'], x['point_id']] for x in output_data],
+                      dtype=np.int64).reshape(-1, 4).T
+    event_courier = _lookup(courier_ids[courier_sort], courier_sort, events[0])
+    action = events[1]
+    event_order = _lookup(order_ids[order_sort], order_sort, events[2])
+    event_point = events[3]
+
+    plain = np.where(action == 0, event_point == pickup_point_ids[event_order],
+                     event_point == dropoff_point_ids[event_order])
+    depot_couriers = np.unique(event_courier[~plain])
+    depot_events = np.isin(event_courier, depot_couriers)
+    depot_orders = np.unique(event_order[depot_events])
+    if np.any(np.isin(event_order[~depot_events], depot_orders)):
+        raise FastCheckUnsupported()
+
+    # Курьеры со складами: последовательная проверка на состоянии только из их заказов и складов
+    depot_summary = {'orders_payment': 0, 'couriers_payment': 0, 'completed': 0}
+    if len(depot_couriers):
+        couriers_state, orders_state, points_state = build_state(_instance_records(instance, depot_couriers,
+                                                                                   depot_orders))
+        replay_events([output_data[idx] for idx in np.flatnonzero(depot_events).tolist()],
+                      couriers_state, orders_state, points_state)
+        depot_summary = summarize(couriers_state, orders_state, points_state)
+
+    # Учет отправлений: каждый заказ забран и сдан не более одного раза, одним курьером и в правильном порядке
+    plain_events = np.flatnonzero(~depot_events)
+    plain_events = plain_events[np.argsort(event_courier[plain_events], kind='stable')]
+    is_pickup = action[plain_events] == 0
+    picked = event_order[plain_events[is_pickup]]
+    dropped = event_order[plain_events[~is_pickup]]
+    if len(np.unique(picked)) != len(picked) or len(np.unique(dropped)) != len(dropped):
+        raise FastCheckUnsupported()
+    if len(picked) != len(dropped) or np.any(np.sort(picked) != np.sort(dropped)):
+        raise FastCheckUnsupported()
+    pickup_event = np.empty(len(order_ids), dtype=np.int64)
+    pickup_event[picked] = plain_events[is_pickup]
+    pickup_event = pickup_event[dropped]
+    dropoff_event = plain_events[~is_pickup]
+    if np.any(event_courier[pickup_event] != event_courier[dropoff_event]) or np.any(pickup_event > dropoff_event):
+        raise FastCheckUnsupported()
+
+    couriers_payment = depot_summary['couriers_payment']
+    if len(plain_events):
+        final_times = _plain_route_times(event_courier[plain_events], is_pickup, event_order[plain_events], orders,
+                                         instance.couriers)
+        couriers_payment += 2 * int(np.sum(final_times - 360))
+
+    orders_payment = int(payment[dropped].sum()) + depot_summary['orders_payment']
+    completed = len(dropped) + depot_summary['completed']
+    return {
+        'profit': orders_payment - couriers_payment,
+        'orders_payment': orders_payment,
+        'couriers_payment': couriers_payment,
+        'completed': completed,
+        'unassigned': len(order_ids) - completed,
+        'unfinished': 0,
+    }
+
+
+def _plain_route_times(event_courier, is_pickup, event_order, orders, courier_columns):
+    """
+    Время окончания маршрутов курьеров без складов, события сгруппированы по курьерам.
+    Шаг k считается для всех курьеров сразу одной операцией numpy.
+    """
+    route_couriers, starts, lengths = np.unique(event_courier, return_index=True, return_counts=True)
+    shape = (len(route_couriers), int(lengths.max()))
+    rows = np.repeat(np.arange(len(route_couriers)), lengths)
+    columns = np.arange(len(event_courier)) - np.repeat(starts, lengths)
+
+    def scatter(pickup_values, dropoff_values):
+        matrix = np.zeros(shape, dtype=np.int64)
+        matrix[rows, columns] = np.where(is_pickup, pickup_values[event_order], dropoff_values[event_order])
+        return matrix
+
+    point_x = scatter(orders.pickup_x, orders.dropoff_x)
+    point_y = scatter(orders.pickup_y, orders.dropoff_y)
+    window_from = scatter(orders.pickup_from, orders.dropoff_from)
+    window_to = scatter(orders.pickup_to, orders.dropoff_to)
+
+    location_x = np.array(courier_columns[route_couriers, 1], dtype=np.int64)
+    location_y = np.array(courier_columns[route_couriers, 2], dtype=np.int64)
+    current_time = np.full(len(route_couriers), 360, dtype=np.int64)
+
+    for step in range(shape[1]):
+        active = step < lengths
+        visit_time = current_time + 10 + np.abs(location_x - point_x[:, step]) + np.abs(location_y - point_y[:, step])
+        # Опоздание только если курьер не ждет начала интервала, как в replay_events
+        if np.any(active & (visit_time >= window_from[:, step]) & (visit_time > window_to[:, step])):
+            raise FastCheckUnsupported()
+        visit_time = np.maximum(visit_time, window_from[:, step])
+
+        current_time = np.where(active, visit_time, current_time)
+        location_x = np.where(active, point_x[:, step], location_x)
+        location_y = np.where(active, point_y[:, step], location_y)
+    return current_time
 
 
 def load_data(file):
     """Загрузка входных данных из файла"""
     with open(file, 'r') as f:
         input_data = json.load(f)
+    return build_state(input_data)
+
+
+def build_state(input_data):
+    """Начальное состояние курьеров, заказов и точек по входным данным"""
     couriers = {}
     orders = {}
     points = {}
@@ -143,7 +346,27 @@ def is_depot_point(point_id):
     return 30001 <= point_id <= 40000
 
 
-if __name__ == '__main__':
+if __name__ == '__main__' and len(sys.argv) > 1:
+    parser = argparse.ArgumentParser(description='Проверка решения, по умолчанию быстрая и с итогом в JSON')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file')
+    parser.add_argument('--verbose', action='store_true', help='пошаговый вывод, как в main')
+    args = parser.parse_args()
+
+    if args.verbose:
+        main(args.input_file, args.output_file)
+        sys.exit(0)
+
+    try:
+        summary = dict(check_fast(args.input_file, args.output_file), ok=True)
+    except Exception as e:
+        summary = {'ok': False, 'error': str(e)}
+    print(json.dumps(summary))
+    sys.exit(0 if summary['ok'] else 1)
+
+elif __name__ == '__main__':
+    from solutions.greedy_by_user import GreedyByUser
+
     example_dir = os.path.dirname(os.path.abspath(__file__)) + '/../example'
     input_file = example_dir + '/contest_input.json'
     output_file = example_dir + '/contest_output_greedy_by_user_2.json'
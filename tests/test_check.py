@@ -0,0 +1,148 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from data_wrappers import load_instance  # noqa: E402
+from solutions.depot_relay import DepotRelay  # noqa: E402
+from solutions.greedy_by_user import GreedyByUser  # noqa: E402
+from src.check import _check_fast, check_plan, is_depot_point, load_data, replay_events, summarize  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONTEST_INPUT = os.path.join(ROOT, 'example', 'contest_input.json')
+
+# shipped plans and the inputs they were made for
+SHIPPED = [
+    ('example/contest_input.json', 'example/contest_output.json'),
+    ('example/contest_input.json', 'example/contest_output_greedy_by_user.json'),
+    ('example/contest_input.json', 'example/contest_output_greedy_by_user_2.json'),
+    ('example/input.json', 'example/output.json'),
+    ('example/input.json', 'data/simple_solution.json'),
+    ('example/simple_input.json', 'data/simple_solution.json'),
+    ('data/hard_input.json', 'example/output.json'),
+    ('data/readme_input.json', 'data/readme_solution_1.json'),
+]
+SHIPPED_LATE = [
+    ('data/readme_input.json', 'data/readme_solution_2.json'),
+    ('example/contest_input.json', 'data/simple_solution.json'),
+]
+
+
+def _reference(data_path, plan):
+    couriers, orders, points = load_data(data_path)
+    replay_events(plan, couriers, orders, points)
+    return summarize(couriers, orders, points)
+
+
+def _assert_same(data_path, plan):
+    expected = _reference(data_path, plan)
+    assert _check_fast(load_instance(data_path), plan) == expected
+    assert check_plan(data_path, plan) == expected
+
+
+def _assert_rejected(data_path, plan):
+    with pytest.raises(Exception) as expected:
+        _reference(data_path, plan)
+    with pytest.raises(Exception):
+        _check_fast(load_instance(data_path), plan)
+    with pytest.raises(Exception, match=str(expected.value)):
+        check_plan(data_path, plan)
+
+
+def _load(path):
+    with open(os.path.join(ROOT, path)) as infile:
+        return json.load(infile)
+
+
+def _most_carried(plan):
+    carried, most = {}, 0
+    for event in plan:
+        goods = carried.setdefault(event['courier_id'], set())
+        if event['action'] == 'pickup':
+            goods.add(event['order_id'])
+        else:
+            goods.discard(event['order_id'])
+        most = max(most, len(goods))
+    return most
+
+
+@pytest.mark.parametrize('data_path, plan_path', SHIPPED)
+def test_shipped_plans(data_path, plan_path):
+    _assert_same(os.path.join(ROOT, data_path), _load(plan_path))
+
+
+@pytest.mark.parametrize('data_path, plan_path', SHIPPED_LATE)
+def test_shipped_late_plans(data_path, plan_path):
+    _assert_rejected(os.path.join(ROOT, data_path), _load(plan_path))
+
+
+def test_plan_with_depot_legs():
+    plan = DepotRelay(CONTEST_INPUT).solve()
+    assert any(is_depot_point(event['point_id']) for event in plan)
+    _assert_same(CONTEST_INPUT, plan)
+
+
+def test_plan_carrying_several_orders():
+    plan = GreedyByUser(CONTEST_INPUT, bundling=True).solve()
+    assert _most_carried(plan) > 1
+    _assert_same(CONTEST_INPUT, plan)
+
+
+def _order(order_id, pickup, pickup_window, dropoff, dropoff_window, payment=500):
+    return {'order_id': order_id, 'payment': payment,
+            'pickup_point_id': order_id + 30000, 'pickup_location_x': pickup[0], 'pickup_location_y': pickup[1],
+            'pickup_from': pickup_window[0], 'pickup_to': pickup_window[1],
+            'dropoff_point_id': order_id + 50000, 'dropoff_location_x': dropoff[0], 'dropoff_location_y': dropoff[1],
+            'dropoff_from': dropoff_window[0], 'dropoff_to': dropoff_window[1]}
+
+
+@pytest.fixture
+def small_input(tmp_path):
+    instance = {
+        'couriers': [{'courier_id': 1, 'location_x': 0, 'location_y': 0},
+                     {'courier_id': 2, 'location_x': 0, 'location_y': 0}],
+        'depots': [{'point_id': 30001, 'location_x': 50, 'location_y': 0}],
+        'orders': [_order(10001, (10, 0), (360, 500), (20, 0), (360, 600)),
+                   # the dropoff window opens late, a courier waits for it
+                   _order(10002, (15, 0), (360, 500), (30, 0), (500, 700)),
+                   # 110 minutes away from the couriers: too late for this window
+                   _order(10003, (100, 0), (360, 380), (100, 10), (360, 1000)),
+                   # ... and just in time for this one
+                   _order(10004, (100, 0), (360, 470), (100, 10), (360, 1000))],
+    }
+    path = str(tmp_path / 'input.json')
+    with open(path, 'w') as outfile:
+        json.dump(instance, outfile)
+    return path
+
+
+def _events(*steps):
+    return [{'courier_id': courier_id, 'action': action, 'order_id': order_id,
+             'point_id': order_id + (30000 if action == 'pickup' else 50000) if point_id is None else point_id}
+            for courier_id, action, order_id, point_id in steps]
+
+
+@pytest.mark.parametrize('plan', [
+    # two orders carried at once, the second dropoff waits for its window
+    _events((1, 'pickup', 10001, None), (1, 'pickup', 10002, None), (1, 'dropoff', 10001, None),
+            (1, 'dropoff', 10002, None)),
+    # arriving exactly at pickup_to is in time
+    _events((2, 'pickup', 10004, None), (2, 'dropoff', 10004, None), (1, 'pickup', 10002, None),
+            (1, 'dropoff', 10002, None)),
+    # a relay through the depot, the second courier waits there for the order
+    _events((2, 'pickup', 10001, None), (2, 'dropoff', 10001, 30001), (1, 'pickup', 10001, 30001),
+            (1, 'dropoff', 10001, None), (1, 'pickup', 10002, None), (1, 'dropoff', 10002, None)),
+])
+def test_small_plans(small_input, plan):
+    _assert_same(small_input, plan)
+
+
+@pytest.mark.parametrize('plan', [
+    _events((1, 'pickup', 10003, None), (1, 'dropoff', 10003, None)),
+    _events((1, 'pickup', 10001, None), (1, 'pickup', 10004, None), (1, 'dropoff', 10001, None),
+            (1, 'dropoff', 10004, None)),
+])
+def test_late_small_plans(small_input, plan):
+    _assert_rejected(small_input, plan)
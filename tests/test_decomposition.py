@@ -0,0 +1,32 @@
+import contextlib
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from solutions.decomposition import decomposed_solve  # noqa: E402
+from solutions.depot_relay import DepotRelay  # noqa: E402
+from solutions.greedy_by_user import GreedyByUser  # noqa: E402
+from src.check import check_plan  # noqa: E402
+
+CONTEST_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'contest_input.json')
+
+
+def _depot_ids(data_path):
+    with open(data_path) as infile:
+        return {depot['point_id'] for depot in json.load(infile)['depots']}
+
+
+@pytest.mark.parametrize('solver', [GreedyByUser, DepotRelay])
+def test_decomposed_plan_passes_check(solver):
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = decomposed_solve(CONTEST_INPUT, solver=solver, num_regions=4, jobs=1)
+        summary = check_plan(CONTEST_INPUT, result.plan)
+    assert summary['profit'] == result.profit
+    assert result.profit == sum(region.profit for region in result.regions) + result.merge_profit
+    if solver is DepotRelay:
+        # the regions relay orders through depots, so their routes are not plain pickup-dropoff pairs
+        assert any(event['point_id'] in _depot_ids(CONTEST_INPUT) for event in result.plan)
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from solutions.dispatch_service import DispatchService  # noqa: E402
+
+CONTEST_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'contest_input.json')
+
+
+async def _request(port, path, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode()
+    writer.write('POST {} HTTP/1.1\r\nContent-Length: {}\r\n\r\n'.format(path, len(payload)).encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, answer = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(answer)
+
+
+def _serve(*requests):
+    """(status, answer) of every request (path, body), all of them sent at once to a service in this process."""
+    async def run():
+        service = DispatchService(CONTEST_INPUT, jobs=1)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.wait_for(asyncio.gather(*(_request(port, path, body) for path, body in requests)),
+                                          timeout=10)
+        finally:
+            server.close()
+            service.close()
+    return asyncio.run(run())
+
+
+def _courier_id():
+    with open(CONTEST_INPUT) as infile:
+        return json.load(infile)['couriers'][0]['courier_id']
+
+
+def test_malformed_next_order_does_not_stall_the_batch():
+    courier_id = _courier_id()
+    bad_exclude, bad_time, good = _serve(('/next_order', {'courier_id': courier_id, 'exclude': 5}),
+                                         ('/next_order', {'courier_id': courier_id, 'time': 'noon'}),
+                                         ('/next_order', {'courier_id': courier_id}))
+    assert bad_exclude[0] == 400
+    assert bad_time[0] == 400
+    assert good[0] == 200 and 'order_id' in good[1]
+
+
+def test_excluded_order_is_not_offered():
+    courier_id = _courier_id()
+    (_, first), = _serve(('/next_order', {'courier_id': courier_id}))
+    (status, second), = _serve(('/next_order', {'courier_id': courier_id, 'exclude': [first['order_id']]}))
+    assert status == 200
+    assert second['order_id'] != first['order_id']
+
+
+def test_unknown_solver_option_is_a_bad_request():
+    (status, answer), = _serve(('/plan', {'solver': 'GreedyByUser', 'options': {'beam_width': 3}}))
+    assert status == 400
+    assert 'beam_width' in answer['error']
+
+
+def test_paths_and_unbounded_time_limits_are_not_options():
+    (path_status, path_answer), (time_status, _), (type_status, _) = _serve(
+        ('/plan', {'solver': 'HungarianSearch', 'options': {'checkpoint_path': '/tmp/plan.jsonl'}}),
+        ('/plan', {'solver': 'LocalSearch', 'options': {'time_limit': 1e9}}),
+        ('/plan', {'solver': 'GreedyByUser', 'options': {'bundling': 'yes'}}))
+    assert path_status == 400 and 'checkpoint_path' in path_answer['error']
+    assert time_status == 400
+    assert type_status == 400
+
+
+def test_boolean_courier_id_is_rejected():
+    (status, _), = _serve(('/next_order', {'courier_id': True}))
+    assert status == 400
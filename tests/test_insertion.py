@@ -0,0 +1,85 @@
+import copy
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from data_wrappers import OrderTable  # noqa: E402
+from solutions.insertion import StopRoute  # noqa: E402
+
+
+def _random_table(rng, num_orders):
+    columns = {column: [] for column in OrderTable.COLUMNS}
+    for row in range(num_orders):
+        pickup_from = rng.randint(360, 600)
+        dropoff_from = rng.randint(360, 700)
+        values = {
+            'order_ids': 10001 + row, 'pickup_point_ids': 40001 + row, 'dropoff_point_ids': 60001 + row,
+            'pickup_x': rng.randint(0, 60), 'pickup_y': rng.randint(0, 60),
+            'dropoff_x': rng.randint(0, 60), 'dropoff_y': rng.randint(0, 60),
+            'pickup_from': pickup_from, 'pickup_to': pickup_from + rng.randint(0, 200),
+            'dropoff_from': dropoff_from, 'dropoff_to': dropoff_from + rng.randint(0, 300),
+            'payment': rng.randint(50, 400),
+        }
+        for column in OrderTable.COLUMNS:
+            columns[column].append(values[column])
+    return OrderTable.from_columns({column: np.array(values, dtype=np.int64) for column, values in columns.items()})
+
+
+def _replay_end(route):
+    """Time the route ends at, visiting the stops as the checker does, None if a stop is late."""
+    now = route.opens[0]
+    for k in range(1, len(route.x)):
+        arrives = now + 10 + abs(route.x[k] - route.x[k - 1]) + abs(route.y[k] - route.y[k - 1])
+        if arrives > route.closes[k]:
+            return None
+        now = max(arrives, route.opens[k])
+    return now
+
+
+def _best_by_replay(route, row, first):
+    """Best (gain, i, j) over every insertion, each replayed from scratch."""
+    end = _replay_end(route)
+    best = None
+    for i in range(max(first, 1), len(route) + 2):
+        for j in range(i, len(route) + 2):
+            changed = copy.deepcopy(route)
+            changed.insert(row, i, j)
+            new_end = _replay_end(changed)
+            if new_end is None:
+                continue
+            gain = int(route._table.payment[row]) - 2 * (new_end - end)
+            if best is None or gain > best[0]:
+                best = (gain, i, j)
+    return best
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_best_insertion_matches_replay(seed):
+    rng = random.Random(seed)
+    table = _random_table(rng, 12)
+    route = StopRoute(table, rng.randint(0, 60), rng.randint(0, 60), 360 + rng.randint(0, 60))
+    rows = list(range(len(table)))
+    rng.shuffle(rows)
+    # a route of a few orders, some of them carried at once
+    for row in rows[:6]:
+        move = route.best_insertion(row)
+        if move is not None:
+            route.insert(row, move[1], move[2])
+    assert _replay_end(route) == route.end_time
+
+    for row in rows[6:]:
+        first = rng.randint(1, len(route) + 1)
+        expected = _best_by_replay(route, row, first)
+        actual = route.best_insertion(row, first)
+        if expected is None:
+            assert actual is None
+        else:
+            # ties may pick another position, the gain and the feasibility of the choice must agree
+            assert actual is not None and actual[0] == expected[0]
+            changed = copy.deepcopy(route)
+            changed.insert(row, actual[1], actual[2])
+            assert _replay_end(changed) is not None
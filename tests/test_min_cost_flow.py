@@ -0,0 +1,66 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from solutions.min_cost_flow import min_cost_flow  # noqa: E402
+
+
+def _random_dag(rng, num_nodes):
+    """Edges (tail, head, capacity, cost) between nodes numbered in topological order, parallel edges included."""
+    edges = []
+    for _ in range(rng.randint(num_nodes, 3 * num_nodes)):
+        tail, head = sorted(rng.sample(range(num_nodes), 2))
+        edges.append((tail, head, rng.randint(1, 3), rng.randint(-10, 10)))
+    return edges
+
+
+def _bellman_ford_cost(num_nodes, edges, source, sink):
+    """Cost of the min cost flow of any amount: augments along Bellman-Ford shortest paths while they are negative."""
+    # arc 2e is edge e, 2e + 1 its reverse
+    arcs, residual = [], []
+    for tail, head, capacity, cost in edges:
+        arcs += [(tail, head, cost), (head, tail, -cost)]
+        residual += [capacity, 0]
+    total = 0
+    while True:
+        distance = [None] * num_nodes
+        parent = [None] * num_nodes
+        distance[source] = 0
+        for _ in range(num_nodes - 1):
+            for arc, (tail, head, cost) in enumerate(arcs):
+                if residual[arc] and distance[tail] is not None and (distance[head] is None or
+                                                                     distance[tail] + cost < distance[head]):
+                    distance[head] = distance[tail] + cost
+                    parent[head] = arc
+        if distance[sink] is None or distance[sink] >= 0:
+            return total
+        path, node = [], sink
+        while node != source:
+            path.append(parent[node])
+            node = arcs[parent[node]][0]
+        amount = min(residual[arc] for arc in path)
+        for arc in path:
+            residual[arc] -= amount
+            residual[arc ^ 1] += amount
+        total += amount * distance[sink]
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_flow_cost_matches_bellman_ford(seed):
+    rng = random.Random(seed)
+    num_nodes = rng.randint(2, 9)
+    edges = _random_dag(rng, num_nodes)
+    tails, heads, capacities, costs = (list(column) for column in zip(*edges))
+    source, sink = 0, num_nodes - 1
+    flows = min_cost_flow(num_nodes, tails, heads, capacities, costs, source, sink, list(range(num_nodes)))
+
+    assert all(0 <= flow <= capacity for flow, capacity in zip(flows, capacities))
+    balance = [0] * num_nodes
+    for tail, head, flow in zip(tails, heads, flows):
+        balance[tail] -= flow
+        balance[head] += flow
+    assert all(value == 0 for node, value in enumerate(balance) if node not in (source, sink))
+    assert sum(flow * cost for flow, cost in zip(flows, costs)) == _bellman_ford_cost(num_nodes, edges, source, sink)
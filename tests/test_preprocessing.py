@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from solutions.core import solve_instance  # noqa: E402
+from solutions.preprocessing import reduce_instance  # noqa: E402
+
+CONTEST_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'contest_input.json')
+
+
+def test_reduced_plan_is_checked_against_the_input():
+    reduction = reduce_instance(CONTEST_INPUT)
+    assert len(reduction.order_ids) < reduction.input_orders
+    # status ok: the plan, restored to the ids of the input, passes check_plan on the input
+    result = solve_instance(CONTEST_INPUT, 'GreedyByUser', reduce=True)
+    assert result.status == 'ok' and result.profit > 0
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from solutions.core import solve_instance  # noqa: E402
+from solutions.result_cache import ResultCache  # noqa: E402
+
+CONTEST_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'contest_input.json')
+
+
+def _entries(root):
+    return sorted(name for directory in os.listdir(root) for name in os.listdir(os.path.join(root, directory)))
+
+
+def test_eviction_keeps_to_max_bytes_and_skips_temporary_files(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=3000)
+    cache.arrays(CONTEST_INPUT, 'first', {}, lambda: {'values': np.zeros(200)})
+    # a write of another process, in flight
+    directory = os.path.join(str(tmp_path), cache.instance_key(CONTEST_INPUT))
+    with open(os.path.join(directory, 'plan-other.jsonl.1.tmp'), 'wb') as f:
+        f.write(b'x' * 10000)
+    for name in ('second', 'third'):
+        cache.arrays(CONTEST_INPUT, name, {}, lambda: {'values': np.zeros(200)})
+
+    entries = _entries(str(tmp_path))
+    assert 'plan-other.jsonl.1.tmp' in entries
+    assert not any(name.startswith('first-') for name in entries)
+    assert any(name.startswith('third-') for name in entries)
+
+
+def test_solve_instance_reuses_cached_plans(tmp_path):
+    first = solve_instance(CONTEST_INPUT, 'GreedyByUser', cache_dir=str(tmp_path))
+    stored = _entries(str(tmp_path))
+    second = solve_instance(CONTEST_INPUT, 'GreedyByUser', cache_dir=str(tmp_path))
+    assert first.status == second.status == 'ok'
+    assert second.profit == first.profit
+    assert _entries(str(tmp_path)) == stored
+
+    # GreedyByUser draws from the random module, so the seed is part of the key although it takes no seed
+    solve_instance(CONTEST_INPUT, 'GreedyByUser', seed=1, cache_dir=str(tmp_path))
+    assert len(_entries(str(tmp_path))) == len(stored) + 1
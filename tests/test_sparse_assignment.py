@@ -0,0 +1,54 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from solutions.sparse_assignment import max_revenue_assignment, top_k_profitable  # noqa: E402
+
+
+def _random_candidates(rng, num_rows, num_columns):
+    candidates = []
+    for _ in range(num_rows):
+        columns = sorted(rng.sample(range(num_columns), rng.randint(0, num_columns)))
+        candidates.append((np.array(columns, dtype=np.int64),
+                           np.array([rng.randint(1, 20) for _ in columns], dtype=np.int64)))
+    return candidates
+
+
+def _best_total(candidates, row=0, taken=frozenset()):
+    """Exhaustive maximum: every row either stays unassigned or takes one of its free columns."""
+    if row == len(candidates):
+        return 0
+    best = _best_total(candidates, row + 1, taken)
+    for column, revenue in zip(*candidates[row]):
+        if column not in taken:
+            best = max(best, revenue + _best_total(candidates, row + 1, taken | {column}))
+    return best
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_assignment_is_maximum(seed):
+    rng = random.Random(seed)
+    candidates = _random_candidates(rng, rng.randint(1, 6), rng.randint(1, 6))
+    pairs = max_revenue_assignment(candidates)
+
+    rows = [row for row, _ in pairs]
+    columns = [column for _, column in pairs]
+    assert len(set(rows)) == len(rows) and len(set(columns)) == len(columns)
+    total = 0
+    for row, column in pairs:
+        edges = dict(zip(*candidates[row]))
+        assert column in edges
+        total += edges[column]
+    assert total == _best_total(candidates)
+
+
+def test_top_k_keeps_the_largest_positive_revenues():
+    revenues = np.array([[5, -np.inf, 7, 0, 3, 9], [-1, -2, -np.inf, 0, 0, 0]])
+    (columns, kept), (no_columns, _) = top_k_profitable(revenues, 2)
+    assert sorted(columns.tolist()) == [2, 5]
+    assert sorted(kept.tolist()) == [7, 9]
+    assert not len(no_columns)